@@ -0,0 +1,202 @@
+'''
+bindings construction from an extracted sheet (DataFrame): the per-row
+iterrows loop of excelExtractor_bindExport.py compared with the column-wise
+bindingsBuilder.BindingsBuilder, for synthetic sheets of a PNP like layout
+
+The row loop is quadratic for uniqueOnly columns with many distinct values
+(list membership tests), so it is only run on the first --legacy-rows rows;
+both results are checked for equality on that slice. The builder is also
+timed with typed literal conversion (typedLiterals.LiteralConverter), and
+the bindings files of a typed column with an empty cell are checked.
+
+usage:
+    python bench_bindings.py [--rows 100000] [--legacy-rows 2000]
+                             [--distinct 5000] [-r repeat]
+'''
+
+import sys
+import os
+import time
+import getopt
+import urllib
+
+import pandas
+import six
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "prov_templates", "provtemplates"))
+
+import prov.model as prov
+import provconv
+import bindingsBuilder
+import bindingsConverter
+import typedLiterals
+
+NS_PREFIX = "ex"
+NS_URI = "http://example.com#"
+
+# bindmap of excelExtractor_bindExport.py
+BINDMAP = {
+    "Anmerkung": {"varname": "comment", "type": "attr", "val": "literal", "uniqueOnly": False},
+    "Dendrometer": {"varname": "dendrometer", "type": "entity", "val": "iri", "uniqueOnly": False},
+    "[cm]": {"varname": "readValue", "type": "attr", "val": "float", "uniqueOnly": False},
+    "date": {"varname": "endDate", "type": "attr", "val": "datetime", "uniqueOnly": False},
+    "person": {"varname": "readingAgent", "type": "entity", "val": "iri", "uniqueOnly": True},
+    "tree": {"varname": "tree", "type": "entity", "val": "iri", "uniqueOnly": True},
+}
+
+
+def make_sheet(rows, distinct):
+    '''
+    synthetic extracted sheet: tree ids repeat after `distinct` rows
+    '''
+    return pandas.DataFrame({
+        "Anmerkung": [u"nein"] * rows,
+        "Dendrometer": [u"%d" % (i % 97) for i in range(rows)],
+        "[cm]": [u"%d.%d" % (i % 60, i % 10) for i in range(rows)],
+        "date": [u"2018-03-21T00:00:00"] * rows,
+        "person": [u"Gro\xdf %d" % (i % 3) for i in range(rows)],
+        "tree": [u"50%05d neu" % (i % distinct) for i in range(rows)],
+    })
+
+
+def legacy_bindings(data, bindmap):
+    '''
+    the iterrows loop of excelExtractor_bindExport.py (before BindingsBuilder)
+    '''
+    bind_dict = dict()
+    bindfile_dict = dict()
+    for index, row in data.iterrows():
+        for col in data.columns.values:
+            if col in bindmap:
+                outval = row[col]
+                if bindmap[col]["val"] == "float":
+                    outval = float(outval)
+                if bindmap[col]["val"] == "iri":
+                    outval = prov.QualifiedName(prov.Namespace(NS_PREFIX, NS_URI),
+                                                urllib.quote(str(outval.encode('utf8', 'replace'))))
+                ID = "var:" + bindmap[col]["varname"]
+                if ID not in bind_dict:
+                    bind_dict[ID] = outval
+                else:
+                    if not isinstance(bind_dict[ID], list):
+                        bind_dict[ID] = [bind_dict[ID]]
+                    if not bindmap[col]["uniqueOnly"] or outval not in bind_dict[ID]:
+                        bind_dict[ID].append(outval)
+                if ID not in bindfile_dict:
+                    bindfile_dict[ID] = {"value": [], "type": bindmap[col]["type"]}
+                if not bindmap[col]["uniqueOnly"] or outval not in bindfile_dict[ID]["value"]:
+                    bindfile_dict[ID]["value"].append(outval)
+    return bind_dict, bindfile_dict
+
+
+def column_bindings(data, bindmap):
+    builder = bindingsBuilder.BindingsBuilder(bindmap, NS_PREFIX, NS_URI)
+    builder.add_frame(data)
+    return builder.bind_dict(), builder.bindfile_dict()
+
+
+def typed_bindings(data, bindmap):
+    literals = typedLiterals.LiteralConverter("Europe/Vienna", prov.Namespace(NS_PREFIX, NS_URI))
+    builder = bindingsBuilder.BindingsBuilder(bindmap, NS_PREFIX, NS_URI, literals=literals)
+    builder.add_frame(data)
+    return builder.bind_dict(), builder.bindfile_dict()
+
+
+def empty_cells_check():
+    '''
+    typed bindings of a column with an empty cell: both bindings file
+    writers keep one value per row ("" for the empty cell), the bindings
+    document reads back with provconv.read_binding
+    '''
+    bindmap = {"count": {"varname": "count", "type": "attr", "val": "int", "uniqueOnly": False}}
+    literals = typedLiterals.LiteralConverter(None, prov.Namespace(NS_PREFIX, NS_URI))
+    builder = bindingsBuilder.BindingsBuilder(bindmap, NS_PREFIX, NS_URI, literals=literals)
+    builder.add_frame(pandas.DataFrame({"count": [1, None, 3]}, dtype=object))
+    bindfile_dict = builder.bindfile_dict()
+    namespaces = [prov.Namespace(NS_PREFIX, NS_URI)]
+    v3 = bindingsConverter.make_binding_v3(bindfile_dict, namespaces)["var"]["count"]
+    doc = bindingsConverter.make_binding_doc(bindfile_dict, namespaces)
+    values = provconv.read_binding(doc)["var:count"]
+    return v3[1] == {"@value": ""} and len(v3) == 3 and values == [1, u"", 3]
+
+
+def mixed_types_check():
+    '''
+    equal values of different types (True == 1 == 1.0) convert by their own
+    type, in whatever order they are first seen
+    '''
+    ns = prov.Namespace(NS_PREFIX, NS_URI)
+    ok = True
+    for val_type, expected in (("literal", [u"True", u"1.0", u"1"]),
+                               ("iri", [u"True", u"1.0", u"1"])):
+        for order in ([0, 1, 2], [2, 1, 0]):
+            values = [[True, 1.0, 1][i] for i in order]
+            converted = typedLiterals.LiteralConverter(None, ns).convert(val_type, values)
+            texts = [six.text_type(c.value if val_type == "literal" else c.localpart)
+                     for c in converted]
+            ok = ok and texts == [expected[i] for i in order]
+    return ok
+
+
+def best_of(repeat, fnc, *args):
+    times = []
+    res = None
+    for i in range(repeat):
+        t0 = time.time()
+        res = fnc(*args)
+        times.append(time.time() - t0)
+    return min(times), res
+
+
+def run(rows, legacy_rows, distinct, repeat):
+    data = make_sheet(rows, distinct)
+    head = data.iloc[:legacy_rows]
+
+    t_legacy, res_legacy = best_of(1, legacy_bindings, head, BINDMAP)
+    t_head, res_head = best_of(repeat, column_bindings, head, BINDMAP)
+    t_full, res_full = best_of(repeat, column_bindings, data, BINDMAP)
+    t_typed, res_typed = best_of(repeat, typed_bindings, data, BINDMAP)
+
+    print("%-24s %8s %10s %12s" % ("", "rows", "seconds", "rows/s"))
+    print("%-24s %8d %10.4f %12.0f" % ("iterrows loop", len(head), t_legacy, len(head) / t_legacy))
+    print("%-24s %8d %10.4f %12.0f" % ("BindingsBuilder", len(head), t_head, len(head) / t_head))
+    print("%-24s %8d %10.4f %12.0f" % ("BindingsBuilder", rows, t_full, rows / t_full))
+    print("%-24s %8d %10.4f %12.0f" % ("BindingsBuilder typed", rows, t_typed, rows / t_typed))
+    print("same result on %d rows: %s" % (len(head), res_legacy == res_head))
+    empty_ok = empty_cells_check()
+    print("empty cells in bindings files: %s" % ("ok" if empty_ok else "FAILED"))
+    mixed_ok = mixed_types_check()
+    print("equal values of mixed types: %s" % ("ok" if mixed_ok else "FAILED"))
+    return res_legacy == res_head and empty_ok and mixed_ok
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hr:", ["help", "repeat=", "rows=", "legacy-rows=",
+                                                 "distinct="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        print(__doc__)
+        return 2
+    repeat = 3
+    rows = 100000
+    legacy_rows = 2000
+    distinct = 5000
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(__doc__)
+            return 0
+        elif o in ("-r", "--repeat"):
+            repeat = int(a)
+        elif o == "--rows":
+            rows = int(a)
+        elif o == "--legacy-rows":
+            legacy_rows = int(a)
+        elif o == "--distinct":
+            distinct = int(a)
+    return 0 if run(rows, min(rows, legacy_rows), distinct, repeat) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
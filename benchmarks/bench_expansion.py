@@ -0,0 +1,287 @@
+'''
+benchmark suite for PROV template expansion
+
+measures throughput and peak memory of
+    - provconv.instantiate_template (in-process, one fresh worker per case)
+    - expandTemplate.py (as a subprocess, like it is used in workflows)
+for synthetic templates/bindings generated by synthetic.py
+
+usage:
+    python bench_expansion.py [-r repeat] [-s baseline.json] [-c baseline.json]
+                              [--vars 4,8] [--depth 0,1] [--values 2,4]
+                              [--bundles 1] [--arity 2,3]
+                              [--threshold 0.2] [--no-script]
+
+    -s/--save      write the results as JSON baseline
+    -c/--compare   compare the results with a stored baseline; exits with
+                   status 1 if a case got slower (or bigger) than threshold
+
+without any parameter lists the default suite (DEFAULT_CASES) is run.
+'''
+
+import sys
+import os
+import copy
+import time
+import json
+import getopt
+import shutil
+import platform
+import tempfile
+import resource
+import itertools
+import subprocess
+import multiprocessing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROVTEMPLATES = os.path.join(HERE, "..", "prov_templates", "provtemplates")
+sys.path.insert(0, PROVTEMPLATES)
+
+import provconv
+import prov
+import synthetic
+
+# (num_vars, link_depth, num_values, num_bundles, arity)
+DEFAULT_CASES = [
+    (4, 0, 2, 1, 2),
+    (8, 0, 4, 1, 2),
+    (8, 1, 4, 1, 2),
+    (8, 3, 8, 1, 2),
+    (8, 1, 4, 1, 3),
+    (16, 3, 8, 2, 2),
+    (16, 7, 16, 1, 3),
+    (32, 3, 4, 4, 2),
+    (64, 7, 16, 2, 2),
+    (64, 7, 16, 2, 3),
+]
+
+DEFAULT_THRESHOLD = 0.2
+
+
+class Muted(object):
+    '''
+    context manager swallowing stdout (provconv prints while expanding)
+    '''
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def count_records(doc):
+    return len(doc.records) + sum(len(b.records) for b in doc.bundles)
+
+
+def _instantiate_worker(params, repeat):
+    '''
+    runs in a fresh process: ru_maxrss is monotonic, so the growth over the
+    value at worker start is the peak memory used by the expansion
+    '''
+    template, bind_dict = synthetic.make_case(*params)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    records = 0
+    with Muted():
+        for i in range(repeat):
+            # instantiate_template adds vargen: values to the dict
+            bindings = copy.deepcopy(bind_dict)
+            t0 = time.time()
+            doc = provconv.instantiate_template(template, bindings)
+            times.append(time.time() - t0)
+            records = count_records(doc)
+            del doc
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"records": records,
+            "times": times,
+            "peak_rss_kb": rss_peak - rss_start}
+
+
+def bench_instantiate(params, repeat):
+    pool = multiprocessing.Pool(processes=1)
+    try:
+        res = pool.apply(_instantiate_worker, (params, repeat))
+    finally:
+        pool.close()
+        pool.join()
+    best = min(res["times"])
+    return {"records": res["records"],
+            "best_s": best,
+            "mean_s": sum(res["times"]) / len(res["times"]),
+            "records_per_s": res["records"] / best if best > 0 else None,
+            "peak_rss_kb": res["peak_rss_kb"]}
+
+
+def bench_script(params, repeat):
+    '''
+    run expandTemplate.py on the serialized case, report wall time and the
+    peak RSS of the child process (from wait4)
+    '''
+    template, bind_dict = synthetic.make_case(*params)
+    tmpdir = tempfile.mkdtemp(prefix="provbench")
+    try:
+        tfile = os.path.join(tmpdir, "template.json")
+        bfile = os.path.join(tmpdir, "bindings.json")
+        ofile = os.path.join(tmpdir, "expanded.json")
+        with open(tfile, "w") as f:
+            f.write(template.serialize(format="json"))
+        with open(bfile, "w") as f:
+            f.write(synthetic.make_binding_doc(bind_dict).serialize(format="json"))
+
+        cmd = [sys.executable, os.path.join(PROVTEMPLATES, "expandTemplate.py"),
+               "-i", tfile, "-b", bfile, "-o", ofile]
+        walls = []
+        rss = 0
+        devnull = open(os.devnull, "w")
+        for i in range(repeat):
+            t0 = time.time()
+            proc = subprocess.Popen(cmd, stdout=devnull, stderr=devnull)
+            pid, status, usage = os.wait4(proc.pid, 0)
+            walls.append(time.time() - t0)
+            proc.returncode = os.WEXITSTATUS(status)
+            if proc.returncode != 0:
+                devnull.close()
+                return {"error": "expandTemplate.py exited with status %d" % proc.returncode}
+            rss = max(rss, usage.ru_maxrss)
+        devnull.close()
+    finally:
+        shutil.rmtree(tmpdir)
+    return {"wall_s": min(walls), "peak_rss_kb": rss}
+
+
+def run_suite(cases, repeat=3, script=True):
+    results = {"meta": {"python": platform.python_version(),
+                        "prov": prov.__version__,
+                        "platform": platform.platform(),
+                        "repeat": repeat,
+                        "date": time.strftime("%Y-%m-%dT%H:%M:%S")},
+               "cases": {}}
+    for params in cases:
+        name = synthetic.case_name(*params)
+        entry = {"params": dict(zip(["num_vars", "link_depth", "num_values",
+                                     "num_bundles", "arity"], params))}
+        entry["instantiate"] = bench_instantiate(params, repeat)
+        if script:
+            entry["expandTemplate"] = bench_script(params, repeat)
+        results["cases"][name] = entry
+        print_case(name, entry)
+    return results
+
+
+def print_case(name, entry):
+    inst = entry["instantiate"]
+    line = "%-22s %7d records  %9.4fs  %10.0f rec/s  %8d KB" % (
+        name, inst["records"], inst["best_s"], inst["records_per_s"] or 0,
+        inst["peak_rss_kb"])
+    if "expandTemplate" in entry:
+        scr = entry["expandTemplate"]
+        if "error" in scr:
+            line += "  | script: " + scr["error"]
+        else:
+            line += "  | script %8.4fs %8d KB" % (scr["wall_s"], scr["peak_rss_kb"])
+    print(line)
+
+
+# (section, metric) pairs compared against a baseline; all are "lower is better"
+COMPARED_METRICS = [("instantiate", "best_s"), ("instantiate", "peak_rss_kb"),
+                    ("expandTemplate", "wall_s"), ("expandTemplate", "peak_rss_kb")]
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''
+    compare two result sets
+
+    Returns:
+        list of (case, metric, old, new) tuples which regressed by more
+        than threshold (relative)
+    '''
+    regressions = []
+    for name, entry in sorted(results["cases"].items()):
+        if name not in baseline["cases"]:
+            continue
+        old_entry = baseline["cases"][name]
+        for section, metric in COMPARED_METRICS:
+            old = old_entry.get(section, {}).get(metric)
+            new = entry.get(section, {}).get(metric)
+            if not old or new is None:
+                continue
+            ratio = float(new) / old
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append((name, section + "." + metric, old, new))
+            print("%-22s %-28s %12.4f -> %12.4f  (x%.2f)%s" % (
+                name, section + "." + metric, old, new, ratio, flag))
+    return regressions
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def usage():
+    print(__doc__)
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hr:s:c:t:", ["help", "repeat=", "save=", "compare=",
+                                   "threshold=", "vars=", "depth=", "values=", "bundles=",
+                                   "arity=", "no-script"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        return 2
+
+    repeat = 3
+    save = None
+    baseline = None
+    threshold = DEFAULT_THRESHOLD
+    script = True
+    grid = dict()
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            return 0
+        elif o in ("-r", "--repeat"):
+            repeat = int(a)
+        elif o in ("-s", "--save"):
+            save = a
+        elif o in ("-c", "--compare"):
+            baseline = a
+        elif o in ("-t", "--threshold"):
+            threshold = float(a)
+        elif o == "--no-script":
+            script = False
+        else:
+            grid[o[2:]] = parse_list(a)
+
+    if grid:
+        defaults = {"vars": [8], "depth": [1], "values": [4], "bundles": [1], "arity": [2]}
+        defaults.update(grid)
+        cases = list(itertools.product(defaults["vars"], defaults["depth"],
+                                       defaults["values"], defaults["bundles"],
+                                       defaults["arity"]))
+    else:
+        cases = DEFAULT_CASES
+
+    results = run_suite(cases, repeat, script)
+
+    if save:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), threshold)
+        if regressions:
+            print("%d regression(s) above %d%%" % (len(regressions), threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
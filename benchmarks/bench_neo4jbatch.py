@@ -0,0 +1,126 @@
+'''
+neo4j loading of expanded PROV documents: the UNWIND batch loader
+(neo4j_prov/neo4jbatch.py) compared with one graph.create round trip per
+relationship (the way the list returned by provio.gen_graph_model is
+pushed)
+
+Without --neo4j the in-process recordinggraph.RecordingGraph is used: the
+loader time is the client side cost (grouping, parameter building), the
+network time is estimated as round trips x --latency for both ways.
+With --neo4j the loader writes into that database (py2neo Graph URI; the
+data is not removed afterwards).
+
+With --upsert the loader MERGEs, and every document is loaded a second time
+by the same loader ("reload" line: the LRU of known uris skips the nodes,
+the graph must not change).
+
+usage:
+    python bench_neo4jbatch.py [--records 10000,100000,1000000]
+                               [--batch-size 10000] [--bundles 0] [--upsert]
+                               [--latency 0.001] [--neo4j http://localhost:7474/db/data/]
+'''
+
+import sys
+import os
+import time
+import getopt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "neo4j_prov"))
+
+import synthetic
+import provbin
+import neo4jbatch
+from bench_expansion import count_records
+from recordinggraph import RecordingGraph
+
+
+def report(name, num_records, stats, seconds, round_trips, relations, latency):
+    print("%-7s %9d %8d %8d %8d %8d %9.3f %10.0f %10.1f %10.1f" % (
+        name, num_records, stats["nodes"], stats["relationships"], stats["batches"], round_trips,
+        seconds, num_records / seconds, seconds + round_trips * latency, relations * latency))
+
+
+def run(records, batch_size, num_bundles, latency, graph_uri=None, upsert=False):
+    doc = synthetic.make_document(records, num_bundles)
+    num_records = count_records(doc)
+    relations = sum(1 for (b, rec) in provbin.iter_doc_records(doc) if not rec.is_element())
+
+    if graph_uri:
+        from py2neo import Graph
+        graph = Graph(graph_uri)
+    else:
+        graph = RecordingGraph()
+    loader = neo4jbatch.BatchLoader(graph, batch_size, upsert=upsert)
+    t0 = time.time()
+    stats = loader.load(doc)
+    seconds = time.time() - t0
+
+    ok = stats["relationships"] == relations
+    if graph_uri:
+        print("%9d %8d %8d %8d %9.3f %10.0f" % (num_records, stats["nodes"], stats["relationships"],
+                                                stats["batches"], seconds, num_records / seconds))
+        return ok
+    ok = ok and graph.unmatched == 0 and len(graph.relationships) == relations
+    report("load", num_records, stats, seconds, graph.round_trips, relations, latency)
+    if upsert:
+        nodes, round_trips = len(graph.nodes), graph.round_trips
+        t0 = time.time()
+        again = loader.load(doc)
+        seconds = time.time() - t0
+        again = dict((k, again[k] - stats[k]) for k in stats)
+        ok = ok and len(graph.nodes) == nodes and len(graph.relationships) == relations
+        report("reload", num_records, again, seconds, graph.round_trips - round_trips,
+               relations, latency)
+    return ok
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "h", ["help", "records=", "batch-size=", "bundles=",
+                                               "latency=", "neo4j=", "upsert"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        print(__doc__)
+        return 2
+    sizes = [10000, 100000, 1000000]
+    batch_size = neo4jbatch.DEFAULT_BATCH_SIZE
+    num_bundles = 0
+    latency = 0.001
+    graph_uri = None
+    upsert = False
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(__doc__)
+            return 0
+        elif o == "--records":
+            sizes = [int(v) for v in a.split(",")]
+        elif o == "--batch-size":
+            batch_size = int(a)
+        elif o == "--bundles":
+            num_bundles = int(a)
+        elif o == "--latency":
+            latency = float(a)
+        elif o == "--neo4j":
+            graph_uri = a
+        elif o == "--upsert":
+            upsert = True
+
+    if graph_uri:
+        print("%9s %8s %8s %8s %9s %10s" % ("records", "nodes", "rels", "batches", "seconds",
+                                            "records/s"))
+    else:
+        print("%-7s %9s %8s %8s %8s %8s %9s %10s %10s %10s" % (
+            "", "records", "nodes", "rels", "batches", "trips", "seconds", "records/s",
+            "est.batch", "est.create"))
+    ok = True
+    for records in sizes:
+        ok = run(records, batch_size, num_bundles, latency, graph_uri, upsert) and ok
+    if not graph_uri:
+        print("est.: seconds with %.1f ms per round trip (create: one per relationship)"
+              % (latency * 1000))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,108 @@
+'''
+parse time of the PROVBIN format (neo4j_prov/provbin.py) compared with the
+prov JSON and XML deserializers, for an expanded synthetic template; the
+streaming readers (neo4j_prov/provstream.py) are timed on the same files
+
+usage:
+    python bench_provbin.py [-r repeat] [--vars 64] [--depth 7] [--values 16]
+                            [--bundles 2] [--arity 3]
+'''
+
+import sys
+import os
+import time
+import getopt
+import random
+import shutil
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "prov_templates", "provtemplates"))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import provconv
+import prov.model as prov
+import synthetic
+from bench_expansion import Muted, count_records
+from neo4j_prov import provbin
+from neo4j_prov import provstream
+
+
+def best_of(repeat, fnc):
+    times = []
+    res = None
+    for i in range(repeat):
+        t0 = time.time()
+        res = fnc()
+        times.append(time.time() - t0)
+    return min(times), res
+
+
+def run(params, repeat):
+    template, bind_dict = synthetic.make_case(*params)
+    with Muted():
+        doc = provconv.instantiate_template(template, bind_dict)
+    print("case %s: %d records" % (synthetic.case_name(*params), count_records(doc)))
+
+    tmpdir = tempfile.mkdtemp(prefix="provbin")
+    try:
+        files = {"json": os.path.join(tmpdir, "doc.json"),
+                 "xml": os.path.join(tmpdir, "doc.xml"),
+                 "provbin": os.path.join(tmpdir, "doc.provbin")}
+        for frmt in ["json", "xml"]:
+            with open(files[frmt], "w") as f:
+                f.write(doc.serialize(format=frmt))
+        provbin.write(doc, files["provbin"])
+
+        results = {}
+        for frmt in ["json", "xml"]:
+            results[frmt] = best_of(repeat, lambda: prov.ProvDocument.deserialize(files[frmt], format=frmt))
+        results["provbin"] = best_of(repeat, lambda: provbin.read(files["provbin"]))
+
+        for frmt in ["json", "xml", "provbin"]:
+            elapsed, parsed = results[frmt]
+            print("%-8s %10d bytes  parse %8.4fs  x%5.1f  equal: %s" % (
+                frmt, os.path.getsize(files[frmt]), elapsed,
+                results["json"][0] / elapsed, parsed == doc))
+
+        for frmt in ["json", "xml"]:
+            elapsed, num = best_of(repeat, lambda: sum(1 for item in provstream.iter_records(files[frmt], frmt)))
+            print("%-8s stream %9d records parse %8.4fs  x%5.1f" % (
+                frmt, num, elapsed, results["json"][0] / elapsed))
+
+        # lazy access: open the mapped file and decode 100 random records
+        def lazy():
+            with provbin.ProvBinReader(files["provbin"]) as reader:
+                for i in range(100):
+                    reader.record(random.randrange(len(reader)))
+        elapsed, res = best_of(repeat, lazy)
+        print("provbin  open + 100 random records   %8.4fs" % elapsed)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hr:", ["help", "repeat=", "vars=", "depth=",
+                                                 "values=", "bundles=", "arity="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        print(__doc__)
+        return 2
+    repeat = 3
+    params = {"vars": 64, "depth": 7, "values": 16, "bundles": 2, "arity": 3}
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(__doc__)
+            return 0
+        elif o in ("-r", "--repeat"):
+            repeat = int(a)
+        else:
+            params[o[2:]] = int(a)
+    run((params["vars"], params["depth"], params["values"], params["bundles"],
+         params["arity"]), repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
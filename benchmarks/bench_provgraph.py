@@ -0,0 +1,133 @@
+'''
+in-memory lineage graph (neo4j_prov/provgraph.py): build time, memory and
+query latency of ancestors / descendants / shortest_path
+
+The graph is generated as arrays: --nodes nodes in independent workflows of
+--workflow nodes each, every edge from a random node to a random earlier
+node of its workflow (a DAG, like derivations within workflow runs), with
+a few edge types. --check compares the answers with a plain python BFS on
+a sample of nodes (slow for big graphs).
+
+usage:
+    python bench_provgraph.py [--edges 10000000] [--nodes 1000000]
+                              [--workflow 1000] [--queries 200] [--check]
+'''
+
+import sys
+import os
+import time
+import random
+import getopt
+import resource
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "neo4j_prov"))
+
+import provgraph
+
+TYPES = ["prov:Derivation", "prov:Usage", "prov:Generation", "prov:Association"]
+
+
+def make_graph(num_edges, num_nodes, workflow, seed=1):
+    rng = np.random.RandomState(seed)
+    src = rng.randint(0, num_nodes, num_edges).astype(np.int32)
+    local = src % workflow
+    src = src[local > 0]
+    local = local[local > 0]
+    dst = (src - local + (rng.random_sample(len(src)) * local).astype(np.int32)).astype(np.int32)
+    types = rng.randint(0, len(TYPES), len(src)).astype(np.uint8)
+    uris = [u"http://example.com/bench#n%d" % i for i in range(num_nodes)]
+    labels = np.zeros(num_nodes, dtype=np.uint8)
+    t0 = time.time()
+    graph = provgraph.ProvGraph(uris, labels, ["Entity"], src, dst, types, TYPES)
+    return graph, time.time() - t0
+
+
+def python_bfs(graph, uri, forward):
+    indptr, indices = (graph._out if forward else graph._in)[:2]
+    start = graph.node_id(uri)
+    seen = set([start])
+    frontier = [start]
+    while frontier:
+        found = []
+        for node in frontier:
+            for other in indices[indptr[node]:indptr[node + 1]].tolist():
+                if other not in seen:
+                    seen.add(other)
+                    found.append(other)
+        frontier = found
+    seen.discard(start)
+    return set(graph.uris[i] for i in seen)
+
+
+def timed(fnc, args):
+    times = []
+    sizes = []
+    for a in args:
+        t0 = time.time()
+        result = fnc(*a)
+        times.append(time.time() - t0)
+        sizes.append(len(result) if result is not None else 0)
+    times.sort()
+    return (times[len(times) // 2] * 1000, times[int(len(times) * 0.99)] * 1000,
+            sum(sizes) / float(len(sizes)))
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "h", ["help", "edges=", "nodes=", "workflow=",
+                                               "queries=", "check"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        print(__doc__)
+        return 2
+    num_edges = 10000000
+    num_nodes = 1000000
+    workflow = 1000
+    queries = 200
+    check = False
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(__doc__)
+            return 0
+        elif o == "--edges":
+            num_edges = int(a)
+        elif o == "--nodes":
+            num_nodes = int(a)
+        elif o == "--workflow":
+            workflow = int(a)
+        elif o == "--queries":
+            queries = int(a)
+        elif o == "--check":
+            check = True
+
+    graph, seconds = make_graph(num_edges, num_nodes, workflow)
+    print("%d nodes, %d edges: build %.2fs, arrays %.1f MB, peak rss %.1f MB" % (
+        graph.num_nodes, graph.num_edges, seconds, graph.nbytes / 1e6,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3))
+
+    random.seed(2)
+    sample = random.sample(graph.uris, queries)
+    pairs = [(u, random.choice(graph.ancestors(u) or [u])) for u in sample]
+    print("%-28s %10s %10s %10s" % ("query", "median ms", "p99 ms", "avg size"))
+    for name, fnc, args in [
+            ("ancestors", graph.ancestors, [(u,) for u in sample]),
+            ("ancestors prov:Derivation", graph.ancestors, [(u, ["prov:Derivation"]) for u in sample]),
+            ("ancestors depth 2", graph.ancestors, [(u, None, 2) for u in sample]),
+            ("descendants", graph.descendants, [(u,) for u in sample]),
+            ("shortest_path", graph.shortest_path, pairs),
+            ("shortest_path any", graph.shortest_path, [(v, u, "any") for (u, v) in pairs])]:
+        print("%-28s %10.2f %10.2f %10.1f" % ((name,) + timed(fnc, args)))
+
+    if check:
+        ok = all(set(graph.ancestors(u)) == python_bfs(graph, u, True) and
+                 set(graph.descendants(u)) == python_bfs(graph, u, False) for u in sample)
+        print("check: %s" % ("ok" if ok else "FAILED"))
+        return 0 if ok else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
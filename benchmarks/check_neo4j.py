@@ -0,0 +1,245 @@
+'''
+checks of the neo4j writers (neo4j_prov: neo4jbatch.BatchLoader,
+provsync.DocumentSync) against the in-process RecordingGraph
+(recordinggraph.py): the nodes and relationships in the graph after
+loading, reloading and syncing small documents
+
+Every case returns the list of its failed expectations; the script exits
+with 1 if any case failed.
+
+usage:
+    python check_neo4j.py [-k case_substring]
+'''
+
+import sys
+import os
+import getopt
+import collections
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "neo4j_prov"))
+
+import prov.model as prov
+import provbin
+import provsync
+import neo4jbatch
+from neo4jcsv import KEY_LABEL
+from recordinggraph import RecordingGraph
+
+EX = "http://example.com#"
+
+
+def make_doc(build):
+    doc = prov.ProvDocument()
+    doc.add_namespace("ex", EX)
+    build(doc)
+    return doc
+
+
+def sync(syncer, key, doc):
+    return syncer.sync(key, neo4jbatch.record_rows(provbin.iter_doc_records(doc)))
+
+
+def has_node(graph, name):
+    return any(uri == EX + name for (label, uri) in graph.nodes)
+
+
+def elements(graph):
+    '''
+    sorted local names of the PROV element nodes (no document state nodes)
+    '''
+    return sorted(uri[len(EX):] for (label, uri) in graph.nodes if label == KEY_LABEL)
+
+
+def node_labels(graph, name):
+    return graph.labels.get((KEY_LABEL, EX + name), set())
+
+
+def snapshot(graph):
+    '''
+    comparable copy of the nodes, labels and relationships of graph
+    '''
+    return (dict((key, dict(props)) for (key, props) in graph.nodes.items()),
+            dict((key, set(labels)) for (key, labels) in graph.labels.items()),
+            sorted((rel_type, start, end, sorted(props.items()))
+                   for (rel_type, start, end, props) in graph.relationships))
+
+
+def has_relationship(graph, rel_type, start, end):
+    return any(rel[:3] == (rel_type, EX + start, EX + end) for rel in graph.relationships)
+
+
+def expect(failures, ok, message):
+    if not ok:
+        failures.append(message)
+
+
+#---------------------------------------------------------------
+# cases
+
+def shared_and_used(doc):
+    doc.entity("ex:shared", {"ex:size": 42})
+    doc.used("ex:act", "ex:shared")
+
+
+def small_run(doc):
+    doc.entity("ex:input", {"ex:size": 1})
+    doc.entity("ex:output")
+    doc.activity("ex:act")
+    doc.agent("ex:ag")
+    doc.used("ex:act", "ex:input")
+    doc.wasGeneratedBy("ex:output", "ex:act")
+    doc.wasDerivedFrom("ex:output", "ex:input")
+    doc.wasAssociatedWith("ex:act", "ex:ag")
+
+
+def check_load_counts():
+    # one node per element and one relationship per relation, create and upsert mode
+    failures = []
+    for upsert in (False, True):
+        graph = RecordingGraph()
+        stats = neo4jbatch.load_document(graph, make_doc(small_run), upsert=upsert)
+        mode = "upsert" if upsert else "create"
+        expect(failures, (stats["nodes"], stats["relationships"]) == (4, 4),
+               "%s: stats %d nodes, %d relationships (expected 4, 4)"
+               % (mode, stats["nodes"], stats["relationships"]))
+        expect(failures, elements(graph) == ["act", "ag", "input", "output"],
+               "%s: nodes %s" % (mode, elements(graph)))
+        expect(failures, len(graph.relationships) == 4,
+               "%s: %d relationships (expected 4)" % (mode, len(graph.relationships)))
+        expect(failures, node_labels(graph, "input") == set([KEY_LABEL, "Entity"]),
+               "%s: ex:input labels %s" % (mode, sorted(node_labels(graph, "input"))))
+        expect(failures, graph.nodes.get((KEY_LABEL, EX + "input"), {}).get("ex:size") == 1,
+               "%s: ex:input lost its ex:size" % mode)
+        expect(failures, graph.unmatched == 0,
+               "%s: %d unmatched statement rows" % (mode, graph.unmatched))
+    return failures
+
+
+def check_upsert_reload():
+    # loading the same document again in upsert mode leaves the graph unchanged
+    graph = RecordingGraph()
+    loader = neo4jbatch.BatchLoader(graph, upsert=True)
+    loader.load(make_doc(small_run))
+    before = snapshot(graph)
+    failures = []
+    stats = loader.load(make_doc(small_run))
+    expect(failures, snapshot(graph) == before, "graph changed by the reload (same loader)")
+    expect(failures, stats["known"] > 0, "reload skipped no known element")
+    neo4jbatch.load_document(graph, make_doc(small_run), upsert=True)
+    expect(failures, snapshot(graph) == before, "graph changed by the reload (new loader)")
+    return failures
+
+
+def check_stream_reference_first():
+    # a stream relation naming an element before its record gives a single node
+    doc = make_doc(small_run)
+    records = sorted(((None, rec) for rec in doc.get_records()),
+                     key=lambda item: item[1].is_element())
+    graph = RecordingGraph()
+    neo4jbatch.BatchLoader(graph, upsert=True).load_records(records)
+    failures = []
+    expect(failures, elements(graph) == ["act", "ag", "input", "output"],
+           "nodes %s" % elements(graph))
+    expect(failures, len(graph.relationships) == 4,
+           "%d relationships (expected 4)" % len(graph.relationships))
+    expect(failures, node_labels(graph, "input") == set([KEY_LABEL, "Entity"]),
+           "ex:input labels %s" % sorted(node_labels(graph, "input")))
+    expect(failures, graph.nodes.get((KEY_LABEL, EX + "input"), {}).get("ex:size") == 1,
+           "ex:input lost its ex:size")
+    return failures
+
+
+def check_sync_keeps_loaded_nodes():
+    # a node loaded by BatchLoader is not deleted when a synced document drops it
+    graph = RecordingGraph()
+    neo4jbatch.load_document(graph, make_doc(shared_and_used), upsert=True)
+    syncer = provsync.DocumentSync(graph)
+    sync(syncer, "A", make_doc(lambda d: d.entity("ex:shared")))
+    sync(syncer, "A", make_doc(lambda d: d.entity("ex:other")))
+    failures = []
+    expect(failures, has_node(graph, "shared"), "loaded node ex:shared deleted by the sync")
+    expect(failures, has_relationship(graph, "prov:Usage", "act", "shared"),
+           "loaded relationship ex:act -prov:Usage-> ex:shared deleted by the sync")
+    expect(failures, graph.unmatched == 0, "%d unmatched statement rows" % graph.unmatched)
+    return failures
+
+
+def check_load_after_sync():
+    # a synced node merged by a later load is no longer deleted by the sync
+    graph = RecordingGraph()
+    syncer = provsync.DocumentSync(graph)
+    sync(syncer, "A", make_doc(lambda d: d.entity("ex:shared")))
+    neo4jbatch.load_document(graph, make_doc(shared_and_used), upsert=True)
+    sync(syncer, "A", make_doc(lambda d: d.entity("ex:other")))
+    failures = []
+    expect(failures, has_node(graph, "shared"), "loaded node ex:shared deleted by the sync")
+    expect(failures, has_relationship(graph, "prov:Usage", "act", "shared"),
+           "loaded relationship ex:act -prov:Usage-> ex:shared deleted by the sync")
+    return failures
+
+
+def check_sync_release():
+    # a node of synced documents only is deleted with the last one containing it
+    graph = RecordingGraph()
+    syncer = provsync.DocumentSync(graph)
+    sync(syncer, "A", make_doc(shared_and_used))
+    sync(syncer, "C", make_doc(lambda d: d.entity("ex:shared")))
+    empty = make_doc(lambda d: None)
+    failures = []
+    expect(failures, elements(graph) == ["act", "shared"], "nodes after sync %s" % elements(graph))
+    expect(failures, len(graph.relationships) == 1,
+           "%d relationships after sync (expected 1)" % len(graph.relationships))
+    stats = sync(syncer, "A", empty)
+    expect(failures, elements(graph) == ["shared"], "nodes after releasing A %s" % elements(graph))
+    expect(failures, not graph.relationships, "relationships of A not deleted")
+    expect(failures, stats["relationships_removed"] == 1,
+           "%d relationships removed with A (expected 1)" % stats["relationships_removed"])
+    sync(syncer, "C", empty)
+    expect(failures, elements(graph) == [], "nodes after releasing C %s" % elements(graph))
+    expect(failures, graph.unmatched == 0, "%d unmatched statement rows" % graph.unmatched)
+    return failures
+
+
+CASES = collections.OrderedDict([
+    ("load_counts", check_load_counts),
+    ("upsert_reload", check_upsert_reload),
+    ("stream_reference_first", check_stream_reference_first),
+    ("sync_keeps_loaded_nodes", check_sync_keeps_loaded_nodes),
+    ("load_after_sync", check_load_after_sync),
+    ("sync_release", check_sync_release),
+])
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hk:", ["help", "cases="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        print(__doc__)
+        return 2
+    pattern = None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(__doc__)
+            return 0
+        elif o in ("-k", "--cases"):
+            pattern = a
+
+    failed = 0
+    for name, check in CASES.items():
+        if pattern and pattern not in name:
+            continue
+        failures = check()
+        print("%-34s %s" % (name, "ok" if not failures else "FAILED"))
+        for message in failures:
+            print("    " + message)
+        failed += bool(failures)
+    if failed:
+        print("%d case(s) failed" % failed)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,374 @@
+'''
+conformance-and-speed harness for PROV template expansion
+
+runs every template/bindings pair under prov_templates/test/ plus a set of
+synthetic cases (synthetic.py) through each registered expansion mode,
+canonicalizes the expanded documents and compares them with the stored
+reference expansions in reference/. Timings of all modes are reported
+side by side.
+
+Canonical form: one line per record, identifiers and qualified name values
+written as full URIs, attributes sorted, records sorted. Identifiers
+generated for vargen: variables (GLOBAL_UUID_NS uuids) are renamed to
+vargen_0, vargen_1, ... so that runs are comparable. Expansions which raise
+are canonicalized as "ERROR <exception class>".
+
+usage:
+    python conformance.py [-m mode1,mode2] [-k case_substring] [-o report.json]
+    python conformance.py --update        (rewrite references from "default")
+'''
+
+import sys
+import os
+import re
+import copy
+import time
+import json
+import getopt
+import collections
+import six
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROVTEMPLATES = os.path.join(HERE, "..", "prov_templates", "provtemplates")
+TESTDIR = os.path.join(HERE, "..", "prov_templates", "test")
+REFDIR = os.path.join(HERE, "reference")
+sys.path.insert(0, PROVTEMPLATES)
+
+import provconv
+import bindingsConverter
+import prov.model as prov
+import synthetic
+from bench_expansion import Muted
+
+TEMPLATES = ["template1", "template2", "template3"]
+BINDINGS = ["binding1", "binding2", "binding3", "binding4", "binding5", "binding6"]
+# file cases expanded into a named bundle
+BUNDLE_CASES = [("template1", "binding6"), ("template2", "binding6")]
+BUNDLE_ID = prov.QualifiedName(prov.Namespace("ex", "http://example.com/#"), "bundle")
+
+# (num_vars, link_depth, num_values, num_bundles, arity)
+SYNTHETIC_CASES = [
+    (4, 0, 2, 0, 2),
+    (4, 1, 2, 1, 2),
+    (6, 2, 3, 2, 3),
+    (8, 3, 2, 1, 4),
+]
+
+
+def expand_default(template, bind_dict):
+    return provconv.instantiate_template(template, bind_dict)
+
+
+class _Collector(object):
+    '''
+    provconv.RecordSink handler collecting the streamed records in a document
+    '''
+    def __init__(self):
+        self.doc = prov.ProvDocument()
+        self.bundles = {}
+
+    def add_record(self, record, bundle_id):
+        target = self.doc
+        if bundle_id is not None:
+            target = self.bundles.get(bundle_id)
+            if target is None:
+                target = self.bundles[bundle_id] = self.doc.bundle(bundle_id)
+        target._add_record(record)
+
+
+def expand_streaming(template, bind_dict):
+    collector = _Collector()
+    provconv.instantiate_template(template, bind_dict, sink=collector)
+    return collector.doc
+
+
+def _is_var(value):
+    return provconv.is_variable(value) and value.namespace.prefix == "var"
+
+
+def split_bindings(template, bind_dict):
+    '''
+    split the bindings into fragments expanded independently: one per value
+    of a multi-valued variable X (with the values of the attribute variables
+    of the records X identifies, which are indexed like X). X must not be
+    tmpl:linked (linked values are zipped, not combined) nor be used as an
+    attribute value. Records without X are expanded in every fragment and
+    merged again. Templates with vargen: variables (a new uuid per
+    expansion, e.g. of the bundle) are not split.
+
+    Returns:
+        list of bind_dicts
+    '''
+    records = []
+    for bundle in [template] + list(template.bundles):
+        if bundle is not template and provconv.is_variable(bundle.identifier) and \
+                bundle.identifier.namespace.prefix == "vargen":
+            return [bind_dict]
+        records.extend(bundle.get_records())
+    excluded = set()
+    attributes = collections.defaultdict(set)
+    for rec in records:
+        values = [rec.identifier] + [v for n, v in rec.attributes]
+        if any(provconv.is_variable(v) and v.namespace.prefix == "vargen" for v in values):
+            return [bind_dict]
+        ident = six.text_type(rec.identifier) if _is_var(rec.identifier) else None
+        for name, value in rec.extra_attributes:
+            if not _is_var(value):
+                continue
+            if name == provconv.TMPL_LINKED:
+                excluded.update([ident, six.text_type(value)])
+            else:
+                excluded.add(six.text_type(value))
+                attributes[ident].add(six.text_type(value))
+    for var in sorted(bind_dict):
+        values = bind_dict[var]
+        if var in excluded or not isinstance(values, list) or len(values) < 2:
+            continue
+        indexed = sorted(attributes.get(var, ()))
+        if any(a in bind_dict and (len(bind_dict[a]) != len(values) or
+                                   any(a in attrs for (i, attrs) in attributes.items() if i != var))
+               for a in indexed):
+            continue
+        fragments = []
+        for i in range(len(values)):
+            fragment = dict(bind_dict)
+            for name in [var] + [a for a in indexed if a in bind_dict]:
+                fragment[name] = [bind_dict[name][i]]
+            fragments.append(fragment)
+        return fragments
+    return [bind_dict]
+
+
+def expand_parallel(template, bind_dict):
+    # the split expansion of bindingsConverter (-s, -p): fragments in a process pool
+    doc, fragments = bindingsConverter.expand_fragments(template, [], split_bindings(template, bind_dict),
+                                                        PARALLEL_PROCESSES)
+    return doc
+
+
+# expansion modes: name -> function(template, bind_dict) -> ProvDocument
+# modes listed in PLANNED_MODES but not registered are reported as skipped
+MODES = collections.OrderedDict([
+    ("default", expand_default),
+    ("streaming", expand_streaming),
+    ("parallel", expand_parallel),
+])
+PLANNED_MODES = ["default", "streaming", "parallel"]
+PARALLEL_PROCESSES = 2
+
+
+#---------------------------------------------------------------
+# cases
+
+def load_file_case(tname, bname):
+    '''
+    load a template/bindings pair from prov_templates/test the way
+    expandTemplate.py does
+    '''
+    template = prov.ProvDocument.deserialize(os.path.join(TESTDIR, tname + ".ttl"),
+                                             format="rdf", rdf_format="turtle")
+    bindings_doc = prov.ProvDocument.deserialize(os.path.join(TESTDIR, bname + ".ttl"),
+                                                 format="rdf", rdf_format="turtle")
+    bind_dict = provconv.read_binding(bindings_doc)
+    template = provconv.set_namespaces(bindings_doc.namespaces, template)
+    return template, bind_dict
+
+
+def load_bundle_case(tname, bname):
+    '''
+    file case with the template records in a bundle ex:bundle (a named
+    bundle: split and merged again by the parallel mode)
+    '''
+    template, bind_dict = load_file_case(tname, bname)
+    doc = provconv.set_namespaces(template.namespaces, prov.ProvDocument())
+    bundle = doc.bundle(BUNDLE_ID)
+    for rec in template.get_records():
+        bundle.add_record(rec)
+    return doc, bind_dict
+
+
+def iter_cases():
+    '''
+    yields (name, loader) with loader() -> (template, bind_dict)
+    '''
+    for tname in TEMPLATES:
+        for bname in BINDINGS:
+            yield (tname + "__" + bname,
+                   lambda t=tname, b=bname: load_file_case(t, b))
+    for tname, bname in BUNDLE_CASES:
+        yield ("%s__%s__bundle" % (tname, bname),
+               lambda t=tname, b=bname: load_bundle_case(t, b))
+    for params in SYNTHETIC_CASES:
+        yield ("synthetic_" + synthetic.case_name(*params),
+               lambda p=params: synthetic.make_case(*p))
+
+
+#---------------------------------------------------------------
+# canonical form
+
+UUID_RE = re.compile(re.escape(provconv.GLOBAL_UUID_NS.uri) +
+                     r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def _canon_value(value):
+    if isinstance(value, prov.QualifiedName):
+        return "<%s>" % value.uri
+    if isinstance(value, prov.Literal):
+        out = '"%s"' % value.value
+        if value.datatype:
+            out += "^^<%s>" % value.datatype.uri
+        if value.langtag:
+            out += "@" + value.langtag
+        return out
+    if hasattr(value, "isoformat"):
+        return '"%s"^^datetime' % value.isoformat()
+    if isinstance(value, six.string_types):
+        return '"%s"' % value
+    return '"%s"^^%s' % (value, type(value).__name__)
+
+
+def _canon_record(rec):
+    ident = "<%s>" % rec.identifier.uri if rec.identifier is not None else "-"
+    formal = [_canon_value(v) if v is not None else "-" for n, v in rec.formal_attributes]
+    extra = sorted("<%s>=%s" % (n.uri, _canon_value(v)) for n, v in rec.extra_attributes)
+    return "%s %s(%s) [%s]" % (rec.get_type().uri, ident, ", ".join(formal), ", ".join(extra))
+
+
+def canonicalize(doc):
+    '''
+    Returns:
+        list of canonical lines (bundle prefix + record)
+    '''
+    lines = ["- " + _canon_record(rec) for rec in doc.records]
+    for bundle in doc.bundles:
+        bid = "<%s>" % bundle.identifier.uri
+        lines.extend("%s %s" % (bid, _canon_record(rec)) for rec in bundle.records)
+
+    # sort with generated ids masked, then number them in that order
+    lines.sort(key=lambda l: (UUID_RE.sub("vargen", l), l))
+    names = dict()
+
+    def rename(m):
+        if m.group(0) not in names:
+            names[m.group(0)] = "vargen_%d" % len(names)
+        return names[m.group(0)]
+
+    return sorted(UUID_RE.sub(rename, l) for l in lines)
+
+
+def run_mode(mode, loader):
+    '''
+    Returns:
+        (canonical lines, seconds spent in the expansion)
+    '''
+    t0 = time.time()
+    try:
+        # unreadable inputs (e.g. binding4: rdflib "can't split" URIs, see
+        # provtemplates/NOTES) end up as canonical errors as well
+        template, bind_dict = loader()
+        t0 = time.time()
+        with Muted():
+            doc = MODES[mode](template, copy.deepcopy(bind_dict))
+    except Exception as e:
+        return (["ERROR " + e.__class__.__name__], time.time() - t0)
+    elapsed = time.time() - t0
+    return (canonicalize(doc), elapsed)
+
+
+def load_reference(name):
+    fname = os.path.join(REFDIR, name + ".txt")
+    if not os.path.exists(fname):
+        return None
+    with open(fname) as f:
+        return f.read().decode("utf8").splitlines()
+
+
+def save_reference(name, lines):
+    if not os.path.isdir(REFDIR):
+        os.makedirs(REFDIR)
+    with open(os.path.join(REFDIR, name + ".txt"), "w") as f:
+        f.write((u"\n".join(lines) + u"\n").encode("utf8"))
+
+
+#---------------------------------------------------------------
+
+def run(modes, pattern=None, update=False):
+    report = collections.OrderedDict()
+    failures = 0
+    for name, loader in iter_cases():
+        if pattern and pattern not in name:
+            continue
+        reference = load_reference(name)
+        if update or reference is None:
+            reference, elapsed = run_mode("default", loader)
+            save_reference(name, reference)
+        entry = collections.OrderedDict()
+        for mode in modes:
+            if mode not in MODES:
+                entry[mode] = {"status": "skipped"}
+                continue
+            lines, elapsed = run_mode(mode, loader)
+            status = "ok" if lines == reference else "MISMATCH"
+            if status != "ok":
+                failures += 1
+            entry[mode] = {"status": status, "seconds": elapsed}
+        report[name] = entry
+    return report, failures
+
+
+def print_report(report, modes):
+    print("%-34s" % "case" + "".join("%-22s" % m for m in modes))
+    for name, entry in report.items():
+        cols = []
+        for mode in modes:
+            res = entry[mode]
+            if "seconds" in res:
+                cols.append("%-22s" % ("%s %8.4fs" % (res["status"], res["seconds"])))
+            else:
+                cols.append("%-22s" % res["status"])
+        print("%-34s" % name + "".join(cols))
+
+
+def usage():
+    print(__doc__)
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hm:k:o:u", ["help", "modes=", "cases=", "outfile=",
+                                                      "update"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        return 2
+
+    modes = PLANNED_MODES
+    pattern = None
+    outfile = None
+    update = False
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            return 0
+        elif o in ("-m", "--modes"):
+            modes = a.split(",")
+        elif o in ("-k", "--cases"):
+            pattern = a
+        elif o in ("-o", "--outfile"):
+            outfile = a
+        elif o in ("-u", "--update"):
+            update = True
+
+    report, failures = run(modes, pattern, update)
+    print_report(report, modes)
+    if outfile:
+        with open(outfile, "w") as f:
+            json.dump(report, f, indent=2)
+    if failures:
+        print("%d mismatch(es)" % failures)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
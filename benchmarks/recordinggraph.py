@@ -0,0 +1,316 @@
+'''
+in-process stand-in for a py2neo Graph, used by the benchmarks and checks
+of the neo4j writers (neo4j_prov: neo4jbatch, provlineage, provsync)
+
+RecordingGraph interprets the statements those modules send (reads
+answered through run(...).data()) and keeps the resulting nodes and
+relationships in dicts and lists; a statement it does not recognise
+raises UnknownStatement, so that a changed statement cannot silently stop
+being applied.
+
+usage:
+    sys.path.insert(0, os.path.join(HERE, "..", "neo4j_prov"))
+    from recordinggraph import RecordingGraph
+    graph = RecordingGraph()
+    neo4jbatch.load_document(graph, prov_doc)
+'''
+
+import re
+import time
+
+from neo4jcsv import KEY_LABEL
+
+_CONSTRAINT_RE = re.compile(r"CREATE CONSTRAINT ON \(n:`([^`]*)`\) ASSERT n.uri IS UNIQUE")
+_NODE_RE = re.compile(r"CREATE \(n((?::`[^`]*`)+)\)")
+_NODE_MERGE_RE = re.compile(r"MERGE \(n:`([^`]*)` \{uri: row.uri\}\) "
+                            r"(ON CREATE )?SET ((?:n:`[^`]*`, )*)")
+_REL_RE = re.compile(r"MATCH \(a:`([^`]*)` \{uri: row.start\}\), \(b:`([^`]*)` \{uri: row.end\}\) "
+                     r"(CREATE|MERGE) \(a\)-\[r:`([^`]*)`\]")
+_LABELS_RE = re.compile(r"`([^`]*)`")
+# reads and deletes of provlineage.py
+_NEIGHBOUR_RE = re.compile(r"UNWIND \{uris\} AS uri MATCH \(n:`([^`]*)` \{uri: uri\}\)"
+                           r"(<?)-\[:`([^`]*)`\]->?\(m\)")
+_TYPED_RE = re.compile(r"MATCH \(a\)-\[r\]->\(b\) WHERE type\(r\) IN \{types\}")
+_DELETE_RE = re.compile(r"MATCH \(\)-\[r:`([^`]*)`\]->\(\) DELETE r")
+# statements of provsync.py
+_STATE_RE = re.compile(r"MATCH \(d:`([^`]*)` \{uri: \{doc\}\}\) RETURN d.hashes")
+_STATE_WRITE_RE = re.compile(r"MERGE \(d:`([^`]*)` \{uri: \{doc\}\}\) SET d.hashes")
+_NODE_SYNC_RE = re.compile(r"MERGE \(n:`([^`]*)` \{uri: row.uri\}\) ON CREATE SET n.sources = \[\] "
+                           r"WITH n, row, n.sources AS sources "
+                           r"SET ((?:n:`[^`]*`, )*)n = row.props")
+_NODE_REFERENCE_RE = re.compile(r"MERGE \(n:`([^`]*)` \{uri: row.uri\}\) "
+                                r"ON CREATE SET ((?:n:`[^`]*`, )*)n = row.props, n.sources = \[\] "
+                                r"SET n.sources")
+_NODE_RELABEL_RE = re.compile(r"MATCH \(n:`([^`]*)` \{uri: row.uri\}\) REMOVE n:`([^`]*)`")
+_NODE_RELEASE_RE = re.compile(r"MATCH \(n:`([^`]*)` \{uri: row.uri\}\) "
+                              r"WHERE n.sources IS NOT NULL SET n.sources")
+_REL_DELETE_RE = re.compile(r"MATCH \(a:`([^`]*)` \{uri: row.start\}\)-\[r:`([^`]*)` "
+                            r"\{prov_hash: row.hash\}\]->\(b:`([^`]*)` \{uri: row.end\}\)")
+
+
+class ConstraintError(Exception):
+    pass
+
+
+class UnknownStatement(Exception):
+    pass
+
+
+def _row_properties(row):
+    '''
+    properties a statement row sets (datetimes kept as ISO text)
+    '''
+    props = dict(row["props"])
+    props.update(row.get("times", {}))
+    return props
+
+
+class RecordingCursor(object):
+
+    def __init__(self, rows):
+        self._rows = rows or []
+
+    def data(self):
+        return list(self._rows)
+
+
+class RecordingTransaction(object):
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._pending = []
+
+    def run(self, statement, parameters=None, **kwparameters):
+        params = dict(parameters or {}, **kwparameters)
+        self._pending.append((statement, params))
+
+    def commit(self):
+        self.graph._round_trip()
+        for statement, params in self._pending:
+            self.graph._apply(statement, params)
+        self._pending = []
+
+    def rollback(self):
+        self._pending = []
+
+
+class RecordingGraph(object):
+    '''
+    in-process stand-in for a py2neo Graph which understands the loader
+    statements (and those of provlineage.py and provsync.py, reads answered
+    through run(...).data()): nodes are kept as (first label, uri) ->
+    properties with their labels in labels, relationships as (type, start
+    uri, end uri, properties); MATCHes that find no node are counted in
+    unmatched, a second node with the uri of a constrained label raises
+    ConstraintError, any other statement UnknownStatement; rows counts the
+    parameter rows received
+
+    Args:
+        latency (float): seconds slept per round trip (run / commit / create)
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.nodes = {}          # (label, uri) -> properties
+        self.labels = {}         # (label, uri) -> set of all labels of the node
+        self.relationships = []
+        self._merged = {}        # (type, start, end) -> properties of the first one
+        self.statements = []
+        self.round_trips = 0
+        self.unmatched = 0
+        self.constraints = set()
+        self.rows = 0
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def begin(self):
+        return RecordingTransaction(self)
+
+    def run(self, statement, parameters=None, **kwparameters):
+        self._round_trip()
+        return RecordingCursor(self._apply(statement, dict(parameters or {}, **kwparameters)))
+
+    def create(self, subgraph):
+        '''
+        the one round trip per py2neo object path (e.g. a Relationship)
+        '''
+        self._round_trip()
+        self.statements.append(("CREATE", subgraph))
+
+    def _find(self, label, uri):
+        '''
+        key of the node with label and uri, None if there is none
+        '''
+        for key in ((label, uri), (KEY_LABEL, uri)):
+            if label in self.labels.get(key, ()):
+                return key
+        return None
+
+    def _merge(self, label, uri, labels=()):
+        key = self._find(label, uri) or (label, uri)
+        self.labels.setdefault(key, set([label])).update(labels)
+        return self.nodes.setdefault(key, {})
+
+    def _apply(self, statement, params):
+        self.statements.append((statement, len(params.get("rows", ()))))
+        self.rows += len(params.get("rows", ()))
+        m = _CONSTRAINT_RE.search(statement)
+        if m:
+            self.constraints.add(m.group(1))
+            return
+        m = _NODE_RE.search(statement)
+        if m:
+            labels = _LABELS_RE.findall(m.group(1))
+            for row in params["rows"]:
+                for label in labels:
+                    if label in self.constraints and self._find(label, row["uri"]):
+                        raise ConstraintError("node (:%s {uri: '%s'}) already exists"
+                                              % (label, row["uri"]))
+                key = (labels[0], row["uri"])
+                self.nodes[key] = _row_properties(row)
+                self.labels[key] = set(labels)
+            return
+        m = _NODE_SYNC_RE.search(statement)
+        if m:
+            labels = _LABELS_RE.findall(m.group(2))
+            for row in params["rows"]:
+                new = self._find(m.group(1), row["uri"]) is None
+                node = self._merge(m.group(1), row["uri"], labels)
+                sources = [] if new else node.get("sources")
+                node.clear()
+                node.update(_row_properties(row))
+                self._add_source(node, sources, params["doc"])
+            return
+        m = _NODE_REFERENCE_RE.search(statement)
+        if m:
+            labels = _LABELS_RE.findall(m.group(2))
+            for row in params["rows"]:
+                if self._find(m.group(1), row["uri"]) is None:
+                    self._merge(m.group(1), row["uri"], labels).update(_row_properties(row),
+                                                                       sources=[])
+                node = self._merge(m.group(1), row["uri"])
+                self._add_source(node, node.get("sources"), params["doc"])
+            return
+        m = _NODE_RELABEL_RE.search(statement)
+        if m:
+            for row in params["rows"]:
+                key = self._find(m.group(1), row["uri"])
+                if key is None:
+                    self.unmatched += 1
+                    continue
+                self.labels[key].discard(m.group(2))
+            return
+        m = _NODE_RELEASE_RE.search(statement)
+        if m:
+            for row in params["rows"]:
+                key = self._find(m.group(1), row["uri"])
+                if key is None:
+                    self.unmatched += 1
+                    continue
+                node = self.nodes[key]
+                if node.get("sources") is None:
+                    continue
+                node["sources"] = [s for s in node["sources"] if s != params["doc"]]
+                if not node["sources"]:
+                    self._detach_delete(key)
+            return
+        m = _REL_DELETE_RE.search(statement)
+        if m:
+            rel_type = m.group(2)
+            for row in params["rows"]:
+                for i, (rtype, start, end, props) in enumerate(self.relationships):
+                    if rtype == rel_type and start == row["start"] and end == row["end"] and \
+                       props.get("prov_hash") == row["hash"] and props.get("doc") == params["doc"]:
+                        del self.relationships[i]
+                        break
+                else:
+                    self.unmatched += 1
+            return
+        m = _STATE_RE.search(statement)
+        if m:
+            key = self._find(m.group(1), params["doc"])
+            if key is None:
+                return []
+            node = self.nodes[key]
+            return [{"hashes": node.get("hashes"), "keys": node.get("keys")}]
+        m = _STATE_WRITE_RE.search(statement)
+        if m:
+            node = self._merge(m.group(1), params["doc"])
+            node.update(uri=params["doc"], hashes=params["hashes"], keys=params["keys"])
+            return
+        m = _NODE_MERGE_RE.search(statement)
+        if m:
+            label, on_create, labels = m.groups()
+            labels = _LABELS_RE.findall(labels)
+            for row in params["rows"]:
+                if not (on_create and self._find(label, row["uri"])):
+                    self._merge(label, row["uri"], labels).update(_row_properties(row))
+                if "REMOVE n.sources" in statement:
+                    self._merge(label, row["uri"]).pop("sources", None)
+            return
+        m = _REL_RE.search(statement)
+        if m:
+            start_label, end_label, op, rel_type = m.groups()
+            for row in params["rows"]:
+                if self._find(start_label, row["start"]) is None or \
+                   self._find(end_label, row["end"]) is None:
+                    self.unmatched += 1
+                    continue
+                key = (rel_type, row["start"], row["end"])
+                if op == "MERGE" and key in self._merged:
+                    self._merged[key].update(_row_properties(row))
+                    continue
+                props = _row_properties(row)
+                self.relationships.append(key + (props,))
+                self._merged.setdefault(key, props)
+            return
+        m = _NEIGHBOUR_RE.search(statement)
+        if m:
+            label, incoming, rel_type = m.groups()
+            return self._neighbours(label, rel_type, not incoming, params["uris"])
+        m = _TYPED_RE.search(statement)
+        if m:
+            labels = self._node_labels()
+            return [{"start": start, "start_labels": labels[start], "end": end,
+                     "end_labels": labels[end]}
+                    for (rel_type, start, end, props) in self.relationships
+                    if rel_type in params["types"]]
+        m = _DELETE_RE.search(statement)
+        if m:
+            self.relationships = [rel for rel in self.relationships if rel[0] != m.group(1)]
+            self._merged = dict((key, props) for (key, props) in self._merged.items()
+                                if key[0] != m.group(1))
+            return
+        raise UnknownStatement(statement)
+
+    def _add_source(self, node, sources, doc):
+        if sources is None:
+            node.pop("sources", None)
+        else:
+            node["sources"] = [s for s in sources if s != doc] + [doc]
+
+    def _detach_delete(self, key):
+        del self.nodes[key]
+        del self.labels[key]
+        uri = key[1]
+        self.relationships = [rel for rel in self.relationships if uri not in (rel[1], rel[2])]
+        self._merged = dict((k, props) for (k, props) in self._merged.items()
+                            if uri not in (k[1], k[2]))
+
+    def _node_labels(self):
+        return dict((uri, sorted(self.labels[(label, uri)])) for (label, uri) in self.nodes)
+
+    def _neighbours(self, label, rel_type, outgoing, uris):
+        labels = self._node_labels()
+        wanted = set(uri for uri in uris if self._find(label, uri))
+        rows = []
+        for (rtype, start, end, props) in self.relationships:
+            if rtype != rel_type:
+                continue
+            uri, other = (start, end) if outgoing else (end, start)
+            if uri in wanted:
+                rows.append({"uri": uri, "other": other, "labels": labels[other]})
+        return rows
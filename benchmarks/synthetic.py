@@ -0,0 +1,171 @@
+'''
+synthetic PROV templates and bindings for benchmarking provconv
+
+The generated templates only use constructs provconv supports and are
+fully deterministic, so that runs on different machines (or different
+revisions of provconv) expand exactly the same input.
+
+Template layout (for num_vars=n, link_depth=d, arity=k):
+
+    entity(var:e<i>, [ex:value='var:v<i>'])          for i in 0..n-1
+    entity(var:e<i>, [tmpl:linked='var:e<i-1>'])     inside a linked group
+    wasDerivedFrom(var:e<i>, var:e<i+1>, ...)        k consecutive variables
+
+Variables are partitioned into linked groups of d+1 consecutive entities
+(d=0: no tmpl:linked at all). Relations whose arguments span several
+groups are expanded as a cartesian product by provconv.set_rel, so arity
+and group depth directly control the size of the expanded document.
+
+Provides:
+
+- make_template(num_vars, link_depth, num_bundles, arity)
+- make_bindings(num_vars, num_values)
+- make_binding_doc(bind_dict)
+- make_case(...)
+- make_document(num_records, num_bundles)
+  an already expanded document of about num_records records (for the
+  neo4j loaders)
+
+'''
+
+import prov.model as prov
+
+
+VAR_NS = prov.Namespace("var", "http://openprovenance.org/var#")
+VARGEN_NS = prov.Namespace("vargen", "http://openprovenance.org/vargen#")
+TMPL_NS = prov.Namespace("tmpl", "http://openprovenance.org/tmpl#")
+EX_NS = prov.Namespace("ex", "http://example.com/bench#")
+
+# wasDerivedFrom has the largest number of formal attributes (5)
+MAX_ARITY = len(prov.PROV_REC_CLS[prov.PROV_DERIVATION].FORMAL_ATTRIBUTES)
+
+
+def _add_records(bundle, num_vars, link_depth, arity):
+    '''
+    add the synthetic template records to a document or bundle
+    '''
+    group_size = link_depth + 1
+    for i in range(num_vars):
+        attrs = [(EX_NS["value"], VAR_NS["v%d" % i])]
+        if i % group_size:
+            attrs.append((TMPL_NS["linked"], VAR_NS["e%d" % (i - 1)]))
+        bundle.entity(VAR_NS["e%d" % i], attrs)
+
+    for i in range(num_vars - arity + 1):
+        args = [VAR_NS["e%d" % (i + j)] for j in range(arity)]
+        bundle.wasDerivedFrom(*args)
+
+
+def make_template(num_vars=4, link_depth=0, num_bundles=1, arity=2):
+    '''
+    generate a synthetic PROV template
+
+    Args:
+        num_vars (int): number of entity variables (var:e0 .. var:e<n-1>)
+        link_depth (int): length of the tmpl:linked chain in each group
+        num_bundles (int): number of vargen: bundles (0: records on doc level)
+        arity (int): number of formal arguments per relation (2..5)
+    Returns:
+        template (ProvDocument)
+    '''
+    if arity < 2 or arity > MAX_ARITY:
+        raise ValueError("arity must be between 2 and %d" % MAX_ARITY)
+    if num_vars < arity:
+        raise ValueError("num_vars must be at least the relation arity")
+
+    template = prov.ProvDocument()
+    for ns in (VAR_NS, VARGEN_NS, TMPL_NS, EX_NS):
+        template.add_namespace(ns)
+
+    if num_bundles == 0:
+        _add_records(template, num_vars, link_depth, arity)
+    for b in range(num_bundles):
+        bundle = template.bundle(VARGEN_NS["bundle%d" % b])
+        _add_records(bundle, num_vars, link_depth, arity)
+    return template
+
+
+def make_bindings(num_vars=4, num_values=2):
+    '''
+    generate an instance dict for a template created by make_template
+
+    Every entity variable is bound to num_values identifiers, every attribute
+    variable to num_values literals (one per entity instance), so all
+    tmpl:linked groups have consistent sizes.
+
+    Returns:
+        bind_dict (dict): input for provconv.instantiate_template
+    '''
+    bind_dict = dict()
+    for i in range(num_vars):
+        ids = [EX_NS["e%d_%d" % (i, j)] for j in range(num_values)]
+        vals = ["value %d/%d" % (i, j) for j in range(num_values)]
+        if num_values == 1:
+            ids = ids[0]
+            vals = vals[0]
+        bind_dict["var:e%d" % i] = ids
+        bind_dict["var:v%d" % i] = vals
+    return bind_dict
+
+
+def make_binding_doc(bind_dict):
+    '''
+    convert an instance dict into a PROV bindings document in the
+    tmpl:value_<i> / tmpl:2dvalue_<i>_0 encoding read by provconv.read_binding
+    '''
+    doc = prov.ProvDocument()
+    for ns in (VAR_NS, TMPL_NS, EX_NS):
+        doc.add_namespace(ns)
+
+    for var in sorted(bind_dict):
+        vals = bind_dict[var]
+        if not isinstance(vals, list):
+            vals = [vals]
+        attrs = []
+        for idx, val in enumerate(vals):
+            if isinstance(val, prov.QualifiedName):
+                attrs.append((TMPL_NS["value_%d" % idx], val))
+            else:
+                attrs.append((TMPL_NS["2dvalue_%d_0" % idx], val))
+        doc.entity(var, attrs)
+    return doc
+
+
+def make_case(num_vars=4, link_depth=0, num_values=2, num_bundles=1, arity=2):
+    '''
+    generate a (template, bind_dict) pair
+    '''
+    return (make_template(num_vars, link_depth, num_bundles, arity),
+            make_bindings(num_vars, num_values))
+
+
+def case_name(num_vars, link_depth, num_values, num_bundles, arity):
+    return "v%d_d%d_n%d_b%d_a%d" % (num_vars, link_depth, num_values,
+                                    num_bundles, arity)
+
+
+def make_document(num_records=10000, num_bundles=0, num_agents=10):
+    '''
+    expanded PROV document of about num_records records: a chain of
+    entities generated by activities which used the previous entity,
+    each activity associated with one of num_agents agents (5 records per
+    step); with num_bundles > 0 the steps are spread over that many bundles
+    '''
+    doc = prov.ProvDocument()
+    doc.add_namespace(EX_NS)
+    targets = [doc]
+    if num_bundles:
+        targets = [doc.bundle(EX_NS["bundle%d" % b]) for b in range(num_bundles)]
+    for a in range(num_agents):
+        doc.agent(EX_NS["agent%d" % a])
+    for i in range(max(1, (num_records - num_agents) // 5)):
+        target = targets[i % len(targets)]
+        entity = EX_NS["e%d" % i]
+        activity = EX_NS["a%d" % i]
+        target.entity(entity, [(EX_NS["value"], i)])
+        target.activity(activity)
+        target.wasGeneratedBy(entity, activity)
+        if i:
+            target.used(activity, EX_NS["e%d" % (i - 1)])
+        target.wasAssociatedWith(activity, EX_NS["agent%d" % (i % num_agents)])
+    return doc
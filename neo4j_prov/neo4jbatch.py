@@ -0,0 +1,415 @@
+# batched neo4j loader for W3C prov documents: nodes and relationships are
+# grouped by label / type and written with parameterized UNWIND statements,
+# one explicit transaction per batch, instead of one graph.create round trip
+# per relationship
+
+"""
+=============================================
+W3C PROV / neo4j UNWIND batch loader
+=============================================
+
+Graph model: the one of neo4jcsv.py (PROV type and Element as node labels,
+properties label, URL and the key uri; one relationship per prov relation), with the
+record attributes as typed properties of the nodes and relationships
+(neo4jcsv.record_properties, keyed by qualified name, e.g. prov:startTime,
+ex:value): qualified names as uris, numbers and booleans as such and
+datetimes as neo4j datetimes, set by the same UNWIND statements. Further
+element arguments of n-ary relations (the activity of a derivation, the
+plan of an association ...) become role relationships from the start node,
+typed after the role (prov:activity, prov:plan ...), with the rel_key of
+the main relationship; see relation_rows.
+
+Loading runs in two passes over the document: first all elements, then
+all relations, so every relationship endpoint exists when its batch is
+written. Uris only referenced by relations get a node labelled after their
+role (see neo4jcsv.ROLE_LABELS). Relationships are grouped by type;
+both endpoints are found by index seeks on the uri uniqueness constraint
+of the label Element (neo4jcsv.KEY_LABEL) every node carries, created
+before loading together with those of the PROV type labels.
+
+Upsert mode (upsert=True) makes loads idempotent across documents and
+runs: nodes are MERGEd on their Element uri (backed by the uniqueness
+constraint), so a uri first merged with a role label and declared later
+with another PROV type is one node with both labels; element nodes get
+their PROV type label and their properties updated, nodes merged for a
+relationship endpoint only get the role label and properties when they
+are new. Merged nodes drop the sources list of provsync.py, so a document
+sync never deletes a node loaded here. Relationships are MERGEd between their
+endpoints, so relations of one type between the same two nodes end up as
+one relationship. Uris merged before in the same run are kept in a
+bounded LRU (cache_size) together with their label; further relationship
+endpoints and element records without attributes, e.g. shared datasets or
+agents in the next document, send no row at all. Element records with
+attributes are always sent, their properties are added to the node.
+Uris evicted from the LRU are merged again when they show up next.
+
+Streams of records (e.g. provstream.iter_records on files too big for a
+ProvDocument) are loaded in one pass with load_records, in upsert mode:
+a uri referenced by a relation before its element record is merged with
+its role label and gets the element properties when the record arrives.
+The records can also be converted elsewhere (record_rows, plain tuples,
+e.g. in worker processes, see provingest.py) and the rows of many files
+buffered into one loader with add_rows.
+
+The graph object only needs begin() -> transaction with run(statement,
+parameters) and commit(), and run(statement) for the index statements:
+a py2neo Graph, or the in-process stand-in of benchmarks/recordinggraph.py.
+
+Usage:
+
+     loader = neo4jbatch.BatchLoader(Graph(), batch_size=10000)
+     stats = loader.load(prov_doc)
+
+     loader = neo4jbatch.BatchLoader(Graph(), upsert=True)
+     for doc in docs:
+         loader.load(doc)
+
+"""
+
+import hashlib
+import datetime
+import collections
+
+import six
+
+import provbin
+from neo4jcsv import (node_label, node_labels, type_label, csv_value, schema_statements,
+                      record_properties, role_arguments, ROLE_LABELS, GENERIC_LABEL, KEY_LABEL)
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_CACHE_SIZE = 100000
+
+# kinds of record_rows
+NODE_ROW = "node"
+REL_ROW = "rel"
+
+NODE_STATEMENT = u"UNWIND {rows} AS row CREATE (n%s) SET n = row.props%s"
+REL_STATEMENT = (u"UNWIND {rows} AS row "
+                 u"MATCH (a:`%s` {uri: row.start}), (b:`%s` {uri: row.end}) "
+                 u"CREATE (a)-[r:`%%s`]->(b) SET r = row.props%%s" % (KEY_LABEL, KEY_LABEL))
+# merged nodes leave the provsync sources bookkeeping: a sync never deletes them
+NODE_MERGE_STATEMENT = (u"UNWIND {rows} AS row MERGE (n:`%s` {uri: row.uri}) "
+                        u"SET %%sn += row.props%%s REMOVE n.sources" % KEY_LABEL)
+# relationship endpoints: the role label and properties only for new nodes
+NODE_REFERENCE_STATEMENT = (u"UNWIND {rows} AS row MERGE (n:`%s` {uri: row.uri}) "
+                            u"ON CREATE SET %%sn += row.props%%s REMOVE n.sources" % KEY_LABEL)
+REL_MERGE_STATEMENT = (u"UNWIND {rows} AS row "
+                       u"MATCH (a:`%s` {uri: row.start}), (b:`%s` {uri: row.end}) "
+                       u"MERGE (a)-[r:`%%s`]->(b) SET r += row.props%%s" % (KEY_LABEL, KEY_LABEL))
+# datetime properties are sent as ISO text and converted by the statement
+TIME_ASSIGNMENT = u", %s.`%s` = datetime(row.times.`%s`)"
+
+
+def time_assignments(var, times):
+    return u"".join(TIME_ASSIGNMENT % (var, key, key) for key in times)
+
+
+def label_assignments(var, label):
+    '''
+    SET items adding the labels of a node merged on the key label
+    '''
+    return u"".join(u"%s:`%s`, " % (var, l) for l in node_labels(label)[1:])
+
+
+def node_statement(label, upsert=False, times=(), referenced=False):
+    if upsert:
+        statement = NODE_REFERENCE_STATEMENT if referenced else NODE_MERGE_STATEMENT
+        return statement % (label_assignments("n", label), time_assignments("n", times))
+    return NODE_STATEMENT % (u"".join(u":`%s`" % l for l in node_labels(label)),
+                             time_assignments("n", times))
+
+
+def rel_statement(rel_type, upsert=False, times=()):
+    return (REL_MERGE_STATEMENT if upsert else REL_STATEMENT) % (
+        rel_type, time_assignments("r", times))
+
+
+def typed_row(row, props):
+    '''
+    add props to a statement row: datetimes as ISO text in row["times"]
+    (lists of datetimes stay text), the others in row["props"]
+
+    Returns:
+        (row, sorted keys of the datetime properties)
+    '''
+    plain = {}
+    times = {}
+    for key, value in props.items():
+        if isinstance(value, datetime.datetime):
+            times[key] = value.isoformat()
+        elif isinstance(value, list) and value and isinstance(value[0], datetime.datetime):
+            plain[key] = [v.isoformat() for v in value]
+        else:
+            plain[key] = value
+    row["props"] = plain
+    if times:
+        row["times"] = times
+    return row, tuple(sorted(times))
+
+
+def rel_properties(rec):
+    '''
+    relationship properties: URL (identifier uri, if any) and the typed
+    attributes except the relationship endpoints and role arguments
+    (neo4jcsv.record_properties)
+    '''
+    formal = rec.formal_attributes
+    skip = set([formal[0][0], formal[1][0]] + [name for (name, value) in role_arguments(rec)])
+    props = record_properties(rec, skip)
+    if rec.identifier is not None:
+        props["URL"] = csv_value(rec.identifier)
+    return props
+
+
+class URICache(object):
+    '''
+    LRU map uri -> node label of at most capacity entries
+    '''
+
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()
+
+    def get(self, uri, default=None):
+        label = self._entries.pop(uri, None)
+        if label is None:
+            return default
+        self._entries[uri] = label
+        return label
+
+    def __contains__(self, uri):
+        return self.get(uri) is not None
+
+    def __setitem__(self, uri, label):
+        self._entries.pop(uri, None)
+        self._entries[uri] = label
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def pop(self, uri, default=None):
+        return self._entries.pop(uri, default)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class BatchLoader(object):
+    '''
+    Args:
+        graph: py2neo Graph (or benchmarks/recordinggraph.RecordingGraph)
+        batch_size (int): rows per UNWIND statement / transaction
+        create_schema (bool): create the uri uniqueness constraint of every
+            label before its first nodes are written
+        upsert (bool): MERGE instead of CREATE (see module doc)
+        cache_size (int): LRU size of known uris in upsert mode
+    '''
+
+    def __init__(self, graph, batch_size=DEFAULT_BATCH_SIZE, create_schema=True, upsert=False,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.create_schema = create_schema
+        self.upsert = upsert
+        self._schema = set()
+        self._buffers = {}       # statement -> rows
+        self._node_buffers = set()
+        # uri -> node label of the nodes written (in upsert mode only the recent ones)
+        self._labels = URICache(cache_size) if upsert else {}
+        # uri -> label of nodes merged for a relation before their element record
+        self._referenced = URICache(cache_size) if upsert else None
+        self.stats = {"nodes": 0, "relationships": 0, "batches": 0, "known": 0}
+
+    def _constrain(self, label):
+        if self.create_schema and label not in self._schema:
+            self._schema.add(label)
+            for statement in schema_statements([label]):
+                self.graph.run(statement)
+
+    def _add(self, statement, row, kind):
+        rows = self._buffers.get(statement)
+        if rows is None:
+            rows = self._buffers[statement] = []
+            if kind == "nodes":
+                self._node_buffers.add(statement)
+        rows.append(row)
+        self.stats[kind] += 1
+        if len(rows) >= self.batch_size:
+            self._write(statement)
+
+    def _write(self, statement):
+        rows = self._buffers.pop(statement, None)
+        if not rows:
+            return
+        if statement in self._node_buffers:
+            self._node_buffers.discard(statement)
+        else:
+            # relationship endpoints must exist before the relationships
+            for pending in list(self._node_buffers):
+                self._write(pending)
+        tx = self.graph.begin()
+        tx.run(statement, {"rows": rows})
+        tx.commit()
+        self.stats["batches"] += 1
+
+    def flush(self):
+        for statement in list(self._node_buffers) + list(self._buffers):
+            self._write(statement)
+
+    def _node(self, uri, label, text, props=None, referenced=False):
+        self._labels[uri] = label
+        for l in node_labels(label):
+            self._constrain(l)
+        uri = six.text_type(uri)
+        row, times = typed_row({"uri": uri}, dict(props or {}, label=text, URL=uri, uri=uri))
+        self._add(node_statement(label, self.upsert, times, referenced), row, "nodes")
+
+    def _element(self, uri, label, text, props=None):
+        if self._referenced is not None and self._referenced.pop(uri) is not None:
+            # merged as a relationship endpoint only so far
+            self._node(uri, label, text, props)
+        elif uri not in self._labels or (self.upsert and props):
+            self._node(uri, label, text, props)
+        else:
+            # nothing to write for a bare mention of a known uri
+            self.stats["known"] += 1
+
+    def _endpoint(self, endpoint):
+        uri, role_label, text = endpoint
+        if uri not in self._labels:
+            self._node(uri, role_label, text, referenced=True)
+            if self._referenced is not None:
+                self._referenced[uri] = role_label
+
+    def _relation(self, rel_type, start, end, props):
+        self._endpoint(start)
+        self._endpoint(end)
+        row, times = typed_row({"start": six.text_type(start[0]), "end": six.text_type(end[0])},
+                               props)
+        self._add(rel_statement(rel_type, self.upsert, times), row, "relationships")
+
+    def load(self, prov_doc):
+        '''
+        write all records of a ProvDocument (incl. bundles)
+
+        Returns:
+            dict with the numbers of nodes, relationships and batches written
+            (totals of all load calls) and of element mentions skipped as
+            already known
+        '''
+        relations = False
+        bundles = set()
+        for (bundle_id, rec) in provbin.iter_doc_records(prov_doc):
+            if bundle_id is not None and bundle_id not in bundles:
+                bundles.add(bundle_id)
+                self._element(bundle_id.uri, "Bundle", '"%s"' % six.text_type(bundle_id), {})
+            if rec.is_element():
+                self._element(rec.identifier.uri, type_label(rec.get_type()), node_label(rec),
+                              record_properties(rec))
+            else:
+                relations = True
+
+        if relations:
+            for (bundle_id, rec) in provbin.iter_doc_records(prov_doc):
+                if not rec.is_element():
+                    for row in relation_rows(rec):
+                        self._relation(*row[1:])
+        self.flush()
+        return dict(self.stats)
+
+    def load_records(self, records):
+        '''
+        write (bundle_id, record) tuples in a single pass (upsert mode only),
+        e.g. provstream.iter_records(filename, "xml")
+
+        Returns:
+            dict of statistics, see load
+        '''
+        self.add_rows(record_rows(records))
+        self.flush()
+        return dict(self.stats)
+
+    def add_rows(self, rows):
+        '''
+        buffer the rows of record_rows (upsert mode only); written when a
+        batch is full or on flush
+        '''
+        if not self.upsert:
+            raise ValueError("loading a record stream needs upsert=True")
+        for row in rows:
+            if row[0] == NODE_ROW:
+                self._element(*row[1:])
+            else:
+                self._relation(*row[1:])
+
+    def discard(self):
+        '''
+        drop the buffered rows and forget the known uris (after a failed
+        write, whose nodes may be missing in the graph)
+        '''
+        self._buffers = {}
+        self._node_buffers = set()
+        for cache in (self._labels, self._referenced):
+            if cache is not None:
+                cache.clear()
+
+
+def relation_rows(rec):
+    '''
+    rows of a prov relation: (REL_ROW, type, start, end, properties) from
+    its first to its second formal argument, start / end = (uri, label if
+    not loaded before, node label property); for n-ary relations also one
+    role relationship from the start to every further element argument
+    (type: the role, e.g. prov:activity, properties relation and rel_key,
+    the key of the main relationship: its URL or a hash of its arguments).
+    [] for relations with too few elements (same as gen_graph_model)
+    '''
+    formal = rec.formal_attributes
+    if len(formal) < 2 or formal[0][1] is None or formal[1][1] is None:
+        return []
+    rel_type = rec.get_type()._str
+    start = _endpoint_row(formal[0])
+    props = rel_properties(rec)
+    rows = [(REL_ROW, rel_type, start, _endpoint_row(formal[1]), props)]
+    roles = role_arguments(rec)
+    if roles:
+        key = props.get("URL")
+        if key is None:
+            args = u" ".join(u"%s=%s" % (name, csv_value(value)) for (name, value) in formal)
+            key = six.text_type(hashlib.sha1((rel_type + u" " + args).encode("utf8")).hexdigest())
+        props["rel_key"] = key
+        for role in roles:
+            rows.append((REL_ROW, six.text_type(role[0]), start, _endpoint_row(role),
+                         {"relation": rel_type, "rel_key": key}))
+    return rows
+
+
+def _endpoint_row(formal):
+    role, qname = formal
+    return (qname.uri, ROLE_LABELS.get(role, GENERIC_LABEL), '"%s"' % six.text_type(qname))
+
+
+def record_rows(records):
+    '''
+    plain rows (tuples of strings and dicts, picklable) for a stream of
+    (bundle_id, record) tuples, in stream order: (NODE_ROW, uri, label,
+    node label property, typed properties) for bundles and elements,
+    relation_rows for relations; see BatchLoader.add_rows
+    '''
+    last_bundle = None
+    for (bundle_id, rec) in records:
+        if bundle_id is not None and bundle_id != last_bundle:
+            last_bundle = bundle_id
+            yield (NODE_ROW, bundle_id.uri, "Bundle", '"%s"' % six.text_type(bundle_id), {})
+        if rec.is_element():
+            yield (NODE_ROW, rec.identifier.uri, type_label(rec.get_type()), node_label(rec),
+                   record_properties(rec))
+        else:
+            for row in relation_rows(rec):
+                yield row
+
+
+def load_document(graph, prov_doc, batch_size=DEFAULT_BATCH_SIZE, upsert=False):
+    return BatchLoader(graph, batch_size, upsert=upsert).load(prov_doc)
@@ -0,0 +1,381 @@
+# neo4j bulk import (neo4j-admin import) CSV files for W3C prov records
+# written while records are produced (e.g. as record sink of the template
+# expansion, see provconv.RecordSink) so that big provenance loads skip both
+# the intermediate prov document and the transactional Cypher path
+
+"""
+=============================================
+W3C PROV / neo4j-admin import CSV writer
+=============================================
+
+Graph model (as generated by provio.gen_graph_model):
+
+* one node per prov element, properties label, URL and uri (both the
+  identifier uri; uri is the key with a uniqueness constraint per label,
+  see schema_statements); the PROV type (Entity, Activity, Agent, Bundle
+  ...) is the node label, next to the label Element (KEY_LABEL) every
+  node carries
+* nodes are deduplicated by uri; uris referenced by relations only get a
+  node labelled after the role they are referenced in (e.g. prov:agent ->
+  Agent)
+* one relationship per prov relation from its first to its second formal
+  argument, type rec.get_type() (e.g. prov:Derivation); the remaining formal
+  arguments (activity, generation, time ...) become relationship properties
+
+The loaders (neo4jbatch.py, provsync.py) also store the attributes of the
+records as typed properties (record_properties) and the further element
+arguments of n-ary relations as role relationships (role_arguments); the
+CSV files keep the columns above.
+
+Files: nodes_<Label>.csv and rels_<type>.csv in the output directory
+(.csv.gz with compress=True, neo4j-admin import reads them as they are).
+Every file starts with its header line. Rows are written as records
+arrive; the writer keeps only the uri -> node id map in memory.
+neo4j-admin import does not create schema: run writer.schema_statements()
+once the import is done.
+
+Usage:
+
+     writer = neo4jcsv.Neo4jCSVWriter("import_dir")
+     provconv.instantiate_template(template, bindings, sink=writer)
+     writer.close()
+     # neo4j-admin import <writer.import_args()>
+
+"""
+
+import os
+import io
+import csv
+import gzip
+import datetime
+
+import six
+from prov.model import (
+    Identifier, PROV_ATTR_ENTITY, PROV_ATTR_ACTIVITY,
+    PROV_ATTR_TRIGGER, PROV_ATTR_INFORMED, PROV_ATTR_INFORMANT, PROV_ATTR_STARTER,
+    PROV_ATTR_ENDER, PROV_ATTR_AGENT, PROV_ATTR_PLAN, PROV_ATTR_DELEGATE,
+    PROV_ATTR_RESPONSIBLE, PROV_ATTR_GENERATED_ENTITY, PROV_ATTR_USED_ENTITY,
+    PROV_ATTR_SPECIFIC_ENTITY, PROV_ATTR_GENERAL_ENTITY, PROV_ATTR_ALTERNATE1,
+    PROV_ATTR_ALTERNATE2, PROV_ATTR_COLLECTION, PROV_ATTR_BUNDLE
+)
+
+from prov.model import Literal, parse_xsd_datetime
+from prov.constants import (
+    XSD_INT, XSD_INTEGER, XSD_LONG, XSD_SHORT, XSD_BYTE, XSD_NONNEGATIVEINTEGER,
+    XSD_NONPOSITIVEINTEGER, XSD_NEGATIVEINTEGER, XSD_POSITIVEINTEGER, XSD_UNSIGNEDINT,
+    XSD_UNSIGNEDLONG, XSD_UNSIGNEDSHORT, XSD_UNSIGNEDBYTE, XSD_FLOAT, XSD_DOUBLE,
+    XSD_DECIMAL, XSD_BOOLEAN, XSD_DATETIME
+)
+
+import provbin
+
+NODE_HEADER = ["id:ID", "label", "URL", "uri", ":LABEL"]
+REL_HEADER = [":START_ID", ":END_ID", ":TYPE", "URL"]
+
+# node key property
+KEY_PROPERTY = "uri"
+# label of nodes which are only referenced by relations
+GENERIC_LABEL = "Element"
+# label of every node (with the uri uniqueness constraint): a uri is one node
+# whatever PROV type it is first seen with, relationships find their endpoints
+# by it
+KEY_LABEL = GENERIC_LABEL
+PROV_LABELS = ("Entity", "Activity", "Agent", "Bundle", GENERIC_LABEL)
+CONSTRAINT_STATEMENT = u"CREATE CONSTRAINT ON (n:`%s`) ASSERT n.%s IS UNIQUE"
+ROLE_LABELS = {
+    PROV_ATTR_ENTITY: "Entity", PROV_ATTR_GENERATED_ENTITY: "Entity",
+    PROV_ATTR_USED_ENTITY: "Entity", PROV_ATTR_SPECIFIC_ENTITY: "Entity",
+    PROV_ATTR_GENERAL_ENTITY: "Entity", PROV_ATTR_ALTERNATE1: "Entity",
+    PROV_ATTR_ALTERNATE2: "Entity", PROV_ATTR_COLLECTION: "Entity",
+    PROV_ATTR_TRIGGER: "Entity", PROV_ATTR_PLAN: "Entity",
+    PROV_ATTR_ACTIVITY: "Activity", PROV_ATTR_INFORMED: "Activity",
+    PROV_ATTR_INFORMANT: "Activity", PROV_ATTR_STARTER: "Activity",
+    PROV_ATTR_ENDER: "Activity",
+    PROV_ATTR_AGENT: "Agent", PROV_ATTR_DELEGATE: "Agent",
+    PROV_ATTR_RESPONSIBLE: "Agent",
+    PROV_ATTR_BUNDLE: "Bundle",
+}
+
+
+def node_label(record):
+    '''
+    label property of an element node (same text as gen_graph_model)
+    '''
+    if record.label == record.identifier:
+        return '"%s"' % six.text_type(record.label)
+    return six.text_type(record.label) + ',' + six.text_type(record.identifier)
+
+
+def node_labels(label):
+    '''
+    labels of a node of PROV type label: KEY_LABEL and the type label
+    '''
+    return [KEY_LABEL] if label == KEY_LABEL else [KEY_LABEL, label]
+
+
+def type_label(rec_type):
+    '''
+    neo4j label for a prov record type (prov:Entity -> Entity)
+    '''
+    return rec_type.localpart
+
+
+def schema_statements(labels=PROV_LABELS):
+    '''
+    Cypher statements creating the uniqueness constraints (and with them
+    the indexes) on the uri of the given node labels
+    '''
+    return [CONSTRAINT_STATEMENT % (label, KEY_PROPERTY) for label in labels]
+
+
+def csv_value(value):
+    if value is None:
+        return u""
+    if isinstance(value, Identifier):
+        return six.text_type(value.uri)
+    if isinstance(value, datetime.datetime):
+        return six.text_type(value.isoformat())
+    return six.text_type(value)
+
+
+INTEGER_TYPES = frozenset([
+    XSD_INT, XSD_INTEGER, XSD_LONG, XSD_SHORT, XSD_BYTE, XSD_NONNEGATIVEINTEGER,
+    XSD_NONPOSITIVEINTEGER, XSD_NEGATIVEINTEGER, XSD_POSITIVEINTEGER, XSD_UNSIGNEDINT,
+    XSD_UNSIGNEDLONG, XSD_UNSIGNEDSHORT, XSD_UNSIGNEDBYTE])
+FLOAT_TYPES = frozenset([XSD_FLOAT, XSD_DOUBLE, XSD_DECIMAL])
+
+
+def property_value(value):
+    '''
+    neo4j property value of a prov attribute value: qualified names as
+    their uri, numbers, booleans and datetimes as they are, Literals
+    converted after their xsd datatype (text if that fails), anything else
+    as text
+    '''
+    if isinstance(value, Identifier):
+        return six.text_type(value.uri)
+    if isinstance(value, (bool, float, datetime.datetime) + six.integer_types):
+        return value
+    if isinstance(value, Literal):
+        datatype = value.datatype
+        try:
+            if datatype in INTEGER_TYPES:
+                return int(value.value)
+            if datatype in FLOAT_TYPES:
+                return float(value.value)
+            if datatype == XSD_BOOLEAN:
+                return value.value.strip().lower() in ("true", "1")
+            if datatype == XSD_DATETIME:
+                return parse_xsd_datetime(value.value)
+        except (ValueError, TypeError):
+            pass
+        return six.text_type(value.value)
+    return six.text_type(value)
+
+
+def _text(value):
+    if isinstance(value, datetime.datetime):
+        return six.text_type(value.isoformat())
+    return six.text_type(value)
+
+
+def record_properties(rec, skip=()):
+    '''
+    typed properties (property_value) of the attributes of a record, keyed
+    by the qualified name (e.g. prov:startTime, prov:type, ex:value);
+    attributes with several values become sorted lists (of text if the
+    values have different types, neo4j arrays are homogeneous)
+
+    Args:
+        skip: attribute names left out (e.g. the relationship endpoints)
+    '''
+    props = {}
+    for name, value in rec.attributes:
+        if value is None or name in skip:
+            continue
+        key = six.text_type(name)
+        value = property_value(value)
+        if key not in props:
+            props[key] = value
+        elif isinstance(props[key], list):
+            props[key].append(value)
+        else:
+            props[key] = [props[key], value]
+    for key, value in props.items():
+        if isinstance(value, list):
+            if len(set(type(v) for v in value)) > 1:
+                value = [_text(v) for v in value]
+            # attribute values are sets: a stable order
+            props[key] = sorted(value)
+    return props
+
+
+def role_arguments(rec):
+    '''
+    (role, qualified name) of the element arguments of a relation after the
+    first two (e.g. the activity of a derivation, the plan of an
+    association); references to other relations (prov:generation,
+    prov:usage) stay properties
+    '''
+    return [(name, value) for (name, value) in rec.formal_attributes[2:]
+            if value is not None and name in ROLE_LABELS]
+
+
+def _safe_name(name):
+    return name.replace(":", "_").replace("/", "_")
+
+
+class _CSVFile(object):
+
+    def __init__(self, filename, header, compress=False):
+        if compress:
+            filename += ".gz"
+        self.filename = filename
+        if six.PY2:
+            self._file = gzip.open(filename, "wb") if compress else open(filename, "wb")
+        elif compress:
+            self._file = io.TextIOWrapper(gzip.open(filename, "wb"), newline="", encoding="utf8")
+        else:
+            self._file = open(filename, "w", newline="", encoding="utf8")
+        self._writer = csv.writer(self._file)
+        self.rows = 0
+        self._write(header)
+
+    def _write(self, values):
+        if six.PY2:
+            values = [v.encode("utf8") for v in values]
+        self._writer.writerow(values)
+
+    def write(self, values):
+        self._write(values)
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class Neo4jCSVWriter(object):
+    '''
+    record handler writing neo4j-admin import CSV files
+
+    Implements add_record(record, bundle_id) (the provconv.RecordSink
+    handler interface); only the uri -> node id map is kept in memory.
+
+    Args:
+        outdir (str): output directory (created if missing)
+        compress (bool): write gzip compressed files
+    '''
+
+    def __init__(self, outdir, compress=False):
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        self.outdir = outdir
+        self.compress = compress
+        self.node_ids = {}
+        self._pending = {}      # referenced, not (yet) declared: uri -> (qname, label)
+        self._node_files = {}
+        self._rel_files = {}
+
+    def _node_file(self, label):
+        f = self._node_files.get(label)
+        if f is None:
+            f = self._node_files[label] = _CSVFile(
+                os.path.join(self.outdir, "nodes_%s.csv" % _safe_name(label)), NODE_HEADER,
+                self.compress)
+        return f
+
+    def _rel_file(self, rec):
+        rel_type = rec.get_type()
+        f = self._rel_files.get(rel_type)
+        if f is None:
+            extra = [attr.localpart for attr in rec.FORMAL_ATTRIBUTES[2:]]
+            f = self._rel_files[rel_type] = _CSVFile(
+                os.path.join(self.outdir, "rels_%s.csv" % _safe_name(rel_type._str)),
+                REL_HEADER + extra, self.compress)
+        return f
+
+    def _declare(self, qname, label, text):
+        '''
+        write the node for qname unless it was written before
+        '''
+        uri = qname.uri
+        node_id = self.node_ids.get(uri)
+        if node_id is None:
+            node_id = self.node_ids[uri] = len(self.node_ids)
+        elif uri in self._pending:
+            del self._pending[uri]
+        else:
+            return node_id
+        self._node_file(label).write([six.text_type(node_id), text, six.text_type(uri),
+                                      six.text_type(uri), ";".join(node_labels(label))])
+        return node_id
+
+    def _reference(self, qname, role):
+        uri = qname.uri
+        node_id = self.node_ids.get(uri)
+        if node_id is None:
+            node_id = self.node_ids[uri] = len(self.node_ids)
+            self._pending[uri] = (qname, ROLE_LABELS.get(role, GENERIC_LABEL))
+        return node_id
+
+    def add_record(self, rec, bundle_id=None):
+        if bundle_id is not None:
+            self._declare(bundle_id, "Bundle", '"%s"' % six.text_type(bundle_id))
+        if rec.is_element():
+            self._declare(rec.identifier, type_label(rec.get_type()), node_label(rec))
+            return
+        formal = rec.formal_attributes
+        if len(formal) < 2 or formal[0][1] is None or formal[1][1] is None:
+            # too few elements for a relationship (same as gen_graph_model)
+            return
+        start = self._reference(formal[0][1], formal[0][0])
+        end = self._reference(formal[1][1], formal[1][0])
+        row = [six.text_type(start), six.text_type(end), rec.get_type()._str,
+               csv_value(rec.identifier)]
+        row.extend(csv_value(value) for (name, value) in formal[2:])
+        self._rel_file(rec).write(row)
+
+    def add_document(self, prov_doc):
+        '''
+        write all records of an existing ProvDocument (incl. bundles)
+        '''
+        self.add_records(provbin.iter_doc_records(prov_doc))
+
+    def add_records(self, records):
+        '''
+        write a stream of (bundle_id, record) tuples, e.g.
+        provstream.iter_records(filename, "xml")
+        '''
+        for (bundle_id, rec) in records:
+            self.add_record(rec, bundle_id)
+
+    def close(self):
+        '''
+        write nodes which were only referenced by relations and close the files
+        '''
+        for uri, (qname, label) in self._pending.items():
+            self._node_file(label).write([six.text_type(self.node_ids[uri]),
+                                          '"%s"' % six.text_type(qname),
+                                          six.text_type(uri), six.text_type(uri),
+                                          ";".join(node_labels(label))])
+        self._pending = {}
+        for f in list(self._node_files.values()) + list(self._rel_files.values()):
+            f.close()
+
+    def schema_statements(self):
+        '''
+        Returns:
+            constraint statements for the labels written (run them after
+            the import)
+        '''
+        return schema_statements(sorted(set(self._node_files) | set([KEY_LABEL])))
+
+    def import_args(self):
+        '''
+        Returns:
+            list of neo4j-admin import arguments for the written files
+        '''
+        args = ["--id-type=INTEGER", "--multiline-fields=true"]
+        args.extend("--nodes=" + f.filename for f in self._node_files.values())
+        args.extend("--relationships=" + f.filename for f in self._rel_files.values())
+        return args
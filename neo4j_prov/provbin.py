@@ -0,0 +1,378 @@
+# compact binary intermediate format for W3C prov documents
+# used to hand expanded provenance between pipeline stages
+# (template expansion -> neo4j load -> archival) without re-parsing
+# PROV-N/XML/RDF text at every hop
+
+"""
+=============================================
+PROVBIN: binary serialization of prov documents
+=============================================
+
+Layout (all integers little endian):
+
+* header: magic, counts and offsets of the tables below
+* string table: offsets + one utf8 blob, every string stored once
+* namespace table: (prefix, uri) string ids
+* qname table: (namespace id, localpart string id)
+* record index: byte offset of every record (random access)
+* records: type code, bundle qname, identifier qname, attributes
+  (attribute name qname, value tag, value)
+
+Readers map the file and decode only what is asked for: single records
+(ProvBinReader.record), all records as tuples (iter_records) or a full
+ProvDocument (to_document / read).
+
+Usage:
+
+     from neo4j_prov import provbin
+     provbin.write(prov_doc, "expanded.provbin")
+     prov_doc = provbin.read("expanded.provbin")
+
+"""
+
+import mmap
+import struct
+import datetime
+
+import six
+from prov.model import (
+    ProvDocument, Literal, Namespace, QualifiedName, Identifier, PROV_REC_CLS,
+    parse_xsd_datetime
+)
+from prov.constants import (
+    PROV_ACTIVITY, PROV_AGENT, PROV_ALTERNATE, PROV_ASSOCIATION, PROV_ATTRIBUTION,
+    PROV_COMMUNICATION, PROV_DELEGATION, PROV_DERIVATION, PROV_END, PROV_ENTITY,
+    PROV_GENERATION, PROV_INFLUENCE, PROV_INVALIDATION, PROV_MEMBERSHIP, PROV_MENTION,
+    PROV_SPECIALIZATION, PROV_START, PROV_USAGE
+)
+
+# bump FORMAT_VERSION whenever RECORD_TYPES or the layout changes
+FORMAT_VERSION = 1
+MAGIC_PREFIX = b"PROVBIN"
+MAGIC = MAGIC_PREFIX + six.int2byte(FORMAT_VERSION)
+
+_HEADER = struct.Struct("<8sIIIIIQQQQ")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_REC_HEAD = struct.Struct("<BIIH")
+_TAG_U32 = struct.Struct("<BI")
+_TAG_I64 = struct.Struct("<Bq")
+_TAG_F64 = struct.Struct("<Bd")
+_TAG_BOOL = struct.Struct("<BB")
+_TAG_LITERAL = struct.Struct("<BIII")
+
+NONE = 0xFFFFFFFF
+
+# record type codes: the index in this tuple. Never reorder it; new types
+# are appended together with a FORMAT_VERSION bump
+RECORD_TYPES = (
+    PROV_ACTIVITY, PROV_AGENT, PROV_ALTERNATE, PROV_ASSOCIATION, PROV_ATTRIBUTION,
+    PROV_COMMUNICATION, PROV_DELEGATION, PROV_DERIVATION, PROV_END, PROV_ENTITY,
+    PROV_GENERATION, PROV_INFLUENCE, PROV_INVALIDATION, PROV_MEMBERSHIP, PROV_MENTION,
+    PROV_SPECIALIZATION, PROV_START, PROV_USAGE,
+)
+_RECORD_CODES = dict((t, i) for (i, t) in enumerate(RECORD_TYPES))
+
+# value tags
+T_QNAME, T_STR, T_INT, T_FLOAT, T_BOOL, T_DATETIME, T_LITERAL, T_URI, T_BIGINT = range(9)
+
+
+class ProvBinException(Exception):
+    pass
+
+
+#---------------------------------------------------------------
+# writer
+
+class _Tables(object):
+
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.namespaces = []
+        self.namespace_ids = {}
+        self.qnames = []
+        self.qname_ids = {}
+
+    def string(self, s):
+        if s is None:
+            return NONE
+        s = six.text_type(s)
+        sid = self.string_ids.get(s)
+        if sid is None:
+            sid = self.string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return sid
+
+    def namespace(self, ns):
+        key = (ns.prefix, ns.uri)
+        nid = self.namespace_ids.get(key)
+        if nid is None:
+            nid = self.namespace_ids[key] = len(self.namespaces)
+            self.namespaces.append((self.string(ns.prefix), self.string(ns.uri)))
+        return nid
+
+    def qname(self, qn):
+        if qn is None:
+            return NONE
+        qid = self.qname_ids.get(qn)
+        if qid is None:
+            qid = self.qname_ids[qn] = len(self.qnames)
+            self.qnames.append((self.namespace(qn.namespace), self.string(qn.localpart)))
+        return qid
+
+
+def _encode_value(tables, value):
+    if isinstance(value, QualifiedName):
+        return _TAG_U32.pack(T_QNAME, tables.qname(value))
+    if isinstance(value, Identifier):
+        return _TAG_U32.pack(T_URI, tables.string(value.uri))
+    if isinstance(value, bool):
+        return _TAG_BOOL.pack(T_BOOL, int(value))
+    if isinstance(value, six.integer_types):
+        if -2 ** 63 <= value < 2 ** 63:
+            return _TAG_I64.pack(T_INT, value)
+        return _TAG_U32.pack(T_BIGINT, tables.string(str(value)))
+    if isinstance(value, float):
+        return _TAG_F64.pack(T_FLOAT, value)
+    if isinstance(value, datetime.datetime):
+        return _TAG_U32.pack(T_DATETIME, tables.string(value.isoformat()))
+    if isinstance(value, Literal):
+        return _TAG_LITERAL.pack(T_LITERAL, tables.string(value.value),
+                                 tables.qname(value.datatype), tables.string(value.langtag))
+    return _TAG_U32.pack(T_STR, tables.string(value))
+
+
+def iter_doc_records(prov_doc):
+    '''
+    yields (bundle identifier or None, record) for the document level
+    records and the records of all bundles
+    '''
+    for rec in prov_doc.get_records():
+        yield (None, rec)
+    for bundle in prov_doc.bundles:
+        for rec in bundle.get_records():
+            yield (bundle.identifier, rec)
+
+
+def dumps(prov_doc):
+    '''
+    serialize a ProvDocument into a PROVBIN byte string
+    '''
+    tables = _Tables()
+    # register the document namespaces first so that they are restored
+    # with their prefixes
+    for ns in prov_doc.namespaces:
+        tables.namespace(ns)
+
+    records = []
+    for (bundle_id, rec) in iter_doc_records(prov_doc):
+        attrs = rec.attributes
+        if len(attrs) > 0xFFFF:
+            raise ProvBinException("too many attributes in record " + six.text_type(rec.identifier))
+        code = _RECORD_CODES.get(rec.get_type())
+        if code is None:
+            raise ProvBinException("record type %s not supported by PROVBIN version %d"
+                                   % (rec.get_type(), FORMAT_VERSION))
+        parts = [_REC_HEAD.pack(code, tables.qname(bundle_id),
+                                tables.qname(rec.identifier), len(attrs))]
+        for (name, value) in attrs:
+            parts.append(_U32.pack(tables.qname(name)))
+            parts.append(_encode_value(tables, value))
+        records.append(b"".join(parts))
+
+    blobs = [s.encode("utf8") for s in tables.strings]
+    str_offsets = [0]
+    for b in blobs:
+        str_offsets.append(str_offsets[-1] + len(b))
+
+    body = []
+    pos = _HEADER.size
+
+    str_table_off = pos
+    body.append(struct.pack("<%dI" % len(str_offsets), *str_offsets))
+    body.append(b"".join(blobs))
+    pos += 4 * len(str_offsets) + str_offsets[-1]
+
+    ns_table_off = pos
+    flat = [i for pair in tables.namespaces for i in pair]
+    body.append(struct.pack("<%dI" % len(flat), *flat))
+    pos += 4 * len(flat)
+
+    qn_table_off = pos
+    flat = [i for pair in tables.qnames for i in pair]
+    body.append(struct.pack("<%dI" % len(flat), *flat))
+    pos += 4 * len(flat)
+
+    index_off = pos
+    pos += 8 * len(records)
+    offsets = []
+    for r in records:
+        offsets.append(pos)
+        pos += len(r)
+    body.append(struct.pack("<%dQ" % len(offsets), *offsets))
+    body.extend(records)
+
+    header = _HEADER.pack(MAGIC, len(tables.strings), len(tables.namespaces),
+                          len(tables.qnames), len(records), 0,
+                          str_table_off, ns_table_off, qn_table_off, index_off)
+    return header + b"".join(body)
+
+
+def write(prov_doc, filename):
+    with open(filename, "wb") as f:
+        f.write(dumps(prov_doc))
+
+
+#---------------------------------------------------------------
+# reader
+
+class ProvBinReader(object):
+    '''
+    lazy reader for PROVBIN data (memory mapped file or byte string)
+
+    strings, qualified names and records are decoded on first access only;
+    record(i) gives random access to single records
+    '''
+
+    def __init__(self, filename=None, data=None):
+        self._file = None
+        if data is None:
+            self._file = open(filename, "rb")
+            data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = data
+        (magic, self.num_strings, self.num_namespaces, self.num_qnames,
+         self.num_records, self._reserved, self._str_off, self._ns_off, self._qn_off,
+         self._index_off) = _HEADER.unpack_from(data, 0)
+        if magic[:len(MAGIC_PREFIX)] != MAGIC_PREFIX:
+            raise ProvBinException("not a PROVBIN file (bad magic)")
+        if magic != MAGIC:
+            raise ProvBinException("unsupported PROVBIN version %d (this reader reads %d)"
+                                   % (six.indexbytes(magic, len(MAGIC_PREFIX)), FORMAT_VERSION))
+        self._blob_off = self._str_off + 4 * (self.num_strings + 1)
+        self._strings = [None] * self.num_strings
+        self._qnames = [None] * self.num_qnames
+        self._namespaces = None
+
+    def close(self):
+        if self._file is not None:
+            self._data.close()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.num_records
+
+    def string(self, sid):
+        if sid == NONE:
+            return None
+        s = self._strings[sid]
+        if s is None:
+            start, end = struct.unpack_from("<II", self._data, self._str_off + 4 * sid)
+            s = self._strings[sid] = self._data[self._blob_off + start:self._blob_off + end].decode("utf8")
+        return s
+
+    @property
+    def namespaces(self):
+        if self._namespaces is None:
+            flat = struct.unpack_from("<%dI" % (2 * self.num_namespaces), self._data, self._ns_off)
+            self._namespaces = [Namespace(self.string(flat[2 * i]), self.string(flat[2 * i + 1]))
+                                for i in range(self.num_namespaces)]
+        return self._namespaces
+
+    def qname(self, qid):
+        if qid == NONE:
+            return None
+        qn = self._qnames[qid]
+        if qn is None:
+            nid, lid = struct.unpack_from("<II", self._data, self._qn_off + 8 * qid)
+            qn = self._qnames[qid] = self.namespaces[nid][self.string(lid)]
+        return qn
+
+    def _value(self, pos):
+        data = self._data
+        tag = ord(data[pos:pos + 1])
+        if tag == T_QNAME:
+            return self.qname(_TAG_U32.unpack_from(data, pos)[1]), pos + 5
+        if tag == T_STR:
+            return self.string(_TAG_U32.unpack_from(data, pos)[1]), pos + 5
+        if tag == T_INT:
+            return _TAG_I64.unpack_from(data, pos)[1], pos + 9
+        if tag == T_FLOAT:
+            return _TAG_F64.unpack_from(data, pos)[1], pos + 9
+        if tag == T_BOOL:
+            return bool(_TAG_BOOL.unpack_from(data, pos)[1]), pos + 2
+        if tag == T_DATETIME:
+            return parse_xsd_datetime(self.string(_TAG_U32.unpack_from(data, pos)[1])), pos + 5
+        if tag == T_LITERAL:
+            _, vid, did, lid = _TAG_LITERAL.unpack_from(data, pos)
+            return Literal(self.string(vid), self.qname(did), self.string(lid)), pos + 13
+        if tag == T_URI:
+            return Identifier(self.string(_TAG_U32.unpack_from(data, pos)[1])), pos + 5
+        if tag == T_BIGINT:
+            return int(self.string(_TAG_U32.unpack_from(data, pos)[1])), pos + 5
+        raise ProvBinException("unknown value tag %d" % tag)
+
+    def record(self, i):
+        '''
+        decode record number i
+
+        Returns:
+            tuple (record type, identifier, [(attribute, value)], bundle identifier)
+        '''
+        if i < 0 or i >= self.num_records:
+            raise IndexError(i)
+        pos = _U64.unpack_from(self._data, self._index_off + 8 * i)[0]
+        code, bid, rid, nattrs = _REC_HEAD.unpack_from(self._data, pos)
+        pos += _REC_HEAD.size
+        attrs = []
+        for a in range(nattrs):
+            name = self.qname(_U32.unpack_from(self._data, pos)[0])
+            value, pos = self._value(pos + 4)
+            attrs.append((name, value))
+        return (RECORD_TYPES[code], self.qname(rid), attrs, self.qname(bid))
+
+    def iter_records(self):
+        for i in range(self.num_records):
+            yield self.record(i)
+
+    def to_document(self):
+        '''
+        build a ProvDocument from all records
+
+        values were validated when the document was written, so records are
+        filled directly instead of going through ProvBundle.new_record (whose
+        qualified name validation dominates the load time otherwise)
+        '''
+        doc = ProvDocument()
+        # the document may rename a clashing prefix: decode qnames with the
+        # namespaces actually registered
+        self._namespaces = [doc.add_namespace(ns) for ns in self.namespaces]
+        self._qnames = [None] * self.num_qnames
+        bundles = {}
+        for (rec_type, identifier, attrs, bundle_id) in self.iter_records():
+            target = doc
+            if bundle_id is not None:
+                target = bundles.get(bundle_id)
+                if target is None:
+                    target = bundles[bundle_id] = doc.bundle(bundle_id)
+            record = PROV_REC_CLS[rec_type](target, identifier)
+            for (name, value) in attrs:
+                record._attributes[name].add(value)
+            target._add_record(record)
+        return doc
+
+
+def loads(data):
+    return ProvBinReader(data=data).to_document()
+
+
+def read(filename):
+    with ProvBinReader(filename) as reader:
+        return reader.to_document()
@@ -0,0 +1,318 @@
+# in-memory provenance graph for lineage queries without a database: the
+# nodes and relationships of the neo4j graph model (see neo4jcsv.py) kept as
+# numpy compressed sparse row (CSR) adjacency arrays, in both directions
+
+"""
+=============================================
+W3C PROV in-memory lineage graph
+=============================================
+
+Nodes get integer ids in the order their uri is first seen (node_ids:
+uri -> id, uris: id -> uri); every node has a label code (PROV type or
+role label, see neo4jcsv) and every edge a type code (rec.get_type(),
+e.g. prov:Derivation). Edges point from the first to the second formal
+argument of a relation like the neo4j relationships, i.e. from the
+derived / generated / using side to its sources: ancestors follow the
+edges, descendants follow them backwards.
+
+Storage per edge: int32 target and uint8 type in each direction (10
+bytes), plus an int64 offset per node and direction; 10^7 edges take about
+100 MB in numpy arrays (plus the uri dict).
+
+Traversals are breadth first, one vectorized numpy step per level, and
+can be restricted to edge types and a maximum depth.
+
+Usage:
+
+     builder = provgraph.ProvGraphBuilder()
+     builder.add_document(prov_doc)           # or add_records(stream)
+     graph = builder.build()
+     graph.ancestors("http://example.com#dataset1", types=["prov:Derivation"])
+     graph.shortest_path(uri1, uri2)
+
+"""
+
+from array import array
+
+import numpy as np
+
+import provbin
+from neo4jbatch import record_rows, NODE_ROW
+
+EMPTY = np.zeros(0, dtype=np.int32)
+DIRECTIONS = ("ancestors", "descendants", "any")
+
+
+class ProvGraphException(Exception):
+    pass
+
+
+class ProvGraphBuilder(object):
+    '''
+    collects nodes and edges (records, rows of neo4jbatch.record_rows or
+    plain uris) and builds the ProvGraph
+    '''
+
+    def __init__(self):
+        self.node_ids = {}
+        self.uris = []
+        self.label_names = []
+        self.type_names = []
+        self._label_codes = {}
+        self._type_codes = {}
+        self._labels = array("B")
+        self._declared = set()
+        self._src = array("i")
+        self._dst = array("i")
+        self._types = array("B")
+
+    def _code(self, codes, names, name):
+        code = codes.get(name)
+        if code is None:
+            if len(names) > 255:
+                raise ProvGraphException("more than 256 node labels / edge types")
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def node(self, uri, label, element=True):
+        '''
+        Args:
+            element (bool): label is the type of the element record (else
+                the role label of a relationship endpoint, replaced by the
+                type once the element is added)
+        Returns:
+            node id
+        '''
+        node_id = self.node_ids.get(uri)
+        if node_id is None:
+            node_id = self.node_ids[uri] = len(self.uris)
+            self.uris.append(uri)
+            self._labels.append(self._code(self._label_codes, self.label_names, label))
+        elif element and node_id not in self._declared:
+            self._labels[node_id] = self._code(self._label_codes, self.label_names, label)
+        if element:
+            self._declared.add(node_id)
+        return node_id
+
+    def edge(self, rel_type, start, end):
+        '''
+        Args:
+            start, end: node ids
+        '''
+        self._src.append(start)
+        self._dst.append(end)
+        self._types.append(self._code(self._type_codes, self.type_names, rel_type))
+
+    def add_rows(self, rows):
+        for row in rows:
+            if row[0] == NODE_ROW:
+                self.node(row[1], row[2])
+            else:
+                rel_type, start, end = row[1:4]
+                self.edge(rel_type, self.node(start[0], start[1], False),
+                          self.node(end[0], end[1], False))
+
+    def add_records(self, records):
+        '''
+        (bundle_id, record) tuples, e.g. provstream.iter_records(filename, "xml")
+        '''
+        self.add_rows(record_rows(records))
+
+    def add_document(self, prov_doc):
+        self.add_records(provbin.iter_doc_records(prov_doc))
+
+    def build(self):
+        return ProvGraph(list(self.uris), _copy(self._labels, np.uint8), self.label_names,
+                         _copy(self._src, np.int32), _copy(self._dst, np.int32),
+                         _copy(self._types, np.uint8), self.type_names, dict(self.node_ids))
+
+
+def _copy(values, dtype):
+    if not len(values):
+        return np.zeros(0, dtype=dtype)
+    return np.frombuffer(values, dtype=dtype).copy()
+
+
+def _csr(num_nodes, src, dst, types):
+    # neighbours of a node in no particular order: no stable sort needed
+    order = np.argsort(src)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32), types[order].astype(np.uint8)
+
+
+class ProvGraph(object):
+    '''
+    Args:
+        uris (list): uri of every node id
+        labels: label code per node (index into label_names)
+        src, dst, types: edge arrays (node ids, index into type_names)
+        node_ids (dict): uri -> id (built from uris if None)
+    '''
+
+    def __init__(self, uris, labels, label_names, src, dst, types, type_names, node_ids=None):
+        self.uris = uris
+        self.node_ids = node_ids if node_ids is not None else \
+            dict((uri, i) for (i, uri) in enumerate(uris))
+        self.labels = np.asarray(labels, dtype=np.uint8)
+        self.label_names = list(label_names)
+        self.type_names = list(type_names)
+        num_nodes = len(uris)
+        src = np.asarray(src, dtype=np.int32)
+        dst = np.asarray(dst, dtype=np.int32)
+        types = np.asarray(types, dtype=np.uint8)
+        self._out = _csr(num_nodes, src, dst, types)
+        self._in = _csr(num_nodes, dst, src, types)
+
+    @property
+    def num_nodes(self):
+        return len(self.uris)
+
+    @property
+    def num_edges(self):
+        return len(self._out[1])
+
+    @property
+    def nbytes(self):
+        '''
+        size of the numpy arrays (without the uri list and dict)
+        '''
+        return self.labels.nbytes + sum(a.nbytes for a in self._out + self._in)
+
+    def node_id(self, uri):
+        try:
+            return self.node_ids[uri]
+        except KeyError:
+            raise ProvGraphException("unknown node " + uri)
+
+    def label(self, uri):
+        return self.label_names[self.labels[self.node_id(uri)]]
+
+    def _type_mask(self, types):
+        if types is None:
+            return None
+        mask = np.zeros(max(len(self.type_names), 1), dtype=bool)
+        for name in types:
+            if name in self.type_names:
+                mask[self.type_names.index(name)] = True
+        return mask
+
+    def _adjacency(self, direction):
+        if direction == "ancestors":
+            return [self._out]
+        elif direction == "descendants":
+            return [self._in]
+        elif direction == "any":
+            return [self._out, self._in]
+        raise ProvGraphException("direction must be one of " + ", ".join(DIRECTIONS))
+
+    def _step(self, adjacency, frontier, mask):
+        '''
+        Returns:
+            (neighbour ids, the frontier node each one was reached from)
+        '''
+        found = []
+        origins = []
+        for indptr, indices, types in adjacency:
+            starts = indptr[frontier]
+            counts = indptr[frontier + 1] - starts
+            total = counts.sum()
+            if not total:
+                continue
+            # positions of all neighbours: starts[i], starts[i] + 1, ... per frontier node
+            ends = np.cumsum(counts)
+            positions = np.arange(total) + np.repeat(starts - ends + counts, counts)
+            origin = np.repeat(frontier, counts)
+            if mask is not None:
+                keep = mask[types[positions]]
+                positions = positions[keep]
+                origin = origin[keep]
+            found.append(indices[positions])
+            origins.append(origin)
+        if not found:
+            return EMPTY, EMPTY
+        if len(found) == 1:
+            return found[0], origins[0]
+        return np.concatenate(found), np.concatenate(origins)
+
+    def _bfs(self, start, direction, types, max_depth, target=None):
+        '''
+        Returns:
+            (ids reached in breadth first order without start,
+             parent id array or None)
+        '''
+        adjacency = self._adjacency(direction)
+        mask = self._type_mask(types)
+        visited = np.zeros(self.num_nodes, dtype=bool)
+        visited[start] = True
+        parents = None
+        if target is not None:
+            parents = np.full(self.num_nodes, -1, dtype=np.int32)
+        reached = []
+        frontier = np.array([start], dtype=np.int32)
+        depth = 0
+        while len(frontier) and (max_depth is None or depth < max_depth):
+            depth += 1
+            found, origin = self._step(adjacency, frontier, mask)
+            new = ~visited[found]
+            found = found[new]
+            # first occurrence of every node: one parent each
+            frontier, first = np.unique(found, return_index=True)
+            if not len(frontier):
+                break
+            visited[frontier] = True
+            reached.append(frontier)
+            if parents is not None:
+                parents[frontier] = origin[new][first]
+                if visited[target]:
+                    break
+        ids = np.concatenate(reached) if reached else EMPTY
+        return ids, parents
+
+    def _uris(self, ids):
+        uris = self.uris
+        return [uris[i] for i in ids.tolist()]
+
+    def ancestors(self, uri, types=None, max_depth=None):
+        '''
+        uris the node was derived from / generated by / ... (following the
+        edges), nearest first
+
+        Args:
+            types (list): edge types to follow (e.g. ["prov:Derivation"]),
+                default all
+            max_depth (int): number of edges at most
+        '''
+        return self._uris(self._bfs(self.node_id(uri), "ancestors", types, max_depth)[0])
+
+    def descendants(self, uri, types=None, max_depth=None):
+        '''
+        uris depending on the node (following the edges backwards), nearest first
+        '''
+        return self._uris(self._bfs(self.node_id(uri), "descendants", types, max_depth)[0])
+
+    def neighbours(self, uri, direction="ancestors", types=None):
+        return self._uris(np.unique(self._step(self._adjacency(direction),
+                                               np.array([self.node_id(uri)], dtype=np.int32),
+                                               self._type_mask(types))[0]))
+
+    def shortest_path(self, source, target, direction="ancestors", types=None, max_depth=None):
+        '''
+        Args:
+            direction (str): "ancestors" (along the edges), "descendants"
+                or "any" (both ways)
+        Returns:
+            list of uris from source to target, None if target is not reachable
+        '''
+        start = self.node_id(source)
+        end = self.node_id(target)
+        if start == end:
+            return [source]
+        ids, parents = self._bfs(start, direction, types, max_depth, end)
+        if parents[end] < 0:
+            return None
+        path = [end]
+        while path[-1] != start:
+            path.append(int(parents[path[-1]]))
+        return self._uris(np.array(path[::-1]))
@@ -0,0 +1,289 @@
+# parallel ingest of directories of PROV files into neo4j: the files are
+# parsed and converted to loader rows in a process pool, the rows of all
+# files are funnelled into one batching writer (neo4jbatch.BatchLoader in
+# MERGE mode), so thousands of small workflow step documents end up in a
+# few big UNWIND transactions
+
+"""
+=============================================
+W3C PROV / neo4j directory ingest
+=============================================
+
+Files: directories (walked recursively), glob patterns and single files;
+the format is taken from the extension (.json, .xml, .provx, .provbin)
+unless given. Workers read a file (provstream / provbin, no ProvDocument
+for XML and JSON) and return its neo4jbatch.record_rows, the main process
+adds them to the loader while the workers go on parsing.
+
+Rows are written in transactions of at most batch_size rows. The buffers
+are flushed every group_rows rows; files are reported when the group they
+belong to is written. A file which cannot be parsed is reported as failed
+and skipped. A failed write fails the files of its group only: the loader
+drops its buffers and its cache of known uris and the run goes on. Parts
+of such a group may have been written by earlier batches; since all
+writes are MERGEs, ingesting the failed files again is safe.
+
+usage:
+    python provingest.py [-p processes] [-b batch_size] [-g group_rows]
+                         [-f json|xml|bin] (-n neo4j_uri | --dry-run)
+                         dir|file|glob ...
+
+     for res in provingest.ingest(provingest.find_files(["runs/"]), loader):
+         print res["file"], res.get("error")
+
+"""
+
+import os
+import sys
+import time
+import glob
+import getopt
+import fnmatch
+import multiprocessing
+
+import provbin
+import provstream
+import neo4jbatch
+
+FORMATS = {".json": "json", ".xml": "xml", ".provx": "xml", ".provbin": "bin"}
+# rows buffered before all batches are written
+DEFAULT_GROUP_ROWS = 100000
+
+
+def file_format(filename, format=None):
+    if format is not None:
+        return format
+    return FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def iter_file_records(filename, format):
+    '''
+    (bundle_id, record) tuples of a file without building a ProvDocument
+    (provbin files are memory mapped and decode fast: read as a whole)
+    '''
+    if format == "bin":
+        return provbin.iter_doc_records(provbin.read(filename))
+    return provstream.iter_records(filename, format)
+
+
+def find_files(paths, format=None):
+    '''
+    Args:
+        paths: directories, files or glob patterns
+        format (str): if None only files with a known extension are taken
+            from directories and patterns
+    Returns:
+        sorted list of files
+    '''
+    found = set()
+    for path in paths:
+        if os.path.isfile(path):
+            found.add(path)
+            continue
+        if os.path.isdir(path):
+            candidates = []
+            for root, dirs, files in os.walk(path):
+                candidates.extend(os.path.join(root, f) for f in files)
+        else:
+            candidates = [f for f in glob.glob(path) if os.path.isfile(f)]
+        found.update(f for f in candidates
+                     if file_format(f, format) and not fnmatch.fnmatch(os.path.basename(f), ".*"))
+    return sorted(found)
+
+
+def convert_file(args):
+    '''
+    pool job: (filename, format) -> result dict with the rows of the file
+    or an "error" entry
+    '''
+    filename, format = args
+    t0 = time.time()
+    result = {"file": filename}
+    try:
+        frmt = file_format(filename, format)
+        if frmt is None:
+            raise provstream.ProvStreamException("unknown format")
+        records = [0]
+
+        def counted(items):
+            for item in items:
+                records[0] += 1
+                yield item
+
+        result["rows"] = list(neo4jbatch.record_rows(counted(iter_file_records(filename, frmt))))
+        result["records"] = records[0]
+    except Exception as e:
+        result = {"file": filename, "error": "%s: %s" % (e.__class__.__name__, e)}
+    result["parse_seconds"] = time.time() - t0
+    return result
+
+
+def _converted(files, format, processes):
+    jobs = [(f, format) for f in files]
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            yield convert_file(job)
+        return
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(convert_file, jobs):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def ingest(files, loader, processes=None, format=None, group_rows=DEFAULT_GROUP_ROWS,
+           lineage=None):
+    '''
+    load files into the graph of loader (a BatchLoader with upsert=True),
+    parsing in a process pool if processes != 1; lineage
+    (provlineage.LineageIndex) is updated for every group written
+
+    Returns:
+        generator of result dicts (file, records, parse_seconds,
+        load_seconds; in completion order), failed files have an "error"
+        entry
+    '''
+    group = []
+    buffered = [0]
+
+    def write():
+        t0 = time.time()
+        try:
+            loader.flush()
+            error = None
+        except Exception as e:
+            loader.discard()
+            error = "write failed: %s: %s" % (e.__class__.__name__, e)
+        if lineage is not None and error is None:
+            try:
+                lineage.update(row for res in group for row in res["rows"])
+            except Exception as e:
+                error = "lineage update failed: %s: %s" % (e.__class__.__name__, e)
+        seconds = time.time() - t0
+        for res in group:
+            res.pop("rows")
+            if error is not None:
+                res["error"] = error
+            else:
+                res["load_seconds"] += seconds * res["num_rows"] / max(buffered[0], 1)
+        done = list(group)
+        del group[:]
+        buffered[0] = 0
+        return done
+
+    for res in _converted(files, format, processes):
+        if "error" in res:
+            yield res
+            continue
+        res["num_rows"] = len(res["rows"])
+        group.append(res)
+        buffered[0] += res["num_rows"]
+        t0 = time.time()
+        try:
+            loader.add_rows(res["rows"])
+        except Exception as e:
+            # a full batch written while adding the rows failed
+            loader.discard()
+            for failed in group:
+                failed.pop("rows")
+                failed["error"] = "write failed: %s: %s" % (e.__class__.__name__, e)
+                yield failed
+            del group[:]
+            buffered[0] = 0
+            continue
+        res["load_seconds"] = time.time() - t0
+        if buffered[0] >= group_rows:
+            for done in write():
+                yield done
+    for done in write():
+        yield done
+
+
+class DryRunGraph(object):
+    '''
+    graph for --dry-run: statements are discarded, so that files are parsed,
+    converted and batched without a database
+    '''
+
+    def begin(self):
+        return self
+
+    def run(self, statement, parameters=None, **kwparameters):
+        pass
+
+    def commit(self):
+        pass
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hp:b:g:f:n:", ["help", "processes=", "batch-size=",
+                                                       "group-rows=", "format=", "neo4j=",
+                                                       "cache-size=", "dry-run"])
+    except getopt.GetoptError as err:
+        print(str(err))
+        print(__doc__)
+        return 2
+    processes = None
+    batch_size = neo4jbatch.DEFAULT_BATCH_SIZE
+    group_rows = DEFAULT_GROUP_ROWS
+    cache_size = neo4jbatch.DEFAULT_CACHE_SIZE
+    format = None
+    graph_uri = None
+    dry_run = False
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(__doc__)
+            return 0
+        elif o in ("-p", "--processes"):
+            processes = int(a)
+        elif o in ("-b", "--batch-size"):
+            batch_size = int(a)
+        elif o in ("-g", "--group-rows"):
+            group_rows = int(a)
+        elif o == "--cache-size":
+            cache_size = int(a)
+        elif o in ("-f", "--format"):
+            format = a
+        elif o in ("-n", "--neo4j"):
+            graph_uri = a
+        elif o == "--dry-run":
+            dry_run = True
+    if not args or not (graph_uri or dry_run):
+        print(__doc__)
+        return 2
+
+    if dry_run:
+        graph = DryRunGraph()
+    else:
+        from py2neo import Graph
+        graph = Graph(graph_uri)
+    loader = neo4jbatch.BatchLoader(graph, batch_size, upsert=True, cache_size=cache_size)
+
+    files = find_files(args, format)
+    failures = 0
+    records = 0
+    t0 = time.time()
+    for res in ingest(files, loader, processes, format, group_rows):
+        if "error" in res:
+            failures += 1
+            print("%-40s ERROR %s" % (res["file"], res["error"]))
+            continue
+        records += res["records"]
+        seconds = res["parse_seconds"] + res["load_seconds"]
+        print("%-40s %8d records %8.3fs parse %8.3fs load %10.0f records/s" % (
+            res["file"], res["records"], res["parse_seconds"], res["load_seconds"],
+            res["records"] / seconds if seconds else 0))
+    seconds = time.time() - t0
+    stats = loader.stats
+    print("%d files (%d failed), %d records in %.3fs (%.0f records/s): %d nodes, "
+          "%d relationships, %d batches" % (
+              len(files), failures, records, seconds, records / seconds if seconds else 0,
+              stats["nodes"], stats["relationships"], stats["batches"]))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -16,6 +16,16 @@ W3C PROV / neo4j graph tools
 Provided functionality:
 
 * generate neo4j graph representation from W3C prov descriptions (xml and json) 
+* read the compact binary PROVBIN format (see provbin.py) written between pipeline stages
+* write neo4j-admin import CSV files without a database connection (see neo4jcsv.py,
+  export_csv for documents and files)
+* load prov documents in batched UNWIND transactions (see neo4jbatch.py)
+* stream records of big PROV-XML / PROV-JSON files (see provstream.py)
+* ingest directories of prov files in parallel (see provingest.py)
+* in-memory lineage queries (ancestors, descendants, shortest paths, see provgraph.py)
+* materialized UPSTREAM lineage closure in neo4j (see provlineage.py)
+* sync re-emitted documents: only the changed nodes / relationships (see provsync.py)
+* cached rendering, summaries of big documents (see provrender.py)
 * tests
 * helper functions
 * Jupyter notebook demo
@@ -32,8 +42,7 @@ Configuration:
 # import all dependencies
 
 from prov.model import ProvDocument
-from prov.dot import prov_to_dot
-from IPython.display import Image
+from IPython.display import Image, SVG
 from prov.model import (
     PROV_ACTIVITY, PROV_AGENT, PROV_ALTERNATE, PROV_ASSOCIATION,
     PROV_ATTRIBUTION, PROV_BUNDLE, PROV_COMMUNICATION, PROV_DERIVATION,
@@ -43,9 +52,20 @@ from prov.model import (
     PROV_ATTRIBUTE_QNAMES, sorted_attributes, ProvException
 )
 
+import datetime
+
 import six
 from py2neo import Graph, Node, Relationship, authenticate
 
+import provbin
+import provingest
+import provrender
+import provgraph
+import provlineage
+import provsync
+import neo4jbatch
+from neo4jcsv import type_label, node_labels, schema_statements, record_properties, Neo4jCSVWriter
+
 
 
 def get_provdoc(format,infile):
@@ -53,33 +73,147 @@ def get_provdoc(format,infile):
        return ProvDocument.deserialize(infile)
     elif format == "xml":
        return ProvDocument.deserialize(infile,format='xml')
+    elif format == "bin":
+       return provbin.read(infile)
     else:
-       print "Error: unsupported format (xml and json are supported"
+       print "Error: unsupported format (xml, json and bin are supported"
 
 
 
-def visualize_prov(prov_doc):
-    dot = prov_to_dot(prov_doc)
-    dot.write_png('tmp1.png')
-    dot.write_pdf('tmp1.pdf')
-    
-    return Image('tmp1.png')
+def visualize_prov(prov_doc, format="png", cache_dir=None,
+                   max_nodes=provrender.DEFAULT_MAX_NODES, grouping="type"):
+    # rendered once per document content (see provrender.py); documents with more
+    # than max_nodes nodes are collapsed by grouping ("type" or "bundle")
+    # returns an Image (png, jpg), SVG (svg) or the file name (pdf, dot)
+    filename = provrender.render(prov_doc, format, cache_dir, max_nodes, grouping)
+    if format in ("png", "jpg"):
+       return Image(filename)
+    elif format == "svg":
+       return SVG(filename=filename)
+    return filename
+
+
+def load_graph(prov_doc, graph, batch_size=neo4jbatch.DEFAULT_BATCH_SIZE, upsert=False,
+               lineage=None):
+    # bulk alternative to graph.create for every relationship of gen_graph_model:
+    # nodes and relationships grouped by label / type, one UNWIND statement per batch;
+    # upsert=True MERGEs on the uri, so documents sharing elements can be loaded one
+    # after the other without duplicating nodes
+    # lineage: provlineage.LineageIndex whose UPSTREAM closure is extended afterwards
+    stats = neo4jbatch.BatchLoader(graph, batch_size, upsert=upsert).load(prov_doc)
+    if lineage is not None:
+       lineage.update(neo4jbatch.record_rows(provbin.iter_doc_records(prov_doc)))
+    return stats
+
+
+def iter_prov_records(format, infile):
+    # (bundle_id, record) tuples without building a ProvDocument, formats as get_provdoc
+    return provingest.iter_file_records(infile, format)
+
+
+def stream_graph(format, infile, graph, batch_size=neo4jbatch.DEFAULT_BATCH_SIZE, lineage=None):
+    # load_graph for files too big to deserialize: one pass over the records (MERGE mode;
+    # with a lineage index a second one for the closure)
+    loader = neo4jbatch.BatchLoader(graph, batch_size, upsert=True)
+    stats = loader.load_records(iter_prov_records(format, infile))
+    if lineage is not None:
+       lineage.update(neo4jbatch.record_rows(iter_prov_records(format, infile)))
+    return stats
+
+
+def sync_graph(prov_doc, graph, doc, batch_size=neo4jbatch.DEFAULT_BATCH_SIZE, lineage=None):
+    # load a new version of the document with key doc (e.g. its file name): only the
+    # nodes and relationships which differ from the version synced last (content
+    # hashes stored in the graph, see provsync.py) are written, in one transaction
+    # lineage: provlineage.LineageIndex whose UPSTREAM closure is updated afterwards
+    # (rebuilt if lineage relationships were removed)
+    syncer = provsync.DocumentSync(graph, batch_size, lineage=lineage)
+    return syncer.sync(doc, neo4jbatch.record_rows(provbin.iter_doc_records(prov_doc)))
+
+
+def sync_file(format, infile, graph, doc=None, batch_size=neo4jbatch.DEFAULT_BATCH_SIZE,
+              lineage=None):
+    # sync_graph for a file read as a record stream; the key defaults to the file name
+    syncer = provsync.DocumentSync(graph, batch_size, lineage=lineage)
+    return syncer.sync(doc or infile, neo4jbatch.record_rows(iter_prov_records(format, infile)))
+
+
+def ingest_files(paths, graph, processes=None, batch_size=neo4jbatch.DEFAULT_BATCH_SIZE,
+                 lineage=None):
+    # directories / glob patterns of prov files, parsed in a process pool and written
+    # through one batch loader (MERGE mode); returns the result dict of every file
+    loader = neo4jbatch.BatchLoader(graph, batch_size, upsert=True)
+    return list(provingest.ingest(provingest.find_files(paths), loader, processes,
+                                  lineage=lineage))
+
+
+def update_lineage(prov_doc, graph, rebuild=False):
+    # maintenance job of the UPSTREAM lineage closure (see provlineage.py): extend it
+    # for a document loaded before, or compute it again from all lineage relationships
+    index = provlineage.LineageIndex(graph)
+    if rebuild:
+       return index.rebuild()
+    return index.update(neo4jbatch.record_rows(provbin.iter_doc_records(prov_doc)))
+
+
+def upstream_inputs(graph, uri, label="Entity"):
+    # all entities a node derives from, read from the stored closure (one index seek)
+    return provlineage.upstream(graph, uri, label, target_label="Entity")
+
+
+def export_csv(sources, outdir, format=None, compress=False):
+    # offline alternative to the loaders for the initial population of a database:
+    # neo4j-admin import CSV files (nodes deduplicated by uri, see neo4jcsv.py) for
+    # ProvDocuments and / or prov files (read as streams, format from the extension
+    # if not given); compress=True writes .csv.gz files
+    # returns the closed writer: writer.import_args(), writer.schema_statements()
+    writer = Neo4jCSVWriter(outdir, compress)
+    for source in sources:
+       if isinstance(source, ProvDocument):
+          writer.add_document(source)
+       else:
+          frmt = provingest.file_format(source, format)
+          if frmt is None:
+             raise ProvException("unknown format of " + source)
+          writer.add_records(provingest.iter_file_records(source, frmt))
+    writer.close()
+    return writer
+
+
+def gen_prov_graph(prov_doc):
+    # in-memory alternative to gen_graph_model for lineage queries without neo4j:
+    # same nodes and relationships as CSR arrays (see provgraph.py)
+    builder = provgraph.ProvGraphBuilder()
+    builder.add_document(prov_doc)
+    return builder.build()
+
+
+def create_schema(graph):
+    # uniqueness constraints (and with them indexes) on the uri of the PROV type labels
+    for statement in schema_statements():
+        graph.run(statement)
 
 
 def gen_graph_model(prov_doc):
+    # nodes are labelled with their PROV type (Entity, Activity, Agent, ...) and
+    # Element, the label keyed by the uri property (see create_schema)
 
     node_map = {}
-    count = [0, 0, 0, 0] # counters for node ids
     records = prov_doc.get_records()
     relations = []
     use_labels = True
-    show_relation_attributes = True
-    other_attributes = True
-    show_nary = True
+
+    def _graph_properties(entity, props):
+       # py2neo objects cannot carry temporal values: times as ISO text
+       for key, value in props.items():
+          if isinstance(value, datetime.datetime):
+             value = value.isoformat()
+          elif isinstance(value, list):
+             value = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in value]
+          entity[key] = value
+       return entity
 
     def _add_node(record):
-       count[0] += 1
-       node_id = 'n%d' % count[0]
        if use_labels:
           if record.label == record.identifier:
               node_label = '"%s"' % six.text_type(record.label)
@@ -94,31 +228,20 @@ def gen_graph_model(prov_doc):
 
        uri = record.identifier.uri
     
-       node = Node(node_id, label=node_label, URL=uri)
+       node = Node(*node_labels(type_label(record.get_type())), label=node_label, URL=uri, uri=uri)
+       # attributes as typed properties (qualified names as keys, e.g. prov:startTime)
+       _graph_properties(node, record_properties(record))
        node_map[uri] = node
     
      ## create Node ... ##dot.add_node(node)
        return node
 
 
-    def _add_generic_node(qname):
-       count[0] += 1
-       node_id = 'n%d' % count[0]
-       node_label = '"%s"' % six.text_type(qname)
-
-       uri = qname.uri
-       node = Node(node_id, label=node_label, URL=uri)
-       node_map[uri] = node
-      
-       return node
-
-    def _get_node(qname):
-       if qname is None:
-          print "ERROR: _get_node called for empty node"
-        #return _get_bnode()
-       uri = qname.uri
+    def _get_node(endpoint):
+       # endpoint: (uri, role label, node label text) of neo4jbatch.relation_rows
+       uri, role_label, node_label = endpoint
        if uri not in node_map:
-          _add_generic_node(qname)
+          node_map[uri] = Node(*node_labels(role_label), label=node_label, URL=uri, uri=uri)
        return node_map[uri]
          
     for rec in records:
@@ -131,44 +254,12 @@ def gen_graph_model(prov_doc):
                    
     neo_rels = []            
     for rec in relations:
-                args = rec.args
-                # skipping empty records
-                if not args:
-                    continue
-                # picking element nodes
-                nodes = [
-                    value for attr_name, value in rec.formal_attributes
-                    if attr_name in PROV_ATTRIBUTE_QNAMES
-                ]
-                other_attributes = [
-                    (attr_name, value) for attr_name, value in rec.attributes
-                    if attr_name not in PROV_ATTRIBUTE_QNAMES
-                ]
-                add_attribute_annotation = (
-                    show_relation_attributes and other_attributes
-                )
-                add_nary_elements = len(nodes) > 2 and show_nary
-                
-                if len(nodes) < 2:  # too few elements for a relation?
-                    continue  # cannot draw this           
-                
-                if add_nary_elements or add_attribute_annotation:
-                    # a blank node for n-ary relations or the attribute annotation
-                
-                    # the first segment
-                    
-                    rel = Relationship(_get_node(nodes[0]), rec.get_type()._str,_get_node(nodes[1]))
-                    #print "relationship: ",rel
-                    neo_rels.append(rel)
-                       
-                    if add_nary_elements:   
-                        for node in nodes[2:]:
-                            if node is not None:
-                                relx = Relationship(_get_node(nodes[0]), "...rel_name",_get_node(node))
-                                neo_rels.append(relx)
-                else:
-                    # show a simple binary relations with no annotation
-                    rel =  Relationship(_get_node(nodes[0]), rec.get_type()._str,_get_node(nodes[1]))
-                    neo_rels.append(rel)
+                # the main relationship with the relation attributes and, for
+                # n-ary relations, one relationship per further argument
+                # typed by its role (skips relations with too few elements)
+                for row in neo4jbatch.relation_rows(rec):
+                    rel_type, start, end, props = row[1:]
+                    rel = Relationship(_get_node(start), rel_type, _get_node(end))
+                    neo_rels.append(_graph_properties(rel, props))
 
     return neo_rels
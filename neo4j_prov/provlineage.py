@@ -0,0 +1,210 @@
+# materialized lineage closure for the neo4j provenance graph: every node gets
+# an UPSTREAM relationship to each node it (transitively) derives from, so that
+# "all upstream inputs" is one index seek plus one hop instead of a
+# variable-length traversal over wasDerivedFrom / used / wasGeneratedBy chains
+
+"""
+=============================================
+W3C PROV / neo4j lineage closure
+=============================================
+
+Closure relationships: (x)-[:UPSTREAM]->(y) for every y reachable from x
+over relationships of the lineage types (default prov:Derivation,
+prov:Usage, prov:Generation; the direction of the graph model: from the
+derived / generated / using side to its sources). The closure is stored
+in the graph and maintained by a LineageIndex:
+
+* update(rows): incremental, for the rows of a newly loaded document
+  (neo4jbatch.record_rows). Only the closure around the new lineage
+  relationships is read: the UPSTREAM targets of their end nodes and the
+  UPSTREAM sources of their start nodes. Together with the new
+  relationships this is enough to find every new (x, y) pair (the stored
+  closure is transitive), computed in memory with provgraph and MERGEd in
+  UNWIND batches.
+* rebuild(): reads all lineage relationships, deletes the closure and
+  writes it again (e.g. after deleting data, or for an existing database).
+
+Nodes are matched by the key label Element and uri (index seeks on its
+uniqueness constraint, see neo4jcsv.KEY_LABEL), whatever their PROV type.
+
+The closure can grow quadratically with the length of derivation chains;
+it pays off for the usual shallow and wide workflow provenance.
+
+Usage:
+
+     index = provlineage.LineageIndex(graph)
+     index.update(neo4jbatch.record_rows(provbin.iter_doc_records(prov_doc)))
+     provlineage.upstream(graph, "http://example.com#dataset1", target_label="Entity")
+
+"""
+
+import six
+
+from neo4jbatch import rel_statement, NODE_ROW, DEFAULT_BATCH_SIZE
+from neo4jcsv import KEY_LABEL
+from provgraph import ProvGraphBuilder
+
+UPSTREAM = "UPSTREAM"
+LINEAGE_TYPES = ("prov:Derivation", "prov:Usage", "prov:Generation")
+
+CLOSURE_UP_STATEMENT = (u"UNWIND {uris} AS uri MATCH (n:`%s` {uri: uri})-[:`UPSTREAM`]->(m) "
+                        u"RETURN uri, m.uri AS other, labels(m) AS labels")
+CLOSURE_DOWN_STATEMENT = (u"UNWIND {uris} AS uri MATCH (n:`%s` {uri: uri})<-[:`UPSTREAM`]-(m) "
+                          u"RETURN uri, m.uri AS other, labels(m) AS labels")
+LINEAGE_STATEMENT = (u"MATCH (a)-[r]->(b) WHERE type(r) IN {types} "
+                     u"RETURN a.uri AS start, labels(a) AS start_labels, "
+                     u"b.uri AS end, labels(b) AS end_labels")
+CLEAR_STATEMENT = u"MATCH ()-[r:`UPSTREAM`]->() DELETE r"
+
+
+def _type_label(labels):
+    '''
+    PROV type label of a node (the key label if it has no other)
+    '''
+    return next((label for label in sorted(labels) if label != KEY_LABEL), KEY_LABEL)
+
+
+def _closure(graph, statement, uris, batch_size):
+    '''
+    closure neighbours of uris
+
+    Returns:
+        generator of (uri, other uri, other label)
+    '''
+    uris = sorted(uris)
+    for i in range(0, len(uris), batch_size):
+        for row in graph.run(statement % KEY_LABEL, {"uris": uris[i:i + batch_size]}).data():
+            yield row["uri"], row["other"], _type_label(row["labels"])
+
+
+def upstream(graph, uri, label=KEY_LABEL, target_label=None):
+    '''
+    uris of all nodes the node derives from (stored closure)
+
+    Args:
+        label (str): a label of the node (for the index seek)
+        target_label (str): only nodes with this label, e.g. "Entity" for
+            the upstream inputs
+    '''
+    rows = graph.run(CLOSURE_UP_STATEMENT % label, {"uris": [uri]}).data()
+    return sorted(row["other"] for row in rows
+                  if target_label is None or target_label in row["labels"])
+
+
+def downstream(graph, uri, label=KEY_LABEL, target_label=None):
+    '''
+    uris of all nodes derived from the node (stored closure)
+    '''
+    rows = graph.run(CLOSURE_DOWN_STATEMENT % label, {"uris": [uri]}).data()
+    return sorted(row["other"] for row in rows
+                  if target_label is None or target_label in row["labels"])
+
+
+class LineageIndex(object):
+    '''
+    Args:
+        graph: py2neo Graph (or benchmarks/recordinggraph.RecordingGraph)
+        types: relationship types followed
+        batch_size (int): rows per UNWIND statement / transaction
+    '''
+
+    def __init__(self, graph, types=LINEAGE_TYPES, batch_size=DEFAULT_BATCH_SIZE):
+        self.graph = graph
+        self.types = frozenset(types)
+        self.batch_size = batch_size
+        self.stats = {"edges": 0, "closure": 0, "batches": 0}
+
+    def _write(self, pairs):
+        '''
+        MERGE UPSTREAM relationships for (start, end) uri pairs
+        '''
+        statement = rel_statement(UPSTREAM, upsert=True)
+        rows = []
+        for start, end in pairs:
+            rows.append({"start": six.text_type(start), "end": six.text_type(end), "props": {}})
+            if len(rows) >= self.batch_size:
+                self._commit(statement, rows)
+                rows = []
+        if rows:
+            self._commit(statement, rows)
+
+    def _commit(self, statement, rows):
+        tx = self.graph.begin()
+        tx.run(statement, {"rows": rows})
+        tx.commit()
+        self.stats["closure"] += len(rows)
+        self.stats["batches"] += 1
+
+    def _pairs(self, builder, sources, known=()):
+        '''
+        (x, y) for every y reachable from a source x, without known pairs
+        '''
+        graph = builder.build()
+        for x in sources:
+            for y in graph.ancestors(x):
+                if y != x and (x, y) not in known:
+                    yield (x, y)
+
+    def update(self, rows):
+        '''
+        extend the closure for the rows of a newly loaded document
+        (neo4jbatch.record_rows; the document must be loaded before)
+
+        Returns:
+            dict with the numbers of lineage relationships read, closure
+            relationships written and batches (totals of all calls)
+        '''
+        elements = {}
+        roles = {}
+        edges = []
+        for row in rows:
+            if row[0] == NODE_ROW:
+                elements[row[1]] = row[2]
+            elif row[1] in self.types:
+                start, end = row[2], row[3]
+                roles.setdefault(start[0], start[1])
+                roles.setdefault(end[0], end[1])
+                edges.append((start[0], end[0]))
+        if not edges:
+            return dict(self.stats)
+        labels = dict((uri, elements.get(uri, label)) for (uri, label) in roles.items())
+        starts = set(a for (a, b) in edges)
+        ends = set(b for (a, b) in edges)
+
+        builder = ProvGraphBuilder()
+        known = set()
+        # stored upstream of the new end nodes and downstream of the new start nodes
+        for uri, other, label in _closure(self.graph, CLOSURE_UP_STATEMENT, ends, self.batch_size):
+            labels.setdefault(other, label)
+            known.add((uri, other))
+        sources = set(starts)
+        for uri, other, label in _closure(self.graph, CLOSURE_DOWN_STATEMENT, starts,
+                                          self.batch_size):
+            labels.setdefault(other, label)
+            known.add((other, uri))
+            sources.add(other)
+        for uri in labels:
+            builder.node(uri, labels[uri])
+        for (start, end) in sorted(known) + edges:
+            builder.edge(UPSTREAM, builder.node_ids[start], builder.node_ids[end])
+        self.stats["edges"] += len(edges)
+        self._write(self._pairs(builder, sources, known))
+        return dict(self.stats)
+
+    def rebuild(self):
+        '''
+        delete the closure and compute it from all lineage relationships
+
+        Returns:
+            dict of statistics, see update
+        '''
+        rows = self.graph.run(LINEAGE_STATEMENT, {"types": sorted(self.types)}).data()
+        self.graph.run(CLEAR_STATEMENT)
+        builder = ProvGraphBuilder()
+        for row in rows:
+            builder.edge(UPSTREAM, builder.node(row["start"], _type_label(row["start_labels"])),
+                         builder.node(row["end"], _type_label(row["end_labels"])))
+        self.stats["edges"] += len(rows)
+        sources = set(row["start"] for row in rows)
+        self._write(self._pairs(builder, sorted(sources)))
+        return dict(self.stats)
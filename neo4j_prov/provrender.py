@@ -0,0 +1,166 @@
+# cached rendering of prov documents (graphviz via prov.dot): the output is
+# keyed by a content hash of the document, so notebooks re-running a cell get
+# the file rendered before; files are written under unique temporary names
+# and renamed into the cache, so concurrent kernels never see partial files;
+# big documents are rendered as a summary (one node per type or bundle)
+
+"""
+=============================================
+W3C PROV document rendering
+=============================================
+
+Cache: files <sha1 of the PROVBIN encoding>[-<grouping>].<format> in
+cache_dir (default <tempdir>/provio-render). A file once rendered is
+returned as is; the cache is never cleaned up automatically.
+
+Summaries: documents with more than max_nodes element nodes (elements
+and uris referenced by relations) are collapsed by grouping:
+
+* "type": one node per PROV type (Entity, Activity, Agent, ... with the
+  prov.dot styles), e.g. "Entity (1200)"
+* "bundle": one node per bundle (the document level records as
+  "document")
+
+with one edge per relation type between two groups, labelled with the
+number of relations. Rendering time then depends on the number of types
+/ bundles only.
+
+Usage:
+
+     filename = provrender.render(prov_doc, format="svg")
+
+"""
+
+import os
+import hashlib
+import tempfile
+import collections
+
+import pydot
+from prov.dot import prov_to_dot, DOT_PROV_STYLE
+from prov.model import PROV_ENTITY, PROV_ACTIVITY, PROV_AGENT, PROV_BUNDLE
+
+import provbin
+from neo4jcsv import type_label, ROLE_LABELS, GENERIC_LABEL
+
+FORMATS = ("png", "svg", "pdf", "jpg", "dot")
+GROUPINGS = ("type", "bundle")
+DEFAULT_MAX_NODES = 500
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "provio-render")
+DOCUMENT_GROUP = "document"
+
+_LABEL_STYLES = {"Entity": DOT_PROV_STYLE[PROV_ENTITY],
+                 "Activity": DOT_PROV_STYLE[PROV_ACTIVITY],
+                 "Agent": DOT_PROV_STYLE[PROV_AGENT],
+                 "Bundle": DOT_PROV_STYLE[PROV_BUNDLE]}
+
+
+class ProvRenderException(Exception):
+    pass
+
+
+def document_hash(prov_doc):
+    '''
+    sha1 of the PROVBIN encoding of a document (records in document order)
+    '''
+    return hashlib.sha1(provbin.dumps(prov_doc)).hexdigest()
+
+
+def _document_groups(prov_doc, grouping):
+    '''
+    Returns:
+        (dict uri -> group of every node, list of (group, group, relation type))
+    '''
+    groups = {}
+    referenced = {}
+    relations = []
+    for (bundle_id, rec) in provbin.iter_doc_records(prov_doc):
+        bundle = DOCUMENT_GROUP if bundle_id is None else str(bundle_id)
+        if rec.is_element():
+            groups[rec.identifier.uri] = type_label(rec.get_type()) if grouping == "type" else bundle
+            continue
+        formal = rec.formal_attributes
+        if len(formal) < 2 or formal[0][1] is None or formal[1][1] is None:
+            continue
+        ends = []
+        for (role, qname) in formal[:2]:
+            referenced.setdefault(qname.uri, ROLE_LABELS.get(role, GENERIC_LABEL)
+                                  if grouping == "type" else bundle)
+            ends.append(qname.uri)
+        relations.append((ends[0], ends[1], rec.get_type()))
+    for uri, group in referenced.items():
+        groups.setdefault(uri, group)
+    return groups, [(groups[a], groups[b], rel_type) for (a, b, rel_type) in relations]
+
+
+def node_count(prov_doc):
+    '''
+    number of nodes of the rendered document (elements and uris referenced
+    by relations)
+    '''
+    return len(_document_groups(prov_doc, "type")[0])
+
+
+def summary_dot(prov_doc, grouping="type"):
+    '''
+    pydot graph of the document collapsed by grouping ("type" or "bundle")
+    '''
+    if grouping not in GROUPINGS:
+        raise ProvRenderException("grouping must be one of " + ", ".join(GROUPINGS))
+    groups, relations = _document_groups(prov_doc, grouping)
+    sizes = collections.Counter(groups.values())
+    counts = collections.Counter(relations)
+    dot = pydot.Dot(graph_type="digraph", rankdir="BT", charset="utf-8")
+    ids = {}
+    for i, group in enumerate(sorted(sizes)):
+        ids[group] = "g%d" % i
+        style = dict(_LABEL_STYLES.get(group, DOT_PROV_STYLE[0]) if grouping == "type"
+                     else DOT_PROV_STYLE[PROV_BUNDLE])
+        style["label"] = '"%s (%d)"' % (group.replace('"', '\\"'), sizes[group])
+        dot.add_node(pydot.Node(ids[group], **style))
+    for (start, end, rel_type), count in sorted(counts.items(), key=lambda item: str(item[0])):
+        style = dict(DOT_PROV_STYLE.get(rel_type, {}))
+        style["label"] = '"%s (%d)"' % (style.get("label", rel_type._str), count)
+        dot.add_edge(pydot.Edge(ids[start], ids[end], **style))
+    return dot
+
+
+def render(prov_doc, format="png", cache_dir=None, max_nodes=DEFAULT_MAX_NODES, grouping="type"):
+    '''
+    render a document (summarized above max_nodes nodes, see summary_dot)
+
+    Args:
+        format (str): one of FORMATS ("dot": the graphviz source)
+        cache_dir (str): default DEFAULT_CACHE_DIR
+        max_nodes (int): None never summarizes
+    Returns:
+        file name of the rendered document in cache_dir
+    '''
+    if format not in FORMATS:
+        raise ProvRenderException("format must be one of " + ", ".join(FORMATS))
+    if grouping not in GROUPINGS:
+        raise ProvRenderException("grouping must be one of " + ", ".join(GROUPINGS))
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    summarize = max_nodes is not None and node_count(prov_doc) > max_nodes
+    key = document_hash(prov_doc) + ("-" + grouping if summarize else "")
+    filename = os.path.join(cache_dir, "%s.%s" % (key, format))
+    if os.path.exists(filename):
+        return filename
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # created by a concurrent render
+            if not os.path.isdir(cache_dir):
+                raise
+    dot = summary_dot(prov_doc, grouping) if summarize else prov_to_dot(prov_doc)
+    fd, tmp = tempfile.mkstemp(prefix=key + ".", suffix="." + format, dir=cache_dir)
+    os.close(fd)
+    try:
+        dot.write(tmp, format="raw" if format == "dot" else format)
+        # atomic: readers see either no file or the complete one
+        os.rename(tmp, filename)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return filename
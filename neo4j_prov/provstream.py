@@ -0,0 +1,340 @@
+# streaming readers for PROV-XML and PROV-JSON files: records are parsed and
+# handed out one after the other instead of deserializing the whole file into
+# one ProvDocument, so that big provenance files can be loaded into neo4j
+# (neo4jbatch.BatchLoader.load_records, neo4jcsv.Neo4jCSVWriter) in constant
+# memory
+
+"""
+=============================================
+W3C PROV streaming readers
+=============================================
+
+Both readers yield (bundle_id, record) tuples, like provbin.iter_doc_records
+(bundle_id is None for records of the document itself). Records are decoded
+with the prov package serializers in small batches, each batch into a
+scratch ProvDocument which is dropped afterwards; nothing else of the input
+is kept.
+
+* PROV-XML: lxml iterparse, every record element is decoded when its end
+  tag is reached and cleared afterwards; bundleContent elements are
+  entered, not collected
+* PROV-JSON: an incremental scanner walks the object structure and decodes
+  one record value at a time (json raw_decode). The prefixes of a
+  document or bundle are needed before its records; if a "prefix" member
+  comes after the records (the prov serializer writes members in any
+  order), the file is scanned once beforehand to collect all prefixes.
+
+Usage:
+
+     for bundle_id, rec in provstream.iter_records("big.xml", "xml"):
+         ...
+
+"""
+
+import io
+import re
+import json
+
+from lxml import etree
+import prov.model as prov
+from prov.serializers.provjson import decode_json_container
+from prov.serializers.provxml import ProvXMLSerializer, xml_qname_to_QualifiedName, _ns_prov
+
+# records decoded into one scratch document
+DEFAULT_BATCH = 1000
+READ_SIZE = 1 << 16
+
+
+class ProvStreamException(Exception):
+    pass
+
+
+def iter_records(filename, format, batch=DEFAULT_BATCH):
+    '''
+    Args:
+        format (str): "xml" or "json"
+    Returns:
+        generator of (bundle_id, record)
+    '''
+    if format == "xml":
+        return iter_xml_records(filename, batch)
+    elif format == "json":
+        return iter_json_records(filename, batch)
+    raise ProvStreamException("no streaming reader for format " + format)
+
+
+#---------------------------------------------------------------
+# PROV-XML
+
+def iter_xml_records(filename, batch=DEFAULT_BATCH):
+    serializer = ProvXMLSerializer()
+    prov_ns = prov.PROV.uri
+    depth = 0
+    bundle_id = None
+    pending = []
+
+    def decode(elements):
+        scratch = prov.ProvDocument()
+        serializer.deserialize_subtree(elements, scratch)
+        return scratch.get_records()
+
+    for event, elem in etree.iterparse(filename, events=("start", "end"), remove_comments=True):
+        if event == "start":
+            depth += 1
+            if depth == 2 and elem.tag == "{%s}bundleContent" % prov_ns:
+                id_tag = _ns_prov("id")
+                if id_tag not in elem.attrib:
+                    raise ProvStreamException("bundleContent without prov:id")
+                for rec in decode(pending):
+                    yield (bundle_id, rec)
+                pending = []
+                bundle_id = xml_qname_to_QualifiedName(elem, elem.attrib[id_tag])
+            continue
+
+        depth -= 1
+        if depth == 1 and elem.tag == "{%s}bundleContent" % prov_ns:
+            for rec in decode(pending):
+                yield (bundle_id, rec)
+            pending = []
+            bundle_id = None
+        elif depth == 1 or (depth == 2 and bundle_id is not None):
+            # a record: decoded with the batch, its subtree freed afterwards
+            pending.append(elem)
+            if len(pending) >= batch:
+                for rec in decode(pending):
+                    yield (bundle_id, rec)
+                pending = []
+            else:
+                continue
+        else:
+            continue
+        # drop the finished elements from the tree built so far
+        parent = elem.getparent()
+        elem.clear()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    for rec in decode(pending):
+        yield (bundle_id, rec)
+
+
+#---------------------------------------------------------------
+# PROV-JSON
+
+_WS = re.compile(r"[ \t\n\r]*")
+
+
+class _JSONScanner(object):
+    '''
+    incremental JSON reader: structural characters are consumed one by one,
+    values are decoded with raw_decode from a buffer refilled as needed
+    '''
+
+    def __init__(self, f, read_size=READ_SIZE):
+        self._f = f
+        self._read_size = read_size
+        self._decoder = json.JSONDecoder()
+        self.buf = u""
+        self.pos = 0
+
+    def _fill(self):
+        data = self._f.read(self._read_size)
+        if not data:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''
+        next non whitespace character, None at the end of the input
+        '''
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, chars):
+        c = self.peek()
+        if c is None or c not in chars:
+            raise ProvStreamException("expected one of '%s' but found %r" % (chars, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # a number at the end of the buffer may go on
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        '''
+        keys of the object starting at the current position; the caller
+        consumes each member value before asking for the next key
+        '''
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+
+def _scan_prefixes(filename):
+    '''
+    Returns:
+        (prefixes of the document, dict bundle key -> prefixes)
+    '''
+    doc_prefixes = {}
+    bundles = {}
+    with io.open(filename, encoding="utf8") as f:
+        scanner = _JSONScanner(f)
+        for key in scanner.members():
+            if key == "prefix":
+                doc_prefixes = scanner.value()
+            elif key == "bundle":
+                for bundle_key in scanner.members():
+                    for member in scanner.members():
+                        if member == "prefix":
+                            bundles[bundle_key] = scanner.value()
+                        else:
+                            _skip_records(scanner)
+            else:
+                _skip_records(scanner)
+    return doc_prefixes, bundles
+
+
+def _skip_records(scanner):
+    for rec_id in scanner.members():
+        scanner.value()
+
+
+def _set_prefixes(bundle, prefixes):
+    for prefix, uri in prefixes.items():
+        if prefix == "default":
+            bundle.set_default_namespace(uri)
+        else:
+            bundle.add_namespace(prov.Namespace(prefix, uri))
+
+
+class _JSONBatch(object):
+    '''
+    record values of one container (document or bundle) waiting to be
+    decoded together
+    '''
+
+    def __init__(self, prefix_list, batch):
+        self.prefix_list = prefix_list
+        self.batch = batch
+        self.content = {}
+        self.size = 0
+
+    def add(self, rec_type, rec_id, value):
+        records = self.content.setdefault(rec_type, {})
+        out = []
+        if rec_id in records:
+            out = self.decode()
+            records = self.content.setdefault(rec_type, {})
+        records[rec_id] = value
+        self.size += 1
+        if self.size >= self.batch:
+            out.extend(self.decode())
+        return out
+
+    def decode(self):
+        if not self.size:
+            return []
+        scratch = prov.ProvDocument()
+        for prefixes in self.prefix_list:
+            _set_prefixes(scratch, prefixes)
+        decode_json_container(self.content, scratch)
+        self.content = {}
+        self.size = 0
+        return scratch.get_records()
+
+
+def _records(scanner, rec_type, pending):
+    '''
+    records of the object of one record type (id -> value members)
+    '''
+    for rec_id in scanner.members():
+        for rec in pending.add(rec_type, rec_id, scanner.value()):
+            yield rec
+
+
+def _iter_bundle(scanner, doc_prefixes, lookup, batch):
+    '''
+    Args:
+        lookup: function returning the prefixes of the bundle from a scan of
+            the whole file (for a "prefix" member after the records)
+    '''
+    own = None
+    pending = None
+    for key in scanner.members():
+        if key == "prefix":
+            own = scanner.value()
+            continue
+        if pending is None:
+            if own is None:
+                own = lookup()
+            pending = _JSONBatch([doc_prefixes, own], batch)
+        for rec in _records(scanner, key, pending):
+            yield rec
+    if pending is not None:
+        for rec in pending.decode():
+            yield rec
+
+
+def iter_json_records(filename, batch=DEFAULT_BATCH):
+    scanned = []
+
+    def scan():
+        if not scanned:
+            scanned.append(_scan_prefixes(filename))
+        return scanned[0]
+
+    with io.open(filename, encoding="utf8") as f:
+        scanner = _JSONScanner(f)
+        doc_prefixes = None
+        pending = None
+        for key in scanner.members():
+            if key == "prefix":
+                doc_prefixes = scanner.value()
+                continue
+            if doc_prefixes is None:
+                doc_prefixes = scan()[0]
+            if key == "bundle":
+                if pending is not None:
+                    for rec in pending.decode():
+                        yield (None, rec)
+                for bundle_key in scanner.members():
+                    scratch = prov.ProvDocument()
+                    _set_prefixes(scratch, doc_prefixes)
+                    bundle_id = scratch.valid_qualified_name(bundle_key)
+                    lookup = lambda: scan()[1].get(bundle_key, {})
+                    for rec in _iter_bundle(scanner, doc_prefixes, lookup, batch):
+                        yield (bundle_id, rec)
+                continue
+            if pending is None:
+                pending = _JSONBatch([doc_prefixes], batch)
+            for rec in _records(scanner, key, pending):
+                yield (None, rec)
+        if pending is not None:
+            for rec in pending.decode():
+                yield (None, rec)
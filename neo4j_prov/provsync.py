@@ -0,0 +1,282 @@
+# incremental sync of re-emitted prov documents into neo4j: the content of
+# every node and relationship a document produced is hashed, the hashes of
+# the version loaded last are stored in the graph, and a new version only
+# writes the differences (in one transaction) instead of being reloaded on
+# top of the old one, which leaves its removed records behind
+
+"""
+=============================================
+W3C PROV / neo4j document sync
+=============================================
+
+Every synced document has a key (e.g. its file name or the id of the
+workflow step) and a state node (:ProvDocument {uri: key, hashes, keys}):
+one content hash per item of the document and the item it stands for.
+
+Items (graph model of neo4jbatch, rows of neo4jbatch.record_rows):
+
+* nodes: (label, uri) with their properties (label, typed attributes).
+  Nodes are MERGEd on the key label Element (neo4jcsv.KEY_LABEL) and get
+  their PROV type label added. Changed properties or a changed label are
+  an update (replacing all properties and the PROV type label of the
+  node).
+* referenced nodes: uris referenced by relations only, with their role
+  label. They only get label and properties when they are new (or were
+  elements of the previous version of the same document), so a document
+  referencing e.g. a shared dataset leaves the properties set by the
+  document declaring it as they are.
+* relationships (incl. the role relationships of n-ary relations):
+  (type, start, end, endpoint labels, properties); two
+  equal relations of one document are one relationship. A changed
+  relation is removed and added again.
+
+Nodes created by a sync keep the keys of the documents containing them
+in a sources list; a node removed from one document is deleted (with its
+relationships) only when no other synced document contains it any more.
+Nodes without sources, created (or merged later) by neo4jbatch.BatchLoader,
+provio.load_graph or ingest_files, may carry data of documents which are
+not synced and are never deleted by a sync. Relationships carry
+the document key (doc) and their hash (prov_hash) and belong to one
+document.
+
+sync() reads the previous state, computes the deltas in memory and
+writes them, together with the new state, in a single transaction of
+UNWIND statements (at most batch_size rows each): relationship removals,
+node removals, node additions / updates, relationship additions.
+
+The UPSTREAM closure of provlineage.py is not maintained by the
+statements above. With a LineageIndex (lineage argument) sync() updates
+it afterwards: incrementally for added lineage relationships, by a
+rebuild() (reading all lineage relationships of the graph) when lineage
+relationships were removed, since removed closure pairs cannot be told
+from pairs still reachable over other paths. Without one, run
+LineageIndex.rebuild() after syncs which remove lineage relationships.
+
+Usage:
+
+     syncer = provsync.DocumentSync(Graph())
+     stats = syncer.sync("runs/step1.json", neo4jbatch.record_rows(records))
+
+"""
+
+import json
+import hashlib
+import datetime
+import collections
+
+import six
+
+from neo4jbatch import (rel_statement, typed_row, time_assignments, label_assignments, NODE_ROW,
+                        DEFAULT_BATCH_SIZE)
+from neo4jcsv import schema_statements, KEY_LABEL
+
+DOCUMENT_LABEL = "ProvDocument"
+
+STATE_STATEMENT = (u"MATCH (d:`%s` {uri: {doc}}) RETURN d.hashes AS hashes, d.keys AS keys"
+                   % DOCUMENT_LABEL)
+STATE_WRITE_STATEMENT = (u"MERGE (d:`%s` {uri: {doc}}) SET d.hashes = {hashes}, d.keys = {keys}"
+                         % DOCUMENT_LABEL)
+# sources: only on nodes created by a sync (see module doc)
+SOURCES_UPDATE = (u"n.sources = CASE WHEN %s IS NULL THEN NULL "
+                  u"ELSE [s IN %s WHERE s <> {doc}] + {doc} END")
+NODE_SYNC_STATEMENT = (u"UNWIND {rows} AS row MERGE (n:`%s` {uri: row.uri}) "
+                       u"ON CREATE SET n.sources = [] WITH n, row, n.sources AS sources SET %%sn = row.props, %s%%s"
+                       % (KEY_LABEL, SOURCES_UPDATE % ("sources", "sources")))
+NODE_REFERENCE_STATEMENT = (u"UNWIND {rows} AS row MERGE (n:`%s` {uri: row.uri}) "
+                            u"ON CREATE SET %%sn = row.props, n.sources = [] SET %s"
+                            % (KEY_LABEL, SOURCES_UPDATE % ("n.sources", "n.sources")))
+NODE_RELABEL_STATEMENT = u"UNWIND {rows} AS row MATCH (n:`%s` {uri: row.uri}) REMOVE n:`%%s`" % KEY_LABEL
+NODE_RELEASE_STATEMENT = (u"UNWIND {rows} AS row MATCH (n:`%s` {uri: row.uri}) "
+                          u"WHERE n.sources IS NOT NULL "
+                          u"SET n.sources = [s IN n.sources WHERE s <> {doc}] "
+                          u"WITH n WHERE size(n.sources) = 0 DETACH DELETE n" % KEY_LABEL)
+REL_DELETE_STATEMENT = (u"UNWIND {rows} AS row "
+                        u"MATCH (a:`%s` {uri: row.start})-[r:`%%s` {prov_hash: row.hash}]->"
+                        u"(b:`%s` {uri: row.end}) WHERE r.doc = {doc} DELETE r" % (KEY_LABEL, KEY_LABEL))
+
+
+def content_hash(item):
+    '''
+    sha1 of the canonical JSON of an item (lists, strings and dicts)
+    '''
+    text = json.dumps(item, sort_keys=True, separators=(",", ":"), ensure_ascii=True,
+                      default=_json_value)
+    return hashlib.sha1(text.encode("ascii")).hexdigest()
+
+
+def _json_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError("no JSON value for %r" % value)
+
+
+def document_items(rows):
+    '''
+    nodes and relationships of a document (rows of neo4jbatch.record_rows)
+
+    Returns:
+        dict hash -> (key, properties) with key ["node", label, uri],
+        ["ref", role label, uri] (uris referenced by relations only) or
+        ["rel", type, start label, end label, start, end]
+    '''
+    elements = {}
+    referenced = {}
+    relations = []
+    for row in rows:
+        if row[0] == NODE_ROW:
+            elements[six.text_type(row[1])] = (row[2], row[3], row[4])
+        else:
+            rel_type, start, end, props = row[1:]
+            for (uri, label, text) in (start, end):
+                referenced.setdefault(six.text_type(uri), (label, text, {}))
+            relations.append((rel_type, six.text_type(start[0]), six.text_type(end[0]), props))
+    # element types win over role labels
+    labels = dict((uri, value[0]) for (uri, value) in referenced.items())
+    labels.update((uri, value[0]) for (uri, value) in elements.items())
+    items = {}
+    for uri, label in labels.items():
+        text, attributes = (elements[uri] if uri in elements else referenced[uri])[1:]
+        key = ["node" if uri in elements else "ref", label, uri]
+        props = dict(attributes, label=text, URL=uri, uri=uri)
+        items[content_hash([key, props])] = (key, props)
+    for (rel_type, start, end, props) in relations:
+        key = ["rel", rel_type, labels[start], labels[end], start, end]
+        items[content_hash([key, props])] = (key, props)
+    return items
+
+
+class DocumentSync(object):
+    '''
+    Args:
+        graph: py2neo Graph (or benchmarks/recordinggraph.RecordingGraph)
+        batch_size (int): rows per UNWIND statement (all in one transaction)
+        create_schema (bool): create the uri uniqueness constraints of the
+            labels written (and of the document state nodes)
+        lineage: provlineage.LineageIndex whose UPSTREAM closure is updated
+            after every sync (see module doc)
+    '''
+
+    def __init__(self, graph, batch_size=DEFAULT_BATCH_SIZE, create_schema=True, lineage=None):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.create_schema = create_schema
+        self.lineage = lineage
+        self._schema = set()
+
+    def _constrain(self, labels):
+        if not self.create_schema:
+            return
+        for label in sorted(set(labels) - self._schema):
+            self._schema.add(label)
+            for statement in schema_statements([label]):
+                self.graph.run(statement)
+
+    def previous(self, doc):
+        '''
+        Returns:
+            dict hash -> key of the version of doc synced last (empty if none)
+        '''
+        rows = self.graph.run(STATE_STATEMENT, {"doc": doc}).data()
+        if not rows or rows[0]["hashes"] is None:
+            return {}
+        return dict(zip(rows[0]["hashes"], [json.loads(k) for k in rows[0]["keys"]]))
+
+    def _run(self, tx, statements, doc):
+        for statement, rows in statements:
+            for i in range(0, len(rows), self.batch_size):
+                tx.run(statement, {"rows": rows[i:i + self.batch_size], "doc": doc})
+
+    def sync(self, doc, rows):
+        '''
+        make the graph contain the given version of document doc
+
+        Args:
+            doc (str): document key
+            rows: neo4jbatch.record_rows of the new version
+        Returns:
+            dict with the numbers of nodes / relationships added, updated,
+            removed and of unchanged items
+        '''
+        doc = six.text_type(doc)
+        if self.lineage is not None:
+            # read again for the closure update
+            rows = list(rows)
+        items = document_items(rows)
+        old = self.previous(doc)
+        added = [h for h in items if h not in old]
+        removed = [h for h in old if h not in items]
+        stats = {"nodes_added": 0, "nodes_updated": 0, "nodes_removed": 0,
+                 "relationships_added": 0, "relationships_removed": 0,
+                 "unchanged": len(items) - len(added)}
+
+        kept_nodes = set(items[h][0][2] for h in items if items[h][0][0] != "rel")
+        rel_deletes = collections.defaultdict(list)
+        releases = []
+        for h in removed:
+            key = old[h]
+            if key[0] == "rel":
+                rel_type, start_label, end_label, start, end = key[1:]
+                rel_deletes[rel_type].append({"start": start, "end": end, "hash": h})
+                stats["relationships_removed"] += 1
+            elif key[2] not in kept_nodes:
+                releases.append({"uri": key[2]})
+                stats["nodes_removed"] += 1
+        # uri -> (kind, PROV type label) of the old version
+        old_nodes = dict((key[2], key[:2]) for key in old.values() if key[0] != "rel")
+        relabels = collections.defaultdict(list)
+        node_syncs = collections.defaultdict(list)
+        references = collections.defaultdict(list)
+        rel_creates = collections.defaultdict(list)
+        for h in added:
+            key, props = items[h]
+            if key[0] != "rel":
+                old_kind, old_label = old_nodes.get(key[2], (None, None))
+                if key[0] == "ref" and old_kind != "node":
+                    references[key[1]].append(typed_row({"uri": key[2]}, props)[0])
+                else:
+                    # elements, and elements of the old version now only referenced
+                    row, times = typed_row({"uri": key[2]}, props)
+                    node_syncs[(key[1], times)].append(row)
+                    if old_label not in (None, key[1], KEY_LABEL):
+                        relabels[old_label].append({"uri": key[2]})
+                stats["nodes_updated" if old_kind is not None else "nodes_added"] += 1
+            else:
+                rel_type, start_label, end_label, start, end = key[1:]
+                row, times = typed_row({"start": start, "end": end},
+                                       dict(props, prov_hash=h, doc=doc))
+                rel_creates[(rel_type, False, times)].append(row)
+                stats["relationships_added"] += 1
+        if not added and not removed:
+            return stats
+
+        self._constrain([DOCUMENT_LABEL, KEY_LABEL] + [label for (label, times) in node_syncs] +
+                        list(references))
+        statements = []
+        statements.extend((REL_DELETE_STATEMENT % rel_type, rows)
+                          for rel_type, rows in sorted(rel_deletes.items()))
+        if releases:
+            statements.append((NODE_RELEASE_STATEMENT, releases))
+        statements.extend((NODE_RELABEL_STATEMENT % label, rows)
+                          for label, rows in sorted(relabels.items()))
+        statements.extend((NODE_SYNC_STATEMENT % (label_assignments("n", label),
+                                                  time_assignments("n", times)), rows)
+                          for (label, times), rows in sorted(node_syncs.items()))
+        statements.extend((NODE_REFERENCE_STATEMENT % label_assignments("n", label), rows)
+                          for label, rows in sorted(references.items()))
+        statements.extend((rel_statement(*key), rows) for key, rows in sorted(rel_creates.items()))
+        tx = self.graph.begin()
+        try:
+            self._run(tx, statements, doc)
+            hashes = sorted(items)
+            tx.run(STATE_WRITE_STATEMENT, {"doc": doc, "hashes": hashes,
+                                           "keys": [json.dumps(items[h][0]) for h in hashes]})
+            tx.commit()
+        except Exception:
+            tx.rollback()
+            raise
+        if self.lineage is not None:
+            if any(rel_type in self.lineage.types for rel_type in rel_deletes):
+                self.lineage.rebuild()
+            elif any(key[0] in self.lineage.types for key in rel_creates):
+                self.lineage.update(rows)
+        return stats
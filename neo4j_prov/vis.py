@@ -5,6 +5,10 @@
 from IPython.display import IFrame
 import json
 import uuid
+import time
+import random
+
+from neo4jcsv import KEY_LABEL
 
 def vis_network(nodes, edges, physics=False):
     html = """
@@ -65,16 +69,61 @@ def vis_network(nodes, edges, physics=False):
 
     return IFrame(filename, width="100%", height="400")
 
-def draw(graph, options, physics=False, limit=100):
-    # The options argument should be a dictionary of node labels and property keys; it determines which property
-    # is displayed for the node label. For example, in the movie graph, options = {"Movie": "title", "Person": "name"}.
-    # Omitting a node label from the options dict will leave the node unlabeled in the visualization.
-    # Setting physics = True makes the nodes bounce around when you touch them!
-    query = """
+# node sampling for draw: every strategy returns node ids, the nodes and their
+# outgoing relationships are then fetched by id (NodeByIdSeek); none of them
+# sorts the whole database like ORDER BY rand()
+#   id_range:      random windows of node ids between 0 and the highest id
+#                  (id allocator high id + id seeks); nodes come in runs of
+#                  consecutive ids (often created together), ids within one
+#                  window of either end are picked less often, and windows over
+#                  deleted ids return fewer nodes: further windows are tried and
+#                  a short sample is reported
+#   label:         a random offset into the nodes of one label (label scan)
+#   reservoir:     seeded reservoir sample of the ids of all nodes (of a label),
+#                  one streaming pass over the ids, reproducible for a seed
+#   neighbourhood: the nodes within depth hops of a start node (uniqueness
+#                  constraint index seek on label and uri)
+#   random:        the old ORDER BY rand() over all nodes (small graphs only)
+STRATEGIES = ("id_range", "label", "reservoir", "neighbourhood", "random")
+# nodes looked up per sampled node in an id window (ids of deleted nodes are gaps)
+ID_RANGE_FACTOR = 2
+ID_RANGE_ATTEMPTS = 5
+
+COUNT_QUERY = "MATCH (n%s) RETURN count(n)"
+# high id of the node id allocator (no scan); MAX_ID_QUERY (all nodes scan) where
+# the JMX procedure is not available
+HIGH_ID_QUERY = """
+    CALL dbms.queryJmx("org.neo4j:instance=kernel#0,name=Primitive count") YIELD attributes
+    RETURN attributes.NumberOfNodeIdsInUse.value
+    """
+MAX_ID_QUERY = "MATCH (n) RETURN max(id(n))"
+ID_RANGE_QUERY = """
+    UNWIND range({start}, {end}) AS i
+    MATCH (n) WHERE id(n) = i
+    RETURN id(n) AS id
+    LIMIT {limit}
+    """
+LABEL_QUERY = """
+    MATCH (n:`%s`)
+    WITH n SKIP {skip} LIMIT {limit}
+    RETURN id(n) AS id
+    """
+IDS_QUERY = "MATCH (n%s) RETURN id(n) AS id"
+NEIGHBOURHOOD_QUERY = """
+    MATCH (s:`%s` {uri: {uri}})-[*0..%d]-(n)
+    WITH DISTINCT n LIMIT {limit}
+    RETURN id(n) AS id
+    """
+RANDOM_QUERY = """
     MATCH (n)
     WITH n, rand() AS random
     ORDER BY random
     LIMIT {limit}
+    RETURN id(n) AS id
+    """
+EXPAND_QUERY = """
+    UNWIND {ids} AS i
+    MATCH (n) WHERE id(n) = i
     OPTIONAL MATCH (n)-[r]->(m)
     RETURN n AS source_node,
            id(n) AS source_id,
@@ -83,13 +132,92 @@ def draw(graph, options, physics=False, limit=100):
            id(m) AS target_id
     """
 
-    data = graph.run(query, limit=limit)
+
+class SampleException(Exception):
+    pass
+
+
+def _label_pattern(label):
+    return ":`%s`" % label if label else ""
+
+
+def highest_id(graph):
+    # upper bound of the node ids (the ids are not dense: deleted nodes leave gaps)
+    try:
+        high = graph.evaluate(HIGH_ID_QUERY)
+    except Exception:
+        high = None
+    if high is None:
+        high = graph.evaluate(MAX_ID_QUERY)
+    return high or 0
+
+
+def sample_nodes(graph, strategy="id_range", limit=100, label=None, seed=None, start=None, depth=2):
+    # ids of about limit nodes (fewer if the graph / label / neighbourhood is smaller)
+    #   label: node label (required for "label" and "neighbourhood", optional for "reservoir")
+    #   seed: random seed (same seed, same unchanged graph -> same sample)
+    #   start: uri of the start node of "neighbourhood"
+    rng = random.Random(seed)
+    if strategy == "id_range":
+        high = highest_id(graph)
+        span = limit * ID_RANGE_FACTOR
+        ids = []
+        for attempt in range(ID_RANGE_ATTEMPTS):
+            first = rng.randint(0, max(high - span + 1, 0))
+            for row in graph.run(ID_RANGE_QUERY, start=first, end=first + span - 1, limit=limit).data():
+                if row["id"] not in ids:
+                    ids.append(row["id"])
+            if len(ids) >= limit or high < span:
+                break
+        if len(ids) < limit and high >= span:
+            print "id_range: %d of %d nodes sampled (sparse ids, %d windows of %d ids up to id %d)" % (
+                len(ids), limit, ID_RANGE_ATTEMPTS, span, high)
+        return ids[:limit]
+    elif strategy == "label":
+        if not label:
+            raise SampleException("strategy label needs a label")
+        count = graph.evaluate(COUNT_QUERY % _label_pattern(label))
+        skip = rng.randint(0, max(count - limit, 0))
+        return [row["id"] for row in graph.run(LABEL_QUERY % label, skip=skip, limit=limit).data()]
+    elif strategy == "reservoir":
+        ids = []
+        for seen, row in enumerate(graph.run(IDS_QUERY % _label_pattern(label))):
+            if seen < limit:
+                ids.append(row["id"])
+            else:
+                j = rng.randint(0, seen)
+                if j < limit:
+                    ids[j] = row["id"]
+        return ids
+    elif strategy == "neighbourhood":
+        if not (label and start):
+            raise SampleException("strategy neighbourhood needs a label and a start uri")
+        return [row["id"] for row in graph.run(NEIGHBOURHOOD_QUERY % (label, int(depth)),
+                                               uri=start, limit=limit).data()]
+    elif strategy == "random":
+        return [row["id"] for row in graph.run(RANDOM_QUERY, limit=limit).data()]
+    raise SampleException("strategy must be one of " + ", ".join(STRATEGIES))
+
+
+def draw(graph, options, physics=False, limit=100, strategy="id_range", label=None, seed=None,
+         start=None, depth=2):
+    # The options argument should be a dictionary of node labels and property keys; it determines which property
+    # is displayed for the node label. For example, in the movie graph, options = {"Movie": "title", "Person": "name"}.
+    # Omitting a node label from the options dict will leave the node unlabeled in the visualization.
+    # Setting physics = True makes the nodes bounce around when you touch them!
+    # strategy, label, seed, start, depth: how the nodes are sampled, see sample_nodes
+    t0 = time.time()
+    ids = sample_nodes(graph, strategy, limit, label, seed, start, depth)
+    t1 = time.time()
+    data = graph.run(EXPAND_QUERY, ids=ids)
 
     nodes = []
     edges = []
 
     def get_vis_info(node, id):
-        node_label = list(node.labels())[0]
+        # the PROV type, not the key label all prov nodes carry
+        labels = sorted(node.labels())
+        node_label = ([l for l in labels if l != KEY_LABEL] or labels)[0]
         prop_key = options.get(node_label)
         vis_label = node.properties.get(prop_key, "")
 
@@ -116,4 +244,7 @@ def draw(graph, options, physics=False, limit=100):
 
             edges.append({"from": source_info["id"], "to": target_info["id"], "label": rel.type()})
 
+    print "Sampled %d nodes (%s) in %.3fs, %d nodes and %d relationships fetched in %.3fs" % (
+        len(ids), strategy, t1 - t0, len(nodes), len(edges), time.time() - t1)
+
     return vis_network(nodes, edges, physics=physics)
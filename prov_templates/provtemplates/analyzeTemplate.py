@@ -0,0 +1,81 @@
+import sys
+import provconv
+import prov
+import prov.model
+import getopt
+import json
+
+def usage():
+	print "usage: analyzeTemplate.py -i template [-j]"
+	print "  -i, --infile   template (format guessed from extension: provn is not supported by python prov)"
+	print "  -j, --json     print analysis as json"
+
+def read_template(infile):
+	toks=infile.split(".")
+	frmt=toks[len(toks)-1]
+	if frmt in ["ttl", "trig"]:
+		return prov.model.ProvDocument.deserialize(infile, format="rdf", rdf_format={"ttl" : "turtle"}.get(frmt, frmt))
+	elif frmt == "rdf":
+		return prov.model.ProvDocument.deserialize(infile, format="rdf", rdf_format="xml")
+	elif frmt in ["xml", "json"]:
+		return prov.model.ProvDocument.deserialize(infile, format=frmt)
+	return prov.read(infile)
+
+try:
+	opts, args = getopt.getopt(sys.argv[1:], "hi:j", ["help", "infile=", "json"])
+except getopt.GetoptError as err:
+	print str(err)
+	usage()
+	sys.exit(2)
+
+infile=None
+as_json=False
+
+for o, a in opts:
+	if o in ("-h", "--help"):
+		usage()
+		sys.exit()
+	elif o in ("-i", "--infile"):
+		infile = a
+	elif o in ("-j", "--json"):
+		as_json = True
+	else:
+		assert False, "unhandled option"
+
+if not infile:
+	usage()
+	sys.exit(2)
+
+analysis=provconv.analyze_template(read_template(infile))
+
+nwarnings=0
+if as_json:
+	out=dict()
+	for scope in analysis:
+		res=analysis[scope]
+		out[scope]={ "variables" : dict((str(v), s) for (v, s) in res["variables"].items()),
+			     "linked" : [ dict((str(n), l) for (n, l) in g.items()) for g in res["linked"]["groups"] ],
+			     "cycles" : [ [str(n) for n in c] for c in res["linked"]["cycles"] ],
+			     "warnings" : res["warnings"] }
+		nwarnings+=len(res["warnings"])
+	print json.dumps(out, indent=2)
+else:
+	for scope in analysis:
+		res=analysis[scope]
+		if not res["variables"]:
+			continue
+		print "== " + scope
+		print "variables:"
+		for v in res["variables"]:
+			print "  " + str(v)
+			for stmt in res["variables"][v]:
+				print "      " + stmt
+		print "tmpl:linked groups:"
+		for g in res["linked"]["groups"]:
+			print "  " + ", ".join(str(n) + "@" + str(l) for (n, l) in sorted(g.items(), key=lambda x: x[1]))
+		for w in res["warnings"]:
+			print "WARNING: " + w
+		nwarnings+=len(res["warnings"])
+
+if nwarnings:
+	sys.exit(1)
@@ -0,0 +1,167 @@
+'''
+column-wise construction of template bindings from an extracted table
+(pandas DataFrame), as used by the excelExtractor_bindExport scripts
+
+Every column listed in the binding map is converted in one go:
+
+- "iri" columns: each distinct value is quoted and turned into a
+  QualifiedName once, the column is mapped through that cache
+- "float" columns: cast with astype
+- other value types ("literal", "int", "datetime" ...) are kept as they are,
+  or converted to typed PROV literals if a typedLiterals.LiteralConverter
+  is given
+
+Values of "uniqueOnly" variables are deduplicated with a set in first
+occurrence order (no list scans), so the cost is linear in the number of
+rows. Frames can be added incrementally (e.g. chunk by chunk), and the
+bindings of several builders (e.g. one per sheet) can be merged with
+update.
+
+Binding map format (column name -> spec):
+
+    { "tree" : { "varname" : "tree", "type" : "entity", "val" : "iri", "uniqueOnly" : False }, ... }
+
+Provides:
+
+- BindingsBuilder(bindmap, ns_prefix, ns_uri, iri_as_string=False, literals=None)
+  .add_frame(data), .update(other), .bind_dict(), .bindfile_dict()
+
+'''
+
+import pandas
+import prov.model as prov
+
+import typedLiterals
+from typedLiterals import quote_iri
+
+
+class BindingsBuilder(object):
+    '''
+    Args:
+        bindmap (dict): column name -> {"varname", "type", "val", "uniqueOnly"}
+        ns_prefix, ns_uri: namespace of the generated identifiers
+        iri_as_string (bool): put "prefix:localpart" strings instead of
+            QualifiedNames into bind_dict (the bindings file always gets
+            QualifiedNames)
+        literals (typedLiterals.LiteralConverter): convert "int", "float",
+            "datetime" and "literal" columns to typed literals
+    '''
+
+    def __init__(self, bindmap, ns_prefix="ex", ns_uri="http://example.com#", iri_as_string=False,
+                 literals=None):
+        self.bindmap = bindmap
+        self.namespace = prov.Namespace(ns_prefix, ns_uri)
+        self.iri_as_string = iri_as_string
+        self.literals = literals
+        self._iris = {}         # cell value -> (QualifiedName, "prefix:localpart")
+        self._rows = {}         # var id -> number of rows seen
+        self._values = {}       # var id -> values for bind_dict
+        self._file_values = {}  # var id -> values for the bindings file
+        self._seen = {}         # var id -> (set for bind_dict, set for file) of uniqueOnly vars
+        self._types = {}        # var id -> "attr" / "entity"
+        self.rows = 0           # rows added with add_frame
+
+    def _iri(self, value):
+        res = self._iris.get(value)
+        if res is None:
+            local = quote_iri(value)
+            res = self._iris[value] = (prov.QualifiedName(self.namespace, local),
+                                       self.namespace.prefix + ":" + local)
+        return res
+
+    def convert(self, val_type, column):
+        '''
+        convert a column according to its bindmap "val" type
+
+        Returns:
+            (values for bind_dict, values for the bindings file) as lists
+        '''
+        if self.literals is not None and val_type in typedLiterals.LITERAL_TYPES:
+            values = self.literals.convert(val_type, column)
+            return values, values
+        if val_type == "float":
+            values = column.astype(float).tolist()
+            return values, values
+        if val_type == "iri":
+            distinct = pandas.unique(column.values)
+            iris = dict((v, self._iri(v)) for v in distinct)
+            file_values = [iris[v][0] for v in column.values]
+            if self.iri_as_string:
+                return [iris[v][1] for v in column.values], file_values
+            return file_values, file_values
+        values = column.tolist()
+        return values, values
+
+    @staticmethod
+    def _extend(target, seen, values):
+        if seen is None:
+            target.extend(values)
+            return
+        for v in values:
+            if v not in seen:
+                seen.add(v)
+                target.append(v)
+
+    def _variable(self, ID, var_type, unique):
+        if ID not in self._values:
+            self._values[ID] = []
+            self._file_values[ID] = []
+            self._rows[ID] = 0
+            self._types[ID] = var_type
+            if unique:
+                self._seen[ID] = (set(), set())
+        return self._seen.get(ID, (None, None))
+
+    def add_column(self, col, column):
+        spec = self.bindmap[col]
+        ID = "var:" + spec["varname"]
+        values, file_values = self.convert(spec["val"], column)
+        seen, file_seen = self._variable(ID, spec["type"], spec["uniqueOnly"])
+        self._extend(self._values[ID], seen, values)
+        self._extend(self._file_values[ID], file_seen, file_values)
+        self._rows[ID] += len(values)
+
+    def add_frame(self, data):
+        '''
+        add all bindmap columns of a DataFrame
+        '''
+        for col in data.columns.values:
+            if col in self.bindmap:
+                self.add_column(col, data[col])
+        self.rows += len(data)
+
+    def update(self, other):
+        '''
+        append the bindings collected by another builder (of the same
+        bindmap), e.g. of the next sheet; values of uniqueOnly variables
+        already bound are skipped
+        '''
+        for ID, values in other._values.items():
+            seen, file_seen = self._variable(ID, other._types[ID], ID in other._seen)
+            self._extend(self._values[ID], seen, values)
+            self._extend(self._file_values[ID], file_seen, other._file_values[ID])
+            self._rows[ID] += other._rows[ID]
+        self.rows += other.rows
+
+    def bind_dict(self):
+        '''
+        Returns:
+            instance dict for provconv.instantiate_template (a single row
+            gives a plain value, more rows a list)
+        '''
+        out = dict()
+        for ID, values in self._values.items():
+            if self._rows[ID] == 1:
+                out[ID] = values[0]
+            elif self._rows[ID] > 1:
+                out[ID] = list(values)
+        return out
+
+    def bindfile_dict(self):
+        '''
+        Returns:
+            dict var id -> {"type": bindmap type, "value": list of values}
+            for writing the bindings file
+        '''
+        return dict((ID, {"type": self._types[ID], "value": list(values)})
+                    for ID, values in self._file_values.items() if self._rows[ID])
@@ -0,0 +1,907 @@
+'''
+spreadsheet to PROV template bindings converter driven by a mapping file
+
+Generalizes the excelExtractor* scripts: sheet name, cell anchors, column
+to variable map (bindmap), output namespace, constant bindings and the
+template are read from a JSON mapping file (see pnp_mapping.json) instead
+of being hard-coded. A single workbook or a whole directory of workbooks
+(converted in a process pool) is written as one bindings file per workbook,
+as v3-JSON (expandTemplate.py -3) or Turtle, optionally expanded right away.
+
+Several sheets per workbook (layout "sheets": list of sheet names or
+fnmatch patterns such as "Plot*", e.g. one sheet per plot) are read with
+the same layout and their bindings merged into the bindings of the
+workbook; uniqueOnly variables stay duplicate free across sheets. The
+sheets of all workbooks are then read in the process pool, one job per
+sheet, and the time of every sheet is reported.
+
+CSV and Parquet exports (.csv, .parquet) are read as the table itself:
+only the bindmap columns are read, with a dtype per bindmap "val" type, in
+chunks of "chunksize" rows (Parquet: per row group, needs pyarrow), so the
+input is never loaded as a whole.
+
+Mapping file keys:
+
+    layout         cell anchors, see workbookReader.PNP_LAYOUT, optionally
+                   "sheets" (names / patterns) instead of "sheet"
+    key            column name of the table key (default "tree")
+    persons        "rows": one table row per person and key (cross product),
+                   "variable": all persons bound to var:<persons_var>
+    namespace      {"prefix", "uri"} of the generated identifiers
+    namespaces     further {prefix: uri} used in constants
+    iri_as_string  bind iri columns as "prefix:localpart" strings in the
+                   instance dict used for expansion (bindings files always
+                   contain qualified names)
+    bindmap        column name -> {varname, type, val, uniqueOnly}
+    constants      var id -> list of qualified names ("ex:thePlan1")
+    template       template file (relative to the mapping file), for -e
+    typed_literals convert int/float/datetime/literal columns to typed PROV
+                   literals (typedLiterals.py, default false)
+    timezone       timezone of naive dates with typed_literals (default UTC)
+    chunksize      rows per chunk for CSV input (default 100000)
+    csv            further pandas.read_csv arguments, e.g. {"sep": ";"}
+
+Split expansion (-s row|key): instead of one instantiate_template call over
+the bindings of the whole table, the template is expanded for every table
+row, or for every group of rows with the same key (e.g. per tree), in a
+process pool of -p workers. The expanded fragments are concatenated into
+one document (records repeated by several fragments, e.g. the constant
+plans and agents, are kept once). Each expansion only resolves the linked
+groups of its own rows. Workbooks are then converted one after the other.
+
+Incremental mode (-u): a manifest (default <outdir>/manifest.json) records
+the content hashes of every converted workbook, of the mapping and of the
+template. Workbooks whose hashes match the last successful run (and whose
+output files still exist) are skipped.
+
+usage:
+    python bindingsConverter.py -m mapping.json -i workbook.xlsx|directory -o outdir
+                                [-f json|ttl] [-e provn|json|xml|ttl|provbin] [-p processes]
+                                [-s row|key] [-u] [--manifest manifest.json]
+'''
+
+import sys
+import os
+import time
+import json
+import getopt
+import fnmatch
+import hashlib
+import datetime
+import collections
+import multiprocessing
+
+import pandas
+import six
+import prov.model as prov
+
+import provconv
+import workbookReader
+import bindingsBuilder
+import typedLiterals
+
+TMPL_NS = prov.Namespace("tmpl", "http://openprovenance.org/tmpl#")
+VAR_NS = prov.Namespace("var", "http://openprovenance.org/var#")
+VARGEN_NS = prov.Namespace("vargen", "http://openprovenance.org/vargen#")
+
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsm")
+TABLE_EXTENSIONS = (".csv", ".parquet", ".pq")
+DEFAULT_CHUNKSIZE = 100000
+BINDING_FORMATS = {"json": "_bindings.json", "ttl": "_bindings.ttl"}
+SPLIT_MODES = ("row", "key")
+
+
+class MappingException(Exception):
+    pass
+
+
+#---------------------------------------------------------------
+# mapping
+
+def load_mapping(filename):
+    '''
+    read a mapping file; the template path is made absolute
+    '''
+    with open(filename) as f:
+        mapping = json.load(f)
+    for key in ("layout", "namespace", "bindmap"):
+        if key not in mapping:
+            raise MappingException("mapping file %s lacks '%s'" % (filename, key))
+    mapping.setdefault("key", "tree")
+    mapping.setdefault("persons", "rows")
+    mapping.setdefault("iri_as_string", False)
+    mapping.setdefault("constants", {})
+    mapping.setdefault("namespaces", {})
+    mapping.setdefault("typed_literals", False)
+    mapping.setdefault("timezone", None)
+    mapping.setdefault("chunksize", DEFAULT_CHUNKSIZE)
+    mapping.setdefault("csv", {})
+    mapping["csv"].setdefault("encoding", "utf8")
+    if mapping.get("template"):
+        mapping["template"] = os.path.join(os.path.dirname(os.path.abspath(filename)),
+                                           mapping["template"])
+    return mapping
+
+
+def mapping_namespaces(mapping):
+    '''
+    Returns:
+        list of namespaces of the generated bindings (output namespace first)
+    '''
+    out = [prov.Namespace(mapping["namespace"]["prefix"], mapping["namespace"]["uri"])]
+    for prefix, uri in sorted(mapping["namespaces"].items()):
+        out.append(prov.Namespace(prefix, uri))
+    return out
+
+
+def _constant_qname(value, namespaces):
+    prefix, local = value.split(":", 1)
+    for ns in namespaces:
+        if ns.prefix == prefix:
+            return ns[local]
+    raise MappingException("unknown prefix in constant " + value)
+
+
+#---------------------------------------------------------------
+# extraction
+
+def select_sheets(filename, mapping):
+    '''
+    Returns:
+        names of the sheets of a workbook to read: the layout "sheets"
+        names / fnmatch patterns (in workbook order), or the layout "sheet"
+    '''
+    layout = mapping["layout"]
+    if "sheets" not in layout:
+        return [layout.get("sheet", workbookReader.PNP_SHEET)]
+    patterns = layout["sheets"]
+    if isinstance(patterns, six.string_types):
+        patterns = [patterns]
+    names = [n for n in workbookReader.sheet_names(filename)
+             if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+    if not names:
+        raise MappingException("no sheet of %s matches %s" % (filename, ", ".join(patterns)))
+    return names
+
+
+def extract_table(filename, mapping, sheet=None):
+    '''
+    read a workbook sheet (default: the layout "sheet") into the table the
+    bindmap refers to
+
+    Returns:
+        (DataFrame with columns date, key, [person], field names; persons)
+    '''
+    layout = mapping["layout"]
+    if sheet is not None:
+        layout = dict(layout, sheet=sheet)
+    date, persons, fnames, trees = workbookReader.read_sheet(filename, layout)
+    by_person = mapping["persons"] == "rows"
+    date = str(date.isoformat()) if date is not None else ""
+
+    keys = list(trees.keys())
+    reps = len(persons) if by_person else 1
+    table = collections.OrderedDict()
+    table["date"] = [date] * (reps * len(keys))
+    table[mapping["key"]] = keys * reps
+    if by_person:
+        table["person"] = [p for p in persons for t in keys]
+    for col in fnames:
+        table[col] = [trees[t].get(col, "") for t in keys] * reps
+    return pandas.DataFrame(table, columns=list(table.keys())), persons
+
+
+def is_table_file(filename):
+    return filename.lower().endswith(TABLE_EXTENSIONS)
+
+
+def iter_table_chunks(filename, mapping):
+    '''
+    read the bindmap columns of a CSV or Parquet file chunk by chunk
+
+    "float" columns are read as floats (empty cells: NaN), all others as
+    text with "" for empty cells, like cells read from a workbook (Parquet
+    integers with nulls as "5", not "5.0"; timestamps in ISO format)
+
+    Returns:
+        generator of DataFrames
+    '''
+    bindmap = mapping["bindmap"]
+    floats = [c for c in bindmap if bindmap[c]["val"] == "float"]
+    if filename.lower().endswith(".csv"):
+        header = pandas.read_csv(filename, nrows=0, **mapping["csv"])
+        usecols = [c for c in header.columns if c in bindmap]
+        dtypes = dict((c, float if c in floats else object) for c in usecols)
+        for chunk in pandas.read_csv(filename, usecols=usecols, dtype=dtypes,
+                                     keep_default_na=False,
+                                     na_values=dict((c, [""]) for c in usecols if c in floats),
+                                     chunksize=mapping["chunksize"], **mapping["csv"]):
+            yield chunk
+        return
+
+    try:
+        import pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise MappingException("reading %s needs pyarrow" % filename)
+    pfile = pq.ParquetFile(filename)
+    usecols = [c for c in pfile.schema.names if c in bindmap]
+    for i in range(pfile.num_row_groups):
+        table = pfile.read_row_group(i, columns=usecols)
+        chunk = table.to_pandas()
+        for col in usecols:
+            if col in floats:
+                continue
+            column = table.column(col)
+            if pyarrow.types.is_integer(column.type):
+                # as text before pandas turns integers with nulls into floats
+                values = column.cast(pyarrow.string()).to_pylist()
+            else:
+                values = chunk[col].tolist()
+            chunk[col] = pandas.Series([_cell_text(v) for v in values], index=chunk.index,
+                                       dtype=object)
+        yield chunk
+
+
+def _cell_text(value):
+    '''
+    text of a Parquet value as read from a CSV file ("" for nulls)
+    '''
+    if typedLiterals.is_empty(value) or value is pandas.NaT:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return six.text_type(value.isoformat())
+    if isinstance(value, six.binary_type):
+        return value.decode("utf8")
+    return six.text_type(value)
+
+
+def read_tables(filename, mapping):
+    '''
+    Returns:
+        (frames, persons) of a table file or of the selected sheets of a
+        workbook (persons of all sheets, without repetitions)
+    '''
+    if is_table_file(filename):
+        return iter_table_chunks(filename, mapping), []
+    frames = []
+    persons = []
+    for sheet in select_sheets(filename, mapping):
+        data, sheet_persons = extract_table(filename, mapping, sheet)
+        frames.append(data)
+        persons.extend(p for p in sheet_persons if p not in persons)
+    return frames, persons
+
+
+def new_builder(mapping):
+    namespaces = mapping_namespaces(mapping)
+    literals = None
+    if mapping["typed_literals"]:
+        literals = typedLiterals.LiteralConverter(mapping["timezone"], namespaces[0])
+    return bindingsBuilder.BindingsBuilder(mapping["bindmap"], namespaces[0].prefix,
+                                           namespaces[0].uri, mapping["iri_as_string"],
+                                           literals)
+
+
+def make_bindings(frames, persons, mapping):
+    '''
+    Args:
+        frames: iterable of DataFrames (table or table chunks)
+        persons: list of persons (bound to var:<persons_var> if configured)
+        mapping: converter mapping
+    Returns:
+        (bind_dict for provconv.instantiate_template,
+         bindfile_dict var id -> {"type", "value"} for the bindings file,
+         number of table rows)
+    '''
+    builder = new_builder(mapping)
+    for data in frames:
+        builder.add_frame(data)
+    return finish_bindings(builder, persons, mapping)
+
+
+def finish_bindings(builder, persons, mapping):
+    '''
+    bindings of a filled BindingsBuilder plus persons and constants, see
+    make_bindings
+    '''
+    namespaces = mapping_namespaces(mapping)
+    bind_dict = builder.bind_dict()
+    bindfile_dict = builder.bindfile_dict()
+
+    extra = collections.OrderedDict()
+    if mapping["persons"] == "variable" and persons:
+        extra["var:" + mapping["persons_var"]] = [namespaces[0][typedLiterals.quote_iri(p)]
+                                                  for p in persons]
+    for ID in sorted(mapping["constants"]):
+        extra[ID] = [_constant_qname(v, namespaces) for v in mapping["constants"][ID]]
+    for ID, values in extra.items():
+        bindfile_dict[ID] = {"type": "entity", "value": values}
+        bind_dict[ID] = values if len(values) > 1 else values[0]
+    return bind_dict, bindfile_dict, builder.rows
+
+
+def split_frames(frames, mapping, split):
+    '''
+    split the table into the row groups expanded independently
+
+    Args:
+        split: "row" (one group per row) or "key" (one group per value of
+            the mapping key column, in order of first occurrence; the
+            table is collected first)
+    Returns:
+        generator of DataFrames
+    '''
+    if split == "row":
+        for data in frames:
+            for i in range(len(data)):
+                yield data.iloc[i:i + 1]
+        return
+    data = pandas.concat(list(frames), ignore_index=True)
+    if mapping["key"] not in data.columns:
+        raise MappingException("table has no key column '%s'" % mapping["key"])
+    for key, group in data.groupby(mapping["key"], sort=False):
+        yield group
+
+
+#---------------------------------------------------------------
+# output
+
+def make_binding_doc(bindfile_dict, namespaces):
+    '''
+    bindings document in the tmpl:value_<i> / tmpl:2dvalue_<i>_<j> encoding
+    read by provconv.read_binding
+    '''
+    doc = prov.ProvDocument()
+    for ns in [TMPL_NS, VAR_NS, VARGEN_NS] + list(namespaces):
+        doc.add_namespace(ns)
+    for ID in sorted(bindfile_dict):
+        entry = bindfile_dict[ID]
+        attrs = []
+        for cnt1, a in enumerate(entry["value"]):
+            if entry["type"] == "attr":
+                for cnt2, b in enumerate(a if isinstance(a, list) else [a]):
+                    attrs.append((TMPL_NS["2dvalue_%d_%d" % (cnt1, cnt2)], _file_value(b)))
+            else:
+                attrs.append((TMPL_NS["value_%d" % cnt1], _file_value(a)))
+        doc.entity(ID, attrs)
+    return doc
+
+
+def _file_value(value):
+    # empty cells (None with typed_literals) are written as "", like the
+    # untyped text of an empty cell: prov drops attributes without value,
+    # which would leave a gap in the value numbering
+    return "" if value is None else value
+
+
+def _v3_value(value):
+    if value is None:
+        return {"@value": ""}
+    if isinstance(value, list):
+        return [_v3_value(v) for v in value]
+    if isinstance(value, prov.QualifiedName):
+        return {"@id": six.text_type(value)}
+    if isinstance(value, prov.Literal):
+        return {"@value": value.value, "@type": six.text_type(value.datatype)}
+    if isinstance(value, datetime.datetime):
+        return {"@value": value.isoformat(), "@type": "xsd:dateTime"}
+    if isinstance(value, (bool, float) + six.integer_types):
+        return {"@value": value}
+    return {"@value": six.text_type(value)}
+
+
+def make_binding_v3(bindfile_dict, namespaces):
+    '''
+    bindings as v3-JSON dict (context, var, vargen), see expandTemplate.py -3
+    '''
+    out = collections.OrderedDict()
+    out["context"] = collections.OrderedDict((ns.prefix, ns.uri) for ns in namespaces)
+    out["var"] = collections.OrderedDict()
+    out["vargen"] = collections.OrderedDict()
+    for ID in sorted(bindfile_dict):
+        prefix, name = ID.split(":", 1)
+        out.setdefault(prefix, collections.OrderedDict())[name] = [
+            _v3_value(v) for v in bindfile_dict[ID]["value"]]
+    return out
+
+
+def read_template(filename):
+    toks = filename.split(".")
+    frmt = toks[-1]
+    if frmt in ["ttl", "trig"]:
+        return prov.ProvDocument.deserialize(filename, format="rdf",
+                                             rdf_format={"ttl": "turtle"}.get(frmt, frmt))
+    elif frmt == "rdf":
+        return prov.ProvDocument.deserialize(filename, format="rdf", rdf_format="xml")
+    return prov.ProvDocument.deserialize(filename, format=frmt)
+
+
+def write_document(doc, filename):
+    '''
+    write a prov document, format from the file extension (as expandTemplate.py)
+    '''
+    frmt = filename.split(".")[-1]
+    if frmt == "provbin":
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "neo4j_prov"))
+        import provbin
+        provbin.write(doc, filename)
+        return
+    with open(filename, "w") as f:
+        if frmt in ["xml", "provn", "json"]:
+            f.write(doc.serialize(format=frmt))
+        else:
+            f.write(doc.serialize(format="rdf", rdf_format={"rdf": "xml", "ttl": "turtle"}.get(frmt, frmt)))
+
+
+#---------------------------------------------------------------
+# conversion
+
+_templates = {}
+
+
+def _template(filename):
+    # one parsed template per worker process
+    if filename not in _templates:
+        _templates[filename] = read_template(filename)
+    return _templates[filename]
+
+
+def _expand_job(args):
+    template, namespaces, bind_dict = args
+    if isinstance(template, six.string_types):
+        template = _template(template)
+    template = provconv.set_namespaces(namespaces, template)
+    # provconv prints while expanding
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return provconv.instantiate_template(template, bind_dict)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def _merge_records(target, source, seen):
+    for ns in source.get_registered_namespaces():
+        target.add_namespace(ns)
+    for rec in source.get_records():
+        if rec not in seen:
+            seen.add(rec)
+            target.add_record(rec)
+
+
+def merge_documents(docs):
+    '''
+    concatenate expanded fragments into one document: the document level
+    records and the records of every bundle (bundles with the same
+    identifier are merged); records contained in several fragments are
+    added once
+    '''
+    out = prov.ProvDocument()
+    seen = set()
+    bundles = collections.OrderedDict()
+    for doc in docs:
+        _merge_records(out, doc, seen)
+        for bundle in doc.bundles:
+            if bundle.identifier not in bundles:
+                bundles[bundle.identifier] = (out.bundle(bundle.identifier), set())
+            target, bundle_seen = bundles[bundle.identifier]
+            _merge_records(target, bundle, bundle_seen)
+    return out
+
+
+def expand_fragments(template, namespaces, bind_dicts, processes=None):
+    '''
+    expand the template once per bindings dict, in a process pool if
+    processes != 1, and merge the fragments (see merge_documents)
+
+    Args:
+        template: template file name (parsed once per worker) or document
+        bind_dicts: iterable of instance dicts for provconv.instantiate_template
+    Returns:
+        (merged expanded document, number of fragments)
+    '''
+    jobs = ((template, namespaces, bind_dict) for bind_dict in bind_dicts)
+    counter = collections.Counter()
+
+    def counted(docs):
+        for doc in docs:
+            counter["groups"] += 1
+            yield doc
+
+    if processes == 1:
+        return merge_documents(counted(six.moves.map(_expand_job, jobs))), counter["groups"]
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        doc = merge_documents(counted(pool.imap(_expand_job, jobs, chunksize=8)))
+    finally:
+        pool.close()
+        pool.join()
+    return doc, counter["groups"]
+
+
+def expand_split(frames, persons, mapping, split, processes=None):
+    '''
+    expand the template per row or per key group (see split_frames), in a
+    process pool if processes != 1
+
+    Returns:
+        (merged expanded document, number of groups)
+    '''
+    return expand_fragments(mapping["template"], mapping_namespaces(mapping),
+                            (make_bindings([group], persons, mapping)[0]
+                             for group in split_frames(frames, mapping, split)),
+                            processes)
+
+
+def output_names(workbook, outdir, fmt, expand_fmt=None):
+    '''
+    Returns:
+        (bindings file, expanded file or None) for a workbook
+    '''
+    base = os.path.join(outdir, os.path.splitext(os.path.basename(workbook))[0])
+    return (base + BINDING_FORMATS[fmt],
+            base + "_exp." + expand_fmt if expand_fmt else None)
+
+
+def convert_workbook(workbook, mapping, outdir, fmt="json", expand_fmt=None, split=None,
+                     processes=1):
+    '''
+    convert one workbook (or CSV/Parquet table)
+
+    Args:
+        split: None (expand the whole table at once), "row" or "key", see
+            expand_split; processes is the pool size for split expansion
+
+    Returns:
+        dict with rows, variables, output file names
+    '''
+    frames, persons = read_tables(workbook, mapping)
+    builder = new_builder(mapping)
+    for data in frames:
+        builder.add_frame(data)
+    return write_outputs(workbook, builder, persons, mapping, outdir, fmt, expand_fmt, split,
+                         processes, frames)
+
+
+def write_outputs(workbook, builder, persons, mapping, outdir, fmt="json", expand_fmt=None,
+                  split=None, processes=1, frames=None):
+    '''
+    write the bindings file of a workbook from its filled BindingsBuilder
+    and expand the template, see convert_workbook
+
+    Args:
+        frames: the table again for split expansion (a list), read anew
+            if not given
+    '''
+    bind_dict, bindfile_dict, rows = finish_bindings(builder, persons, mapping)
+    namespaces = mapping_namespaces(mapping)
+    bindfile, expfile = output_names(workbook, outdir, fmt, expand_fmt)
+
+    if fmt == "json":
+        with open(bindfile, "w") as f:
+            json.dump(make_binding_v3(bindfile_dict, namespaces), f, indent=2)
+    else:
+        bindings_doc = make_binding_doc(bindfile_dict, namespaces)
+        with open(bindfile, "w") as f:
+            f.write(bindings_doc.serialize(format="rdf", rdf_format="turtle"))
+
+    result = {"workbook": workbook, "rows": rows, "variables": len(bind_dict),
+              "bindings": bindfile}
+    if expand_fmt:
+        if not mapping.get("template"):
+            raise MappingException("expansion requested but the mapping has no template")
+        if split:
+            if not isinstance(frames, list):
+                frames, persons = read_tables(workbook, mapping)
+            exp, result["groups"] = expand_split(frames, persons, mapping, split, processes)
+        else:
+            template = provconv.set_namespaces(namespaces, _template(mapping["template"]))
+            exp = provconv.instantiate_template(template, bind_dict)
+        write_document(exp, expfile)
+        result["expanded"] = expfile
+    return result
+
+
+def _sheet_job(args):
+    workbook, sheet, mapping = args
+    t0 = time.time()
+    try:
+        if sheet is None:
+            frames, persons = iter_table_chunks(workbook, mapping), []
+        else:
+            data, persons = extract_table(workbook, mapping, sheet)
+            frames = [data]
+        builder = new_builder(mapping)
+        for data in frames:
+            builder.add_frame(data)
+        result = {"workbook": workbook, "sheet": sheet, "rows": builder.rows,
+                  "builder": builder, "persons": persons}
+    except Exception as e:
+        result = {"workbook": workbook, "sheet": sheet,
+                  "error": "%s: %s" % (e.__class__.__name__, e)}
+    result["seconds"] = time.time() - t0
+    return result
+
+
+def _merge_sheets(workbook, sheets, mapping, outdir, fmt, expand_fmt):
+    '''
+    merge the per sheet bindings of a workbook (in sheet order) and write
+    its outputs
+    '''
+    t0 = time.time()
+    failed = [r for r in sheets if "error" in r]
+    if failed:
+        return {"workbook": workbook, "seconds": 0.0,
+                "error": "sheet %s: %s" % (failed[0]["sheet"], failed[0]["error"])}
+    builder = sheets[0]["builder"]
+    persons = list(sheets[0]["persons"])
+    for res in sheets[1:]:
+        builder.update(res["builder"])
+        persons.extend(p for p in res["persons"] if p not in persons)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        result = write_outputs(workbook, builder, persons, mapping, outdir, fmt, expand_fmt)
+    except Exception as e:
+        result = {"workbook": workbook, "error": "%s: %s" % (e.__class__.__name__, e)}
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    result["sheets"] = len(sheets)
+    result["seconds"] = sum(r["seconds"] for r in sheets) + time.time() - t0
+    return result
+
+
+def convert_sheets(workbooks, mapping, outdir, fmt="json", expand_fmt=None, processes=None):
+    '''
+    convert workbooks with one pool job per sheet (see select_sheets): the
+    sheet is read and turned into bindings in the worker, the bindings of
+    the sheets of a workbook are merged with BindingsBuilder.update once all
+    of them are done and the workbook outputs are written
+
+    Returns:
+        generator of result dicts in completion order: one per sheet (with
+        "sheet", "rows", "seconds") and one per workbook as in convert
+    '''
+    order = collections.OrderedDict()
+    for w in workbooks:
+        try:
+            order[w] = [None] if is_table_file(w) else select_sheets(w, mapping)
+        except Exception as e:
+            yield {"workbook": w, "seconds": 0.0, "error": "%s: %s" % (e.__class__.__name__, e)}
+    jobs = [(w, sheet, mapping) for w, sheets in order.items() for sheet in sheets]
+    done = dict((w, {}) for w in order)
+
+    pool = None
+    if processes == 1 or len(jobs) < 2:
+        results = six.moves.map(_sheet_job, jobs)
+    else:
+        pool = multiprocessing.Pool(processes=processes)
+        results = pool.imap_unordered(_sheet_job, jobs)
+    try:
+        for res in results:
+            w = res["workbook"]
+            done[w][res["sheet"]] = res
+            yield dict((k, v) for k, v in res.items() if k not in ("builder", "persons"))
+            if len(done[w]) == len(order[w]):
+                by_sheet = done.pop(w)
+                sheets = [by_sheet[s] for s in order[w]]
+                yield _merge_sheets(w, sheets, mapping, outdir, fmt, expand_fmt)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _convert_job(args):
+    workbook, mapping, outdir, fmt, expand_fmt, split, processes = args
+    t0 = time.time()
+    # provconv prints while expanding
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        result = convert_workbook(workbook, mapping, outdir, fmt, expand_fmt, split, processes)
+    except Exception as e:
+        result = {"workbook": workbook, "error": "%s: %s" % (e.__class__.__name__, e)}
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    result["seconds"] = time.time() - t0
+    return result
+
+
+def list_workbooks(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path)
+                      if f.lower().endswith(WORKBOOK_EXTENSIONS + TABLE_EXTENSIONS)
+                      and not f.startswith("~$"))
+    return [path]
+
+
+def convert(workbooks, mapping, outdir, fmt="json", expand_fmt=None, processes=None, split=None):
+    '''
+    convert workbooks, in a process pool if processes != 1 (with split
+    expansion the workbooks are converted one by one and the pool expands
+    the row groups instead; with a layout listing "sheets" the pool reads
+    the sheets, see convert_sheets)
+
+    Returns:
+        generator of result dicts (in completion order); failed workbooks
+        have an "error" entry, per sheet results a "sheet" entry
+    '''
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    if split and expand_fmt:
+        for w in workbooks:
+            yield _convert_job((w, mapping, outdir, fmt, expand_fmt, split, processes))
+        return
+    if "sheets" in mapping["layout"]:
+        for result in convert_sheets(workbooks, mapping, outdir, fmt, expand_fmt, processes):
+            yield result
+        return
+    jobs = [(w, mapping, outdir, fmt, expand_fmt, None, 1) for w in workbooks]
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            yield _convert_job(job)
+        return
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(_convert_job, jobs):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+#---------------------------------------------------------------
+# incremental runs
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def settings_hash(mapping, fmt, expand_fmt):
+    '''
+    hash over everything besides the workbook which determines the outputs:
+    mapping, output formats and (if expanding) the template content
+    '''
+    h = hashlib.sha256()
+    h.update(json.dumps(mapping, sort_keys=True).encode("utf8"))
+    h.update(("%s %s" % (fmt, expand_fmt)).encode("utf8"))
+    if expand_fmt and mapping.get("template"):
+        h.update(file_hash(mapping["template"]).encode("utf8"))
+    return h.hexdigest()
+
+
+class Manifest(object):
+    '''
+    content hashes and outputs of the last successful conversion per workbook
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.entries = json.load(f).get("workbooks", {})
+
+    def is_current(self, workbook, digest, settings):
+        entry = self.entries.get(os.path.abspath(workbook))
+        if entry is None or entry["sha256"] != digest or entry["settings"] != settings:
+            return False
+        return all(os.path.exists(f) for f in entry["outputs"])
+
+    def record(self, workbook, digest, settings, outputs):
+        self.entries[os.path.abspath(workbook)] = {"sha256": digest, "settings": settings,
+                                                   "outputs": outputs,
+                                                   "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+    def save(self):
+        # write and rename, an interrupted run leaves the old manifest intact
+        tmp = self.filename + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"workbooks": self.entries}, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.filename)
+
+
+def usage():
+    print(__doc__)
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hm:i:o:f:e:p:s:u", ["help", "mapping=", "input=", "outdir=",
+                                                               "format=", "expand=", "processes=",
+                                                               "split=", "incremental", "manifest="])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        return 2
+
+    mapfile = None
+    inpath = None
+    outdir = "."
+    fmt = "json"
+    expand_fmt = None
+    processes = None
+    split = None
+    incremental = False
+    manifest_file = None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            return 0
+        elif o in ("-m", "--mapping"):
+            mapfile = a
+        elif o in ("-i", "--input"):
+            inpath = a
+        elif o in ("-o", "--outdir"):
+            outdir = a
+        elif o in ("-f", "--format"):
+            fmt = a
+        elif o in ("-e", "--expand"):
+            expand_fmt = a
+        elif o in ("-p", "--processes"):
+            processes = int(a)
+        elif o in ("-s", "--split"):
+            split = a
+        elif o in ("-u", "--incremental"):
+            incremental = True
+        elif o == "--manifest":
+            manifest_file = a
+            incremental = True
+
+    if not mapfile or not inpath or fmt not in BINDING_FORMATS or split not in (None,) + SPLIT_MODES:
+        usage()
+        return 2
+
+    mapping = load_mapping(mapfile)
+    workbooks = list_workbooks(inpath)
+
+    manifest = None
+    digests = {}
+    if incremental:
+        manifest = Manifest(manifest_file or os.path.join(outdir, "manifest.json"))
+        settings = settings_hash(mapping, fmt, expand_fmt)
+        todo = []
+        for w in workbooks:
+            digests[w] = file_hash(w)
+            if manifest.is_current(w, digests[w], settings):
+                print("%-40s unchanged" % w)
+            else:
+                todo.append(w)
+        workbooks = todo
+
+    failures = 0
+    for res in convert(workbooks, mapping, outdir, fmt, expand_fmt, processes, split):
+        if "sheet" in res:
+            name = "%s [%s]" % (res["workbook"], res["sheet"])
+            if "error" in res:
+                print("%-40s ERROR %s" % (name, res["error"]))
+            else:
+                print("%-40s %6d rows %14s %8.3fs" % (name, res["rows"], "", res["seconds"]))
+            continue
+        if "error" in res:
+            failures += 1
+            print("%-40s ERROR %s" % (res["workbook"], res["error"]))
+            continue
+        print("%-40s %6d rows %4d variables %8.3fs" % (res["workbook"], res["rows"],
+                                                        res["variables"], res["seconds"]))
+        if manifest is not None:
+            outputs = [res["bindings"]] + ([res["expanded"]] if "expanded" in res else [])
+            manifest.record(res["workbook"], digests[res["workbook"]], settings, outputs)
+    if manifest is not None:
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        manifest.save()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
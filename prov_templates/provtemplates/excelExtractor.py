@@ -1,4 +1,3 @@
-import openpyxl
 import sys
 import codecs
 import dateutil.parser as parser
@@ -10,65 +9,13 @@ import urllib
 sys.path.insert(0, '/home/goldfarb/envriProvenance/enes_graph_use_case/prov_templates/provtemplates')
 
 import provconv
+import workbookReader
 import prov.model as prov
 
 filename="PNP_20180321.xlsx"
 
-wb=openpyxl.load_workbook(filename)
-
-data=wb["IP2-PNP_Vorseite"]
-
-
-date=data["c6"].value
-
-counter=7
-persons=list()
-run=True
-
-while run:
-        index="c"+str(counter)
-        run=True
-        try:
-                if data[index].value!=None and data[index].value!="":
-                        persons.append(data[index].value)
-                else:
-                        run=False
-        except:
-                run=False
-                pass
-        counter+=1
-
-counter=6
-trees=dict()
-run=True
-fnames=[data["n5"].value,data["o5"].value,data["p5"].value,data["q5"].value]
-#fnames=[data["m5"].value, data["n5"].value,data["o5"].value,data["p5"].value,data["q5"].value]
-def checkNone(data):
-        if data==None:
-                return ""
-        else:
-                return str(data).strip("() ")
-
-            
-while run:
-        index="m"+str(counter)
-        run=True
-        try:
-                if data[index].value!=None and data[index].value!="":
-                        idx=checkNone(str(data[index].value))
-                        trees[idx]=dict()
-                        tree=trees[idx]
-                        tree[fnames[0]]=checkNone(data["n"+str(counter)].value)
-                        tree[fnames[1]]=checkNone(data["o"+str(counter)].value)
-                        tree[fnames[2]]=checkNone(data["p"+str(counter)].value)
-                        tree[fnames[3]]=checkNone(data["q"+str(counter)].value)
-                        trees[idx]=tree
-                else:
-                        run=False
-        except:
-                run=False
-                pass
-        counter+=1
+#streaming read-only access, see workbookReader.py
+date, persons, fnames, trees = workbookReader.read_pnp_sheet(filename)
         
    
 
@@ -1,4 +1,3 @@
-import openpyxl
 import sys
 import codecs
 import dateutil.parser as parser
@@ -13,66 +12,15 @@ import collections
 sys.path.insert(0, '/home/goldfarb/envriProvenance/enes_graph_use_case/prov_templates/provtemplates')
 
 import provconv
+import workbookReader
+import bindingsBuilder
 import prov.model as prov
 import prov as provbase
 
 filename="PNP_20180321.xlsx"
 
-wb=openpyxl.load_workbook(filename)
-
-data=wb["IP2-PNP_Vorseite"]
-
-
-date=data["c6"].value
-
-counter=7
-persons=list()
-run=True
-
-while run:
-        index="c"+str(counter)
-        run=True
-        try:
-                if data[index].value!=None and data[index].value!="":
-                        persons.append(data[index].value)
-                else:
-                        run=False
-        except:
-                run=False
-                pass
-        counter+=1
-
-counter=6
-trees=dict()
-run=True
-fnames=[data["n5"].value,data["o5"].value,data["p5"].value,data["q5"].value]
-#fnames=[data["m5"].value, data["n5"].value,data["o5"].value,data["p5"].value,data["q5"].value]
-def checkNone(data):
-        if data==None:
-                return ""
-        else:
-                return str(data).strip("() ")
-
-            
-while run:
-        index="m"+str(counter)
-        run=True
-        try:
-                if data[index].value!=None and data[index].value!="":
-                        idx=checkNone(str(data[index].value))
-                        trees[idx]=dict()
-                        tree=trees[idx]
-                        tree[fnames[0]]=checkNone(data["n"+str(counter)].value)
-                        tree[fnames[1]]=checkNone(data["o"+str(counter)].value)
-                        tree[fnames[2]]=checkNone(data["p"+str(counter)].value)
-                        tree[fnames[3]]=checkNone(data["q"+str(counter)].value)
-                        trees[idx]=tree
-                else:
-                        run=False
-        except:
-                run=False
-                pass
-        counter+=1
+#streaming read-only access, see workbookReader.py
+date, persons, fnames, trees = workbookReader.read_pnp_sheet(filename)
         
    
 
@@ -130,55 +78,11 @@ template="""
 outNSpref="ex"
 outNS="http://example.com#"
 
-#bind_dicts=[]
-bind_dict=dict()
-bindfile_dict=dict()
-
-for index, row in data.iterrows():
-    rtemplate=template
-    for col in data.columns.values:
-        if col in bindmap:
-
-            outval=row[col]
-
-            if bindmap[col]["val"]=="iri":
-                outval=prov.QualifiedName(prov.Namespace(outNSpref,outNS), urllib.quote(str(outval.encode('utf8', 'replace'))))
-
-	    #print col + " " + bindmap[col]["varname"] + " " + outval
-	    ID = "var:"+bindmap[col]["varname"]
-	    #ID = prov.QualifiedName(prov.Namespace("var", "http://openprovenance.org/var#"), urllib.quote(bindmap[col]["varname"]))
-
-	    #prepare data for bindings dict
-	
-	    if ID not in bind_dict:
-            	bind_dict[ID]=outval
-	    else:
-		if not isinstance(bind_dict[ID], list):
-			tmp=list()
-			tmp.append(bind_dict[ID])
-			bind_dict[ID]=tmp
-		if not bindmap[col]["uniqueOnly"] or  outval not in bind_dict[ID]:
-			bind_dict[ID].append(outval)
-            #outval=row[col]
-
-           # if bindmap[col]["val"]=="literal":
-           #     outval='"'+outval+'"'
-                #outval='"'+outval+'"^^xsd:string'
-   #         if bindmap[col]["val"]=="int":
-    #            outval=''+outval+'^^xsd:int'
-           # if bindmap[col]["val"]=="datetime":
-           #     outval='"'+outval+'"'
-                #outval='"'+outval+'"^^xsd:datetime'
-
-	    #prepare data for bindings file 
-
-	    if ID not in bindfile_dict:
-		bindfile_dict[ID]=dict()
-		bindfile_dict[ID]["value"]=list()
-		bindfile_dict[ID]["type"]=bindmap[col]["type"]
-	    
-	    if not bindmap[col]["uniqueOnly"] or outval not in bindfile_dict[ID]["value"]:
-		bindfile_dict[ID]["value"].append(outval)
+#column-wise conversion and dedupe, see bindingsBuilder.py
+builder=bindingsBuilder.BindingsBuilder(bindmap, outNSpref, outNS)
+builder.add_frame(data)
+bind_dict=builder.bind_dict()
+bindfile_dict=builder.bindfile_dict()
 
 
 tmpl_NS=prov.Namespace("tmpl", "http://openprovenance.org/tmpl#")
@@ -1,4 +1,5 @@
 import sys
+import os
 import provconv
 import prov
 import getopt
@@ -32,7 +33,7 @@ def setEntry(rec, regNS):
 #make more formats available
 #template=prov.model.ProvDocument.deserialize(sys.argv[1], format="rdf", rdf_format="xml")
 try:
-	opts, args = getopt.getopt(sys.argv[1:], "hi:o:b:v3", ["help", "infile=", "outfile=", "bindings=", "verbose", "bindver3"])
+	opts, args = getopt.getopt(sys.argv[1:], "hi:o:b:c:v3", ["help", "infile=", "outfile=", "bindings=", "csvdir=", "verbose", "bindver3"])
 except getopt.GetoptError as err:
 	print str(err)  # will print something like "option -a not recognized"
 	usage()
@@ -41,6 +42,7 @@ except getopt.GetoptError as err:
 infile=None
 outfile=None
 bindings=None
+csvdir=None
 verbose=False
 v3=False
 
@@ -56,6 +58,8 @@ for o, a in opts:
 		infile = a
 	elif o in ("-b", "--bindings"):
 		bindings = a
+	elif o in ("-c", "--csvdir"):
+		csvdir = a
 	elif o in ("-3", "--bindver3"):
 		v3=True
 	else:
@@ -105,12 +109,29 @@ print bindings_dict
 #print bindings_dict
 
 
+if csvdir:
+	#stream the expansion into neo4j-admin import CSV files (neo4j_prov/neo4jcsv.py),
+	#no output document is built unless an outfile is given as well
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "neo4j_prov"))
+	import neo4jcsv
+	writer=neo4jcsv.Neo4jCSVWriter(csvdir)
+	provconv.instantiate_template(template, bindings_dict, sink=writer)
+	writer.close()
+	print "neo4j-admin import " + " ".join(writer.import_args())
+	if not outfile:
+		sys.exit()
+
 exp=provconv.instantiate_template(template, bindings_dict)
 
 outfilename=outfile
 toks=outfilename.split(".")
 frmt=toks[len(toks)-1]
-if frmt in ["rdf", "xml", "json", "ttl", "trig", "provn"]:
+if frmt == "provbin":
+	#compact binary format for the following pipeline stages (neo4j_prov/provbin.py)
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "neo4j_prov"))
+	import provbin
+	provbin.write(exp, outfilename)
+elif frmt in ["rdf", "xml", "json", "ttl", "trig", "provn"]:
 	outfile=open(outfilename, "w")
 	if frmt in ["xml", "provn", "json"]:
 		outfile.write(exp.serialize(format=frmt))
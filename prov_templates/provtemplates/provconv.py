@@ -49,10 +49,18 @@ Package provides:
 - instantiate_template(input_template,variable_dictionary) 
   result: instantiated template
 
+- instantiate_template(input_template,variable_dictionary,sink=handler)
+  result: expanded records are streamed to handler.add_record(record, bundle_id)
+     (RecordSink), e.g. neo4j_prov/neo4jcsv.py writing neo4j-admin import CSV
+
 - make_binding(prov_doc,entity_dict, attr_dict):
   result: generate a PROV binding document based on an empty input document
      (with namespaces assigned) as well as variable settings for entities and
      attributes (python dictionaries) 
+
+- analyze_template(prov_doc):
+  result: static analysis of a template (variables, tmpl:linked forest,
+     warnings for cartesian expansions and tmpl:linked cycles)
      
 '''                        
 
@@ -187,13 +195,13 @@ def read_binding(bindings_doc):
 						binding_dict[key][int(toks[1])]=a[1]
 					else:
 						raise BindingFileException("Encountered unknown property " + str(a) + \
-										" in bindings file " + binding_file) 
+										" in bindings document") 
 				else:
 					raise BindingFileException("Encountered unknown property " + str(a) + \
-										" in bindings file " + binding_file) 
+										" in bindings document") 
 		else:
 			raise BindingFileException("Encountered unknown entity ID " + str(r) + \
-							" in bindings file " + binding_file + ". Only var: or vargen: allowed as namespace.") 
+							" in bindings document. Only var: or vargen: allowed as namespace.") 
 
 	#sanity checks: consistent numbering for attrs
 	binding_dict_out=dict()
@@ -204,7 +212,7 @@ def read_binding(bindings_doc):
 		#print idx
 		idx.sort()
 		if min(idx) != 0 or idx != range(min(idx), max(idx) + 1):
-			raise BindingFileException("Invalid value sequence " + repr(d)  + " encountered in bindings file " + binding_file) 
+			raise BindingFileException("Invalid value sequence " + repr(d)  + " encountered in bindings document") 
 		return idx
 
 
@@ -916,8 +924,53 @@ def attr_match(attr_list,mdict):
         #print("Attr dict:",p_dict)
     return p_dict 
 #---------------------------------------------------------------
+# record sinks: expansion without building the output document
+
+class _SinkBundle(prov.ProvBundle):
+    '''
+    bundle handing every new record to the sink handler instead of keeping it
+    '''
+    def __init__(self, handler, identifier=None, document=None):
+        prov.ProvBundle.__init__(self, identifier=identifier, document=document)
+        self._handler = handler
+
+    def _add_record(self, record):
+        self._handler.add_record(record, self._identifier)
+
+
+class RecordSink(prov.ProvDocument):
+    '''
+    stand-in for the output document of instantiate_template
+
+    Records are created and validated by the prov package exactly as for a
+    ProvDocument, then passed to handler.add_record(record, bundle_id) and
+    dropped, so memory does not grow with the size of the expansion.
+
+    Args:
+        handler: object with add_record(record, bundle_id), bundle_id is
+                 None for document level records
+    '''
+    def __init__(self, handler):
+        prov.ProvDocument.__init__(self)
+        self._handler = handler
+
+    def _add_record(self, record):
+        self._handler.add_record(record, None)
+
+    def bundle(self, identifier):
+        valid_id = self.valid_qualified_name(identifier)
+        if valid_id is None:
+            raise prov.ProvException('The provided identifier "%s" is not valid' % identifier)
+        if valid_id in self._bundles:
+            raise prov.ProvException('A bundle with that identifier already exists')
+        b = _SinkBundle(self._handler, identifier=valid_id, document=self)
+        # the (empty) bundle is kept to detect duplicate bundle ids
+        self._bundles[valid_id] = b
+        return b
+
+#---------------------------------------------------------------
 
-def instantiate_template(prov_doc,instance_dict):
+def instantiate_template(prov_doc,instance_dict,sink=None):
     '''
     Instantiate a prov template based on a dictionary setting for
     the prov template variables
@@ -938,11 +991,20 @@ def instantiate_template(prov_doc,instance_dict):
     Args: 
         prov_doc (ProvDocument): input prov document template
         instance_dict (dict): match dictionary
+        sink (optional): record handler, see RecordSink; expanded records
+            are passed to sink.add_record(record, bundle_id) instead of
+            being collected in the returned document
+    Returns:
+        expanded ProvDocument (an empty RecordSink if sink is given)
     ''' 
     
     #print("here inst templ")
 
-    new_doc = set_namespaces(prov_doc.namespaces,prov.ProvDocument()) 
+    if sink is None:
+        new_doc = prov.ProvDocument()
+    else:
+        new_doc = RecordSink(sink)
+    new_doc = set_namespaces(prov_doc.namespaces,new_doc) 
     
     new_doc = add_records(prov_doc,new_doc,instance_dict)
     
@@ -959,3 +1021,171 @@ def instantiate_template(prov_doc,instance_dict):
         new_bundle = add_records(bundle, new_bundle,instance_dict)      
            
     return new_doc
+
+#---------------------------------------------------------------
+# static template analysis (no bindings needed)
+
+TMPL_LINKED = prov.QualifiedName(prov.Namespace("tmpl", "http://openprovenance.org/tmpl#"), "linked")
+
+def is_variable(value):
+    '''
+    True for var: and vargen: qualified names
+    '''
+    return isinstance(value, prov.QualifiedName) and value.namespace.prefix in ["var", "vargen"]
+
+def template_variables(records):
+    '''
+    collect the template variables and the statements they feed
+
+    Args:
+        records (list): template records (of one document or bundle)
+    Returns:
+        OrderedDict: variable (QualifiedName) -> list of PROV-N statements
+    '''
+    variables = collections.OrderedDict()
+    for rec in records:
+        found = []
+        if is_variable(rec.identifier):
+            found.append(rec.identifier)
+        for (name, value) in rec.attributes:
+            for v in (name, value):
+                if is_variable(v) and v not in found:
+                    found.append(v)
+        for v in found:
+            variables.setdefault(v, []).append(rec.get_provn())
+    return variables
+
+def linked_forest(nodes):
+    '''
+    compute the tmpl:linked structure the way checkLinked() sees it,
+    but without bindings
+
+    Args:
+        nodes (list): template element records
+    Returns:
+        dict with
+          "links": entity -> linked entity (one per entity, as in checkLinked)
+          "groups": list of {entity: level} dicts (one per linked tree,
+                    followed by single entity groups for unlinked entities)
+          "cycles": list of entity lists forming a tmpl:linked cycle
+          "multi": entities with more than one tmpl:linked attribute
+    '''
+    links = collections.OrderedDict()
+    multi = []
+    for rec in nodes:
+        targets = [v for (a, v) in rec.attributes if a == TMPL_LINKED]
+        if len(targets) > 1:
+            multi.append(rec.identifier)
+        if targets:
+            # checkLinked keeps the last one it sees
+            links[rec.identifier] = targets[-1]
+
+    # every entity has at most one link, so each connected part is either
+    # a tree ending in a root or contains exactly one cycle
+    cycles = []
+    state = dict()
+    for start in links:
+        path = []
+        node = start
+        while node in links and node not in state:
+            state[node] = start
+            path.append(node)
+            node = links[node]
+        if node in state and state[node] == start:
+            cycles.append(path[path.index(node):])
+
+    children = collections.defaultdict(list)
+    for (k, v) in links.items():
+        children[v].append(k)
+
+    roots = []
+    for v in links.values():
+        if v not in links and v not in roots:
+            roots.append(v)
+
+    groups = []
+    grouped = set()
+    offset = 0
+    for r in roots:
+        group = collections.OrderedDict()
+        todo = [(r, offset)]
+        while todo:
+            (node, level) = todo.pop(0)
+            group[node] = level
+            todo.extend((c, level + 1) for c in children[node])
+        groups.append(group)
+        grouped.update(group)
+        offset = max(group.values()) + 1
+
+    for rec in nodes:
+        if rec.identifier not in grouped:
+            groups.append({rec.identifier: offset})
+            grouped.add(rec.identifier)
+
+    return {"links": links, "groups": groups, "cycles": cycles, "multi": multi}
+
+def _analyze_records(records):
+    nodes = [rec for rec in records if rec.is_element()]
+    relations = [rec for rec in records if rec.is_relation()]
+
+    forest = linked_forest(nodes)
+    groups = forest["groups"]
+    warnings = []
+
+    for cycle in forest["cycles"]:
+        warnings.append("tmpl:linked cycle " + " -> ".join(str(c) for c in cycle + cycle[:1]) +
+                        ": the cycle has no root, so checkLinked never walks it and expands" +
+                        " these entities as unlinked")
+    for eid in forest["multi"]:
+        warnings.append(str(eid) + " has several tmpl:linked attributes, checkLinked keeps only one")
+
+    def group_of(value):
+        for (i, group) in enumerate(groups):
+            if value in group:
+                return i
+        return None
+
+    for rel in relations:
+        rel_groups = []
+        for (name, value) in rel.formal_attributes:
+            if value is None:
+                continue
+            g = group_of(value)
+            if g is None:
+                if is_variable(value):
+                    warnings.append(rel.get_provn() + ": argument " + str(value) +
+                                    " is not declared as an element, set_rel drops it")
+                continue
+            if g not in rel_groups:
+                rel_groups.append(g)
+        if len(rel_groups) > 1:
+            desc = ", ".join("[" + " ".join(str(n) for n in groups[g]) + "]" for g in rel_groups)
+            warnings.append(rel.get_provn() + ": arguments come from " + str(len(rel_groups)) +
+                            " unlinked groups " + desc + ", set_rel expands the cartesian product" +
+                            " of their bindings")
+
+    return collections.OrderedDict([
+        ("variables", template_variables(records)),
+        ("linked", forest),
+        ("warnings", warnings)])
+
+def analyze_template(prov_doc):
+    '''
+    static analysis of a PROV template before any bindings exist
+
+    reports per document/bundle the template variables and the statements
+    they feed, the tmpl:linked forest checkLinked() would compute and
+    warnings for expansion blow-ups (relations combining unlinked groups,
+    which set_rel expands as cartesian product) and tmpl:linked cycles
+
+    Args:
+        prov_doc (ProvDocument): input prov document template
+    Returns:
+        OrderedDict: scope ("document" or bundle identifier) -> analysis dict
+          with keys "variables", "linked" (see linked_forest) and "warnings"
+    '''
+    result = collections.OrderedDict()
+    result["document"] = _analyze_records(prov_doc.records)
+    for bundle in prov_doc.bundles:
+        result[str(bundle.identifier)] = _analyze_records(bundle.records)
+    return result
@@ -0,0 +1,159 @@
+'''
+typed PROV literals for binding values, converted a whole column at a time
+
+Every distinct cell value (and type) of a column is converted once and cached, so
+repeated values (dates, enumerations like "ja"/"nein", identifiers) share
+one Literal / QualifiedName object instead of being parsed and built per
+cell.
+
+Value types (bindmap "val"):
+
+- "int"       Literal xsd:int
+- "float"     Literal xsd:float
+- "datetime"  Literal xsd:dateTime; datetime cells or strings parsed with
+              dateutil, naive values get the converter's timezone
+              (dateutil.tz, default UTC)
+- "literal"   Literal xsd:string
+- "iri"       QualifiedName in the converter's namespace (percent quoted)
+
+Empty cells (None, "", NaN) convert to None (prov skips attributes
+without value).
+
+Provides:
+
+- LiteralConverter(timezone, namespace).convert(val_type, column)
+- cached_map(fnc, values)
+- quote_iri(value)
+
+'''
+
+import datetime
+
+import dateutil.parser
+import dateutil.tz
+import six
+import prov.model as prov
+from prov.constants import XSD_INT, XSD_FLOAT, XSD_DATETIME, XSD_STRING
+
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+
+LITERAL_TYPES = ("int", "float", "datetime", "literal")
+
+
+def quote_iri(value):
+    '''
+    local part for a cell value (utf8, percent quoted; byte strings are
+    taken as utf8 already)
+    '''
+    if not isinstance(value, six.binary_type):
+        value = six.text_type(value).encode("utf8", "replace")
+    return quote(value)
+
+
+def is_empty(value):
+    return value is None or value == "" or (isinstance(value, float) and value != value)
+
+
+def cached_map(fnc, values, cache=None):
+    '''
+    [fnc(v) for v in values], calling fnc once per distinct value; values
+    are told apart by type as well (True, 1 and 1.0 are equal dict keys
+    but convert to different literals)
+
+    Args:
+        cache (dict): optional cache shared between calls
+    '''
+    if cache is None:
+        cache = {}
+    out = []
+    append = out.append
+    for v in values:
+        key = (v.__class__, v)
+        try:
+            res = cache[key]
+        except KeyError:
+            res = cache[key] = fnc(v)
+        except TypeError:
+            # unhashable cell value
+            res = fnc(v)
+        append(res)
+    return out
+
+
+class LiteralConverter(object):
+    '''
+    Args:
+        timezone (str): tz name for naive datetimes (e.g. "Europe/Vienna"),
+            default UTC
+        namespace (prov.Namespace): namespace for "iri" values
+    '''
+
+    def __init__(self, timezone=None, namespace=None):
+        self.tzinfo = dateutil.tz.gettz(timezone) if timezone else dateutil.tz.tzutc()
+        if self.tzinfo is None:
+            raise ValueError("unknown timezone " + timezone)
+        self.namespace = namespace
+        self._caches = dict((t, {}) for t in LITERAL_TYPES + ("iri",))
+        self._literals = {}
+
+    def literal(self, text, datatype):
+        '''
+        shared Literal object for (text, datatype)
+        '''
+        key = (text, datatype)
+        lit = self._literals.get(key)
+        if lit is None:
+            lit = self._literals[key] = prov.Literal(text, datatype)
+        return lit
+
+    def to_int(self, value):
+        if isinstance(value, six.string_types):
+            number = int(value.strip())
+        else:
+            number = int(value)
+            if number != value:
+                raise ValueError("not an integer: %r" % value)
+        return self.literal(six.text_type(number), XSD_INT)
+
+    def to_float(self, value):
+        return self.literal(repr(float(value)), XSD_FLOAT)
+
+    def to_datetime(self, value):
+        if isinstance(value, datetime.datetime):
+            dt = value
+        elif isinstance(value, datetime.date):
+            dt = datetime.datetime(value.year, value.month, value.day)
+        else:
+            dt = dateutil.parser.parse(six.text_type(value))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=self.tzinfo)
+        return self.literal(dt.isoformat(), XSD_DATETIME)
+
+    def to_string(self, value):
+        return self.literal(six.text_type(value), XSD_STRING)
+
+    def to_iri(self, value):
+        if self.namespace is None:
+            raise ValueError("no namespace for iri values")
+        return self.namespace[quote_iri(value)]
+
+    def convert_value(self, val_type, value):
+        if is_empty(value):
+            return None
+        return {"int": self.to_int, "float": self.to_float, "datetime": self.to_datetime,
+                "literal": self.to_string, "iri": self.to_iri}[val_type](value)
+
+    def convert(self, val_type, column):
+        '''
+        convert a column (pandas Series or sequence) of cell values
+
+        Returns:
+            list of Literals / QualifiedNames (None for empty cells)
+        '''
+        values = column.tolist() if hasattr(column, "tolist") else list(column)
+        return cached_map(lambda v: self.convert_value(val_type, v), values,
+                          self._caches[val_type])
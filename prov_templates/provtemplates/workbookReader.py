@@ -0,0 +1,155 @@
+'''
+streaming access to the field campaign workbooks read by the excelExtractor
+scripts
+
+Workbooks are opened in openpyxl read-only mode (cells are parsed while
+iterating instead of loading the whole workbook into memory) and ranges are
+walked with iter_rows. A block of rows ends at the first row whose key cell
+is empty (None or ""), or at the end of the sheet.
+
+Provides:
+
+- open_workbook(filename)
+- sheet_names(filename)
+- iter_keyed_rows(sheet, key_col, first_row, last_col)
+- read_column(sheet, col, first_row)
+- read_sheet(filename, layout)
+  result: date, persons, field names and keyed readings of a sheet
+- read_pnp_sheet(filename, sheetname)
+  result: read_sheet with the PNP field campaign layout (PNP_LAYOUT)
+
+'''
+
+import collections
+
+import openpyxl
+import six
+from openpyxl.utils import column_index_from_string
+
+
+PNP_SHEET = "IP2-PNP_Vorseite"
+
+
+def open_workbook(filename, data_only=False):
+    '''
+    open a workbook in read-only (streaming) mode
+    '''
+    return openpyxl.load_workbook(filename, read_only=True, data_only=data_only)
+
+
+def sheet_names(filename):
+    '''
+    names of the worksheets of a workbook, in workbook order
+    '''
+    wb = open_workbook(filename)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def is_empty(value):
+    return value is None or value == ""
+
+
+def check_none(value):
+    '''
+    cell value as text, "" for empty cells, surrounding "()" and blanks removed
+    '''
+    if value is None:
+        return ""
+    if not isinstance(value, six.string_types):
+        value = str(value)
+    return value.strip("() ")
+
+
+def iter_keyed_rows(sheet, key_col, first_row, last_col=None):
+    '''
+    iterate over the rows of a block starting at first_row
+
+    Args:
+        sheet: worksheet (read-only or normal)
+        key_col (str): column letter of the key cell, e.g. "m"
+        first_row (int): first row of the block (1 based)
+        last_col (str): last column letter to return (default: key_col)
+    Returns:
+        generator of tuples of cell values (key_col .. last_col); stops
+        before the first row with an empty key cell
+    '''
+    min_col = column_index_from_string(key_col.upper())
+    max_col = column_index_from_string((last_col or key_col).upper())
+    for row in sheet.iter_rows(min_row=first_row, min_col=min_col, max_col=max_col,
+                               values_only=True):
+        if not row or is_empty(row[0]):
+            return
+        yield row
+
+
+def read_column(sheet, col, first_row):
+    '''
+    values of column col from first_row up to the first empty cell
+    '''
+    return [row[0] for row in iter_keyed_rows(sheet, col, first_row)]
+
+
+# cell anchors of the PNP field campaign sheets
+PNP_LAYOUT = {
+    "sheet": PNP_SHEET,
+    "date_cell": "c6",
+    "persons": {"column": "c", "first_row": 7},
+    "table": {"key_column": "m", "header_row": 5, "first_row": 6, "last_column": "q"},
+}
+
+
+def read_sheet(filename, layout):
+    '''
+    read a sheet with a PNP like layout
+
+    Args:
+        filename (str): workbook
+        layout (dict): cell anchors, see PNP_LAYOUT:
+            sheet, date_cell, persons {column, first_row} and
+            table {key_column, header_row, first_row, last_column}
+            (field names are read from header_row, right of the key column)
+    Returns:
+        tuple (date, persons, fnames, trees) with trees an OrderedDict
+        key -> {field name: reading text} in sheet order
+    '''
+    table = layout["table"]
+    wb = open_workbook(filename)
+    try:
+        sheet = wb[layout["sheet"]]
+        # the dimension stored in the file may be stale: read up to the last row
+        sheet.reset_dimensions()
+
+        date = sheet[layout["date_cell"]].value if layout.get("date_cell") else None
+        persons = []
+        if layout.get("persons"):
+            persons = read_column(sheet, layout["persons"]["column"], layout["persons"]["first_row"])
+
+        min_col = column_index_from_string(table["key_column"].upper()) + 1
+        max_col = column_index_from_string(table["last_column"].upper())
+        fnames = list(next(sheet.iter_rows(min_row=table["header_row"], max_row=table["header_row"],
+                                           min_col=min_col, max_col=max_col, values_only=True)))
+
+        trees = collections.OrderedDict()
+        for row in iter_keyed_rows(sheet, table["key_column"], table["first_row"], table["last_column"]):
+            trees[check_none(row[0])] = dict(zip(fnames, [check_none(v) for v in row[1:]]))
+    finally:
+        wb.close()
+    return date, persons, fnames, trees
+
+
+def read_pnp_sheet(filename, sheetname=PNP_SHEET):
+    '''
+    read a PNP field campaign sheet
+
+    Layout: c6 date, c7.. reading persons, n5..q5 field names,
+            m6.. tree ids with the readings in n..q
+
+    Returns:
+        tuple (date, persons, fnames, trees), see read_sheet
+    '''
+    layout = dict(PNP_LAYOUT)
+    layout["sheet"] = sheetname
+    return read_sheet(filename, layout)